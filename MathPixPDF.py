@@ -8,10 +8,10 @@ MathPix PDF 内容提取测试代码
 import json
 import os
 import base64
+import io
 import time
 import requests
 from typing import Optional
-from PIL import Image
 
 
 class MathPixPDFExtractor:
@@ -30,19 +30,18 @@ class MathPixPDFExtractor:
         self.api_url = "https://api.mathpix.com/v3/text"
         print("✅ MathPix 客户端初始化成功")
     
-    def _call_api(self, image_path: str) -> dict:
+    def _call_api(self, image_png: bytes) -> dict:
         """
         调用 MathPix API 处理图像
         
         Args:
-            image_path: 图像文件路径
+            image_png: PNG 图像字节
         
         Returns:
             API 返回的 JSON 数据
         """
-        # 读取并编码图像
-        with open(image_path, "rb") as img_file:
-            encoded_image = base64.b64encode(img_file.read()).decode("utf-8")
+        # 编码图像 (PNG 只在这里作为请求体使用)
+        encoded_image = base64.b64encode(image_png).decode("utf-8")
         
         # 构建请求头
         headers = {
@@ -65,7 +64,7 @@ class MathPixPDFExtractor:
         else:
             raise Exception(f"API 错误: {response.status_code} - {response.text}")
     
-    def _pdf_page_to_image(self, pdf_path: str, page_num: int, dpi: int = 200) -> str:
+    def _pdf_page_to_image(self, pdf_path: str, page_num: int, dpi: int = 200) -> bytes:
         """
         将 PDF 页面转换为图像
         
@@ -75,22 +74,17 @@ class MathPixPDFExtractor:
             dpi: 图像分辨率
         
         Returns:
-            临时图像文件路径
+            PNG 图像字节 (在内存中编码，不写临时文件)
         """
         try:
             import fitz  # PyMuPDF
             doc = fitz.open(pdf_path)
-            page = doc.load_page(page_num)
-            
-            # 将页面渲染为图像
-            pix = page.get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72))
-            
-            # 保存临时图像
-            temp_image_path = f"/tmp/pdf_page_{page_num}_{os.getpid()}.png"
-            pix.save(temp_image_path)
-            
-            doc.close()
-            return temp_image_path
+            try:
+                # 将页面渲染为图像
+                pix = doc.load_page(page_num).get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72))
+                return pix.tobytes("png")
+            finally:
+                doc.close()
             
         except ImportError:
             # 如果没有 PyMuPDF，使用 pdf2image
@@ -98,9 +92,9 @@ class MathPixPDFExtractor:
             
             images = convert_from_path(pdf_path, dpi=dpi, first_page=page_num+1, last_page=page_num+1)
             if images:
-                temp_image_path = f"/tmp/pdf_page_{page_num}_{os.getpid()}.png"
-                images[0].save(temp_image_path)
-                return temp_image_path
+                buffer = io.BytesIO()
+                images[0].save(buffer, format="PNG")
+                return buffer.getvalue()
             raise
     
     def extract_from_file(self, pdf_path: str, output_dir: str = "output") -> dict:
@@ -160,26 +154,20 @@ class MathPixPDFExtractor:
                 print(f"⏳ 处理第 {page_num + 1}/{total_pages} 页...")
                 
                 # 将 PDF 页面转换为图像
-                temp_image_path = self._pdf_page_to_image(pdf_path, page_num, dpi=150)
+                image_png = self._pdf_page_to_image(pdf_path, page_num, dpi=150)
                 
-                try:
-                    # 调用 MathPix API
-                    result = self._call_api(temp_image_path)
-                    
-                    # 解析结果
-                    page_data = {
-                        "page_number": page_num + 1,
-                        "text": result.get("text", ""),
-                        "confidence": result.get("confidence", 1.0),
-                        "latex": result.get("latex", []),
-                    }
-                    
-                    result_data["pages"].append(page_data)
-                    
-                finally:
-                    # 删除临时图像
-                    if os.path.exists(temp_image_path):
-                        os.remove(temp_image_path)
+                # 调用 MathPix API
+                result = self._call_api(image_png)
+                
+                # 解析结果
+                page_data = {
+                    "page_number": page_num + 1,
+                    "text": result.get("text", ""),
+                    "confidence": result.get("confidence", 1.0),
+                    "latex": result.get("latex", []),
+                }
+                
+                result_data["pages"].append(page_data)
                 
                 # 避免请求过于频繁
                 time.sleep(0.5)
@@ -264,32 +252,26 @@ class MathPixPDFExtractor:
                 print(f"⏳ 处理第 {page_num + 1}/{total_pages} 页...")
                 
                 # 将 PDF 页面转换为图像
-                temp_image_path = self._pdf_page_to_image(pdf_path, page_num, dpi=200)
+                image_png = self._pdf_page_to_image(pdf_path, page_num, dpi=200)
+                
+                # 调用 MathPix API
+                result = self._call_api(image_png)
                 
-                try:
-                    # 调用 MathPix API
-                    result = self._call_api(temp_image_path)
-                    
-                    # 解析结果，构建类似 PyMuPDF 的结构
-                    page_data = {
-                        "page_number": page_num + 1,
-                        "elements": []
+                # 解析结果，构建类似 PyMuPDF 的结构
+                page_data = {
+                    "page_number": page_num + 1,
+                    "elements": []
+                }
+                
+                # 添加文本内容
+                if "text" in result:
+                    text_elem = {
+                        "type": "text",
+                        "content": result["text"],
                     }
-                    
-                    # 添加文本内容
-                    if "text" in result:
-                        text_elem = {
-                            "type": "text",
-                            "content": result["text"],
-                        }
-                        page_data["elements"].append(text_elem)
-                    
-                    result_data["pages"].append(page_data)
-                    
-                finally:
-                    # 删除临时图像
-                    if os.path.exists(temp_image_path):
-                        os.remove(temp_image_path)
+                    page_data["elements"].append(text_elem)
+                
+                result_data["pages"].append(page_data)
                 
                 # 避免请求过于频繁
                 time.sleep(0.5)
@@ -1,4 +1,5 @@
 import os
+import sys
 import glob
 import re
 import fitz  # PyMuPDF
@@ -8,6 +9,10 @@ import pandas as pd
 import numpy as np
 from collections import defaultdict
 
+# Camelot 的逐页 flavor 分类复用后端引擎里的实现
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdf-parser-demo", "backend"))
+from engines.camelot import plan_pages, read_page_tables
+
 # --- 配置 ---
 TEST_DIR = "data/test"
 REPORT_FILE = "benchmark_report.csv"
@@ -172,17 +177,14 @@ def analyze_camelot(pdf_path):
     
     try:
         # Camelot 只负责表格，不提取文本/公式/图片
-        # 尝试 Stream 模式 (适合论文/无框线表)
-        tables = camelot.read_pdf(pdf_path, pages='all', flavor='stream', suppress_stdout=True)
-        
-        for table in tables:
-            extracted_dfs.append(table.df)
-            
-        # 如果 Stream 没结果，尝试 Lattice
-        if len(extracted_dfs) == 0:
-            tables = camelot.read_pdf(pdf_path, pages='all', flavor='lattice', suppress_stdout=True)
+        # 逐页选择 flavor：有网格线 -> Lattice，只有横线 (三线表) -> Stream，每页只跑一次
+        flavors = defaultdict(int)
+        for page, plan in plan_pages(pdf_path).items():
+            tables = read_page_tables(pdf_path, str(page), suppress_stdout=True, **plan)
             for table in tables:
                 extracted_dfs.append(table.df)
+                flavors[plan['flavor']] += 1
+        stats['camelot_flavors'] = dict(flavors)
 
         stats['text_score'] = 0.0 # 不支持
         stats['formula_score'] = 0.0 # 不支持
@@ -1,7 +1,11 @@
+import gc
 import os
+import json
+import time
 import uuid
-from flask import Flask, request, send_from_directory, jsonify
+from flask import Flask, Response, request, send_from_directory, jsonify
 from flask_cors import CORS
+from werkzeug.utils import safe_join
 from engines import (
     PyMuPDFEngine, 
     PdfPlumberEngine, 
@@ -12,6 +16,9 @@ from engines import (
     OpenDataLoaderEngine,
     DoclingEngine
 )
+from engines.fitz_utils import render_image
+from engines.geometry import get_geometry, summary as geometry_summary
+from engines.memory import process_memory_mb
 
 app = Flask(__name__)
 CORS(app, resources={r"/upload": {"origins": "*"}})
@@ -31,6 +38,54 @@ ENGINES = {
     'SimpleFormulaDetector': SimpleFormulaDetector()
 }
 
+# 启动时预热的引擎 (逗号分隔，空串表示不预热)
+WARMUP_ENGINES = [
+    name.strip() for name in os.environ.get('PDF_PARSER_WARMUP', 'LaTeXOCR,docling').split(',') if name.strip()
+]
+# 预热结果：在哪个进程做的、各引擎耗时 (秒) 或失败原因
+WARMUP = {"pid": None, "engines": {}}
+
+def warm_up(names=None, infer=True):
+    """
+    加载模型并做一次推理，第一个请求不再等待模型加载。
+    gunicorn --preload 时在 master 进程 fork worker 之前以 infer=False 调用 (见 gunicorn.conf.py)：
+    权重只加载一次，worker 通过写时复制共享；master 不做前向推理，否则 torch 的 OpenMP / MKL
+    线程池在 fork 出来的 worker 里可能死锁，推理预热由每个 worker 调用 warm_up_worker 完成。
+    最后 gc.freeze()，避免 worker 里的垃圾回收扫描这些对象时改写对象头，把共享页面复制一份。
+    """
+    WARMUP["pid"] = os.getpid()
+    for name in WARMUP_ENGINES if names is None else names:
+        engine = ENGINES.get(name)
+        if engine is None or not hasattr(engine, 'warm'):
+            print(f"Warm-up skipped: {name} has no warm-up")
+            continue
+        start = time.perf_counter()
+        try:
+            engine.warm(infer=infer)
+            WARMUP["engines"][name] = {"seconds": round(time.perf_counter() - start, 3), "infer": infer}
+            print(f"✓ Warmed up {name} ({time.perf_counter() - start:.1f}s)")
+        except Exception as e:
+            # 依赖没装等情况：该引擎仍在第一个请求时加载
+            WARMUP["engines"][name] = {"error": str(e)}
+            print(f"Warm-up failed for {name}: {e}")
+    gc.collect()
+    gc.freeze()
+    return WARMUP
+
+def warm_up_worker(names=None):
+    """gunicorn worker fork 之后的推理预热 (post_fork)：模型已由 master 加载，这里只做一次推理"""
+    for name in WARMUP_ENGINES if names is None else names:
+        engine = ENGINES.get(name)
+        if engine is None or not hasattr(engine, 'warm'):
+            continue
+        start = time.perf_counter()
+        try:
+            engine.warm(infer=True)
+            WARMUP["engines"].setdefault(name, {})["worker_seconds"] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            WARMUP["engines"].setdefault(name, {})["error"] = str(e)
+            print(f"Worker warm-up failed for {name}: {e}")
+
 @app.route('/upload', methods=['POST'])
 def upload_and_parse():
     if 'file' not in request.files:
@@ -50,9 +105,30 @@ def upload_and_parse():
     
     if not engine:
         return jsonify({"error": f"Engine {engine_name} not found"}), 400
+
+    # 几何信息 (页数 / 页面尺寸 / 旋转) 每个上传文件只算一次，存在文件旁边，各引擎共用
+    try:
+        geometry = geometry_summary(get_geometry(filepath))
+    except Exception as e:
+        return jsonify({"error": f"Invalid PDF: {e}"}), 400
+    
+    # 其余表单字段作为引擎选项，如 granularity=line / word_pages=3
+    options = request.form.to_dict()
+    options.pop('engine', None)
+    
+    # stream=1：逐页输出 NDJSON，配合 low_memory 处理超大文档
+    if options.pop('stream', '') in ('1', 'true'):
+        return stream_parse(engine, filepath, options, {
+            "type": "file",
+            "filename": file.filename,
+            "url": f"/uploads/{filename}",
+            "geometry": geometry
+        })
     
     try:
-        result = engine.parse(filepath)
+        result = engine.parse(filepath, **options)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -61,12 +137,145 @@ def upload_and_parse():
     return jsonify({
         "filename": file.filename,
         "url": f"/uploads/{filename}",
+        "geometry": geometry,
         "result": result
     })
 
+def stream_parse(engine, filepath, options, header):
+    """
+    以 NDJSON 逐行输出：先是 header，然后每页一行 {"type": "page", "page": {...}}，
+    最后一行 {"type": "summary", ...}；中途出错时最后一行为 {"type": "error", "error": ...}。
+    """
+    if not hasattr(engine, 'stream'):
+        return jsonify({"error": "Engine does not support streaming"}), 400
+
+    options.setdefault('low_memory', '1')
+    records = engine.stream(filepath, **options)
+    # 先取第一条记录，让参数错误在响应开始前以 400 返回
+    try:
+        first = next(records)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except StopIteration:
+        first = None
+
+    def generate():
+        yield json.dumps(header, ensure_ascii=False) + "\n"
+        if first is None:
+            return
+        yield json.dumps(first, ensure_ascii=False) + "\n"
+        try:
+            for record in records:
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     return send_from_directory(UPLOAD_FOLDER, filename)
 
+@app.route('/uploads/<filename>/parse')
+def reparse_uploaded(filename):
+    # 对已上传的文件按需重新解析，例如只取某一页的词级结果：
+    # ?engine=pdfplumber&pages=3&granularity=word
+    filepath = safe_join(UPLOAD_FOLDER, filename)
+    if filepath is None or not os.path.isfile(filepath):
+        return jsonify({"error": "File not found"}), 404
+
+    options = request.args.to_dict()
+    engine_name = options.pop('engine', 'PyMuPDF')
+    engine = ENGINES.get(engine_name)
+    if not engine:
+        return jsonify({"error": f"Engine {engine_name} not found"}), 400
+
+    try:
+        result = engine.parse(filepath, **options)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+    return jsonify({
+        "url": f"/uploads/{filename}",
+        "geometry": geometry_summary(get_geometry(filepath)),
+        "result": result
+    })
+
+@app.route('/uploads/<filename>/geometry')
+def uploaded_geometry(filename):
+    # 完整几何信息：MediaBox / CropBox (PDF 坐标)、旋转、PDF -> 显示坐标的矩阵、每页内容哈希
+    filepath = safe_join(UPLOAD_FOLDER, filename)
+    if filepath is None or not os.path.isfile(filepath):
+        return jsonify({"error": "File not found"}), 404
+    try:
+        return jsonify(get_geometry(filepath))
+    except Exception as e:
+        return jsonify({"error": f"Invalid PDF: {e}"}), 400
+
+@app.route('/uploads/<filename>/image')
+def uploaded_image(filename):
+    # 解析结果里图片只有 bbox / xref，像素在前端真正需要时才渲染
+    # ?page=1&xref=12  或  ?page=1&bbox=x0,y0,x1,y1[&scale=2] (PDF 坐标)
+    filepath = safe_join(UPLOAD_FOLDER, filename)
+    if filepath is None or not os.path.isfile(filepath):
+        return jsonify({"error": "File not found"}), 404
+
+    page = request.args.get('page', type=int)
+    xref = request.args.get('xref', type=int)
+    try:
+        scale = float(request.args.get('scale', 2))
+    except ValueError:
+        return jsonify({"error": "scale must be a number"}), 400
+    clip = None
+    if request.args.get('bbox'):
+        try:
+            clip = [float(v) for v in request.args['bbox'].split(',')]
+        except ValueError:
+            clip = []
+        if len(clip) != 4:
+            return jsonify({"error": "bbox must be x0,y0,x1,y1"}), 400
+    if page is None:
+        return jsonify({"error": "page is required"}), 400
+
+    try:
+        png = render_image(filepath, page, xref=xref, clip=clip, scale=scale)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(png, mimetype='image/png')
+
+@app.route('/metrics')
+def metrics():
+    # 按 worker 进程计：内存 (uss 为本进程独占，预加载共享的模型不计入)、预热结果、
+    # LaTeXOCR 模型加载耗时、跨请求批处理 (批大小分布、排队延迟) 与识别结果缓存的累计统计
+    return jsonify({
+        "pid": os.getpid(),
+        "memory": process_memory_mb(),
+        "warmup": dict(WARMUP, preloaded=WARMUP["pid"] is not None and WARMUP["pid"] != os.getpid()),
+        "latexocr": ENGINES['LaTeXOCR'].metrics()
+    })
+
+@app.route('/documents/<document_id>/export')
+def export_document(document_id):
+    # Docling 解析结果中的 document_id，按需导出：?format=markdown|text|html|doctags|dict
+    fmt = request.args.get('format', 'markdown')
+    try:
+        output = ENGINES['docling'].export(document_id, fmt)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if output is None:
+        return jsonify({"error": "Document not found"}), 404
+    if fmt == 'dict':
+        return jsonify(output)
+    mimetype = 'text/html' if fmt == 'html' else 'text/markdown' if fmt == 'markdown' else 'text/plain'
+    return Response(output, mimetype=f'{mimetype}; charset=utf-8')
+
 if __name__ == '__main__':
+    # debug 模式下 reloader 的父进程只负责监视文件，只在真正处理请求的子进程里预热
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_up()
     app.run(debug=True, port=5001)
@@ -0,0 +1,738 @@
+#!/usr/bin/env python3
+"""
+引擎性能微基准 (micro-benchmarks)
+
+用法:
+    python bench_engines.py pymupdf-passes [PDF ...]
+    python bench_engines.py pdfplumber-parallel [--workers 1 2 4] [PDF ...]
+    python bench_engines.py pdfplumber-words [PDF ...]
+    python bench_engines.py camelot-screen [PDF ...]
+    python bench_engines.py camelot-parallel [--workers 1 2 4] [--all-pages] [PDF ...]
+    python bench_engines.py latexocr-batch [--batch-sizes 1 4 8 16] [PDF ...]
+    python bench_engines.py latexocr-backends --testset DIR [--backends torch int8 onnx]
+    python bench_engines.py latexocr-decode --testset DIR [--profiles full_beam small_beam greedy] [--max-lengths 512 auto]
+    python bench_engines.py latexocr-candidates [--testset DIR] [PDF ...]
+    python bench_engines.py latexocr-concurrent [--clients 4] [--max-batch 16] [--max-wait-ms 20] [PDF ...]
+    python bench_engines.py formula-spans [--labels DIR] [PDF ...]
+
+不指定 PDF 时默认使用仓库根目录 data/ 下的论文。
+"""
+
+import argparse
+import gc
+import glob
+import os
+import re
+import sys
+import time
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+DEFAULT_CORPUS = sorted(glob.glob(os.path.join(REPO_ROOT, "data", "*.pdf")))
+# 中文论文语料 (01/) + 英文论文语料 (data/)
+FULL_CORPUS = sorted(glob.glob(os.path.join(REPO_ROOT, "01", "*.pdf"))) + DEFAULT_CORPUS
+
+
+# ==========================================
+# PyMuPDF：每页解析次数
+# ==========================================
+
+class FitzPassCounter:
+    """统计 PyMuPDF 对页面内容流的解析次数 (TextPage / drawings)，以及 find_tables 的调用次数 (每次自建字符表 TextPage)"""
+
+    def __init__(self):
+        import fitz
+        self.fitz = fitz
+        self.counts = {"textpage": 0, "drawings": 0, "find_tables": 0}
+        self._originals = {}
+
+    def __enter__(self):
+        Page = self.fitz.Page
+        counts = self.counts
+        originals = self._originals
+        originals["get_textpage"] = Page.get_textpage
+        originals["get_cdrawings"] = Page.get_cdrawings
+        originals["find_tables"] = Page.find_tables
+
+        def get_textpage(page, *args, **kwargs):
+            counts["textpage"] += 1
+            return originals["get_textpage"](page, *args, **kwargs)
+
+        def get_cdrawings(page, *args, **kwargs):
+            counts["drawings"] += 1
+            return originals["get_cdrawings"](page, *args, **kwargs)
+
+        def find_tables(page, *args, **kwargs):
+            counts["find_tables"] += 1
+            return originals["find_tables"](page, *args, **kwargs)
+
+        Page.get_textpage = get_textpage
+        Page.get_cdrawings = get_cdrawings
+        Page.find_tables = find_tables
+        return self
+
+    def __exit__(self, *exc):
+        for name, func in self._originals.items():
+            setattr(self.fitz.Page, name, func)
+
+
+def _legacy_pymupdf_pass(filepath):
+    """重构前 PyMuPDFEngine 对每页的调用：find_tables() + get_text("dict")"""
+    import fitz
+    doc = fitz.open(filepath)
+    for page in doc:
+        page.find_tables()
+        page.get_text("dict")
+    doc.get_toc()
+    pages = doc.page_count
+    doc.close()
+    return pages
+
+
+def bench_pymupdf_passes(files):
+    from engines import PyMuPDFEngine
+
+    engine = PyMuPDFEngine()
+    print(f"{'file':32s} {'mode':8s} {'pages':>5s} {'time(s)':>8s} {'textpage/p':>10s} {'drawings/p':>10s} {'tables/p':>8s}")
+    for filepath in files:
+        name = os.path.basename(filepath)[:32]
+        for mode in ("legacy", "shared"):
+            with FitzPassCounter() as counter:
+                start = time.perf_counter()
+                if mode == "legacy":
+                    pages = _legacy_pymupdf_pass(filepath)
+                else:
+                    pages = len(engine.parse(filepath)["pages"])
+                elapsed = time.perf_counter() - start
+            c = counter.counts
+            pages = max(pages, 1)
+            print(
+                f"{name:32s} {mode:8s} {pages:5d} {elapsed:8.2f} "
+                f"{c['textpage'] / pages:10.2f} {c['drawings'] / pages:10.2f} {c['find_tables'] / pages:8.2f}"
+            )
+
+
+# ==========================================
+# pdfplumber：多进程按页并行的扩展性
+# ==========================================
+
+def bench_pdfplumber_parallel(files, worker_counts):
+    from engines import PdfPlumberEngine
+
+    engine = PdfPlumberEngine()
+    print(f"cpu_count = {os.cpu_count()}")
+    header = f"{'file':32s} {'pages':>5s} " + " ".join(f"{f'w={w} (s)':>10s}" for w in worker_counts)
+    print(header + f" {'speedup':>8s} {'same':>5s}")
+
+    totals = {w: 0.0 for w in worker_counts}
+    for filepath in files:
+        name = os.path.basename(filepath)[:32]
+        times = {}
+        baseline = None
+        same = True
+        for workers in worker_counts:
+            start = time.perf_counter()
+            result = engine.parse(filepath, workers=workers)
+            times[workers] = time.perf_counter() - start
+            totals[workers] += times[workers]
+            result.pop("workers", None)
+            if baseline is None:
+                baseline = result
+            else:
+                same = same and result == baseline
+        pages = len(baseline["pages"])
+        speedup = times[worker_counts[0]] / max(times[worker_counts[-1]], 1e-9)
+        print(
+            f"{name:32s} {pages:5d} " + " ".join(f"{times[w]:10.2f}" for w in worker_counts)
+            + f" {speedup:7.2f}x {str(same):>5s}"
+        )
+
+    speedup = totals[worker_counts[0]] / max(totals[worker_counts[-1]], 1e-9)
+    print(
+        f"{'TOTAL':32s} {'':5s} " + " ".join(f"{totals[w]:10.2f}" for w in worker_counts)
+        + f" {speedup:7.2f}x"
+    )
+
+
+# ==========================================
+# pdfplumber：字符 -> 词 聚类 (extract_words vs NumPy)
+# ==========================================
+
+def bench_pdfplumber_words(files):
+    import pdfplumber
+    from engines.word_cluster import extract_words
+
+    print(f"{'file':32s} {'pages':>5s} {'chars':>7s} {'words':>6s} {'plumber(s)':>10s} {'numpy(s)':>9s} {'speedup':>8s} {'same':>5s}")
+    totals = [0.0, 0.0]
+    mismatched = 0
+    for filepath in files:
+        name = os.path.basename(filepath)[:32]
+        plumber_time = numpy_time = 0.0
+        n_chars = n_words = 0
+        same = True
+        with pdfplumber.open(filepath) as pdf:
+            for page in pdf.pages:
+                chars = page.chars  # 版面分析只做一次，不计入两边的耗时
+                # 先回收上一轮产生的对象，避免 GC 停顿随机落在某一边的计时里
+                gc.collect()
+                start = time.perf_counter()
+                expected = page.extract_words()
+                plumber_time += time.perf_counter() - start
+                gc.collect()
+                start = time.perf_counter()
+                words = extract_words(chars)
+                numpy_time += time.perf_counter() - start
+                n_chars += len(chars)
+                n_words += len(expected)
+                if words != expected:
+                    same = False
+                    mismatched += 1
+                page.close()
+        totals[0] += plumber_time
+        totals[1] += numpy_time
+        print(
+            f"{name:32s} {len(pdf.pages):5d} {n_chars:7d} {n_words:6d} {plumber_time:10.3f} {numpy_time:9.3f} "
+            f"{plumber_time / max(numpy_time, 1e-9):7.2f}x {str(same):>5s}"
+        )
+    print(
+        f"{'TOTAL':32s} {'':5s} {'':7s} {'':6s} {totals[0]:10.3f} {totals[1]:9.3f} "
+        f"{totals[0] / max(totals[1], 1e-9):7.2f}x  mismatched pages: {mismatched}"
+    )
+
+
+# ==========================================
+# Camelot：全部页 vs 只跑候选页
+# ==========================================
+
+def _table_keys(result):
+    return [
+        (el["page"], tuple(round(v) for v in el["bbox"]["raw"]))
+        for page in result.get("pages", [])
+        for el in page["elements"]
+    ]
+
+
+def bench_camelot_screen(files):
+    import warnings
+    from engines import CamelotEngine
+
+    warnings.filterwarnings("ignore")
+    engines = {"all": CamelotEngine(table_screen=False), "screen": CamelotEngine(table_screen=True)}
+    print(f"{'file':32s} {'pages':>5s} {'searched':>8s} {'all(s)':>7s} {'screen(s)':>9s} {'speedup':>8s} {'tables':>7s} {'lost':>5s} {'new':>4s}")
+    totals = {"all": 0.0, "screen": 0.0}
+    for filepath in files:
+        name = os.path.basename(filepath)[:32]
+        times, results = {}, {}
+        for mode, engine in engines.items():
+            start = time.perf_counter()
+            results[mode] = engine.parse(filepath)
+            times[mode] = time.perf_counter() - start
+            totals[mode] += times[mode]
+        full, screened = _table_keys(results["all"]), _table_keys(results["screen"])
+        stats = results["screen"].get("table_screen", {})
+        print(
+            f"{name:32s} {stats.get('pages', 0):5d} {stats.get('searched', 0):8d} {times['all']:7.1f} {times['screen']:9.1f} "
+            f"{times['all'] / max(times['screen'], 1e-9):7.1f}x {len(full):3d}/{len(screened):<3d} "
+            f"{sum(k not in screened for k in full):5d} {sum(k not in full for k in screened):4d}"
+        )
+    print(f"{'TOTAL':32s} {'':5s} {'':8s} {totals['all']:7.1f} {totals['screen']:9.1f} {totals['all'] / max(totals['screen'], 1e-9):7.1f}x")
+
+
+def bench_camelot_parallel(files, worker_counts, all_pages=False):
+    import warnings
+    from engines import CamelotEngine
+
+    warnings.filterwarnings("ignore")
+    engine = CamelotEngine(table_screen=not all_pages)
+    print(f"cpu_count = {os.cpu_count()}, table_screen = {not all_pages}")
+    print(
+        f"{'file':32s} {'pages':>5s} " + " ".join(f"{f'w={w} (s)':>10s}" for w in worker_counts)
+        + f" {'speedup':>8s} {'tables':>6s} {'same':>5s}"
+    )
+    totals = {w: 0.0 for w in worker_counts}
+    for filepath in files:
+        name = os.path.basename(filepath)[:32]
+        times, keys = {}, {}
+        for workers in worker_counts:
+            start = time.perf_counter()
+            result = engine.parse(filepath, workers=workers)
+            times[workers] = time.perf_counter() - start
+            totals[workers] += times[workers]
+            keys[workers] = _table_keys(result)
+        baseline = keys[worker_counts[0]]
+        same = all(k == baseline for k in keys.values())
+        print(
+            f"{name:32s} {len(result.get('pages', [])):5d} " + " ".join(f"{times[w]:10.1f}" for w in worker_counts)
+            + f" {times[worker_counts[0]] / max(times[worker_counts[-1]], 1e-9):7.2f}x {len(baseline):6d} {str(same):>5s}"
+        )
+    print(
+        f"{'TOTAL':32s} {'':5s} " + " ".join(f"{totals[w]:10.1f}" for w in worker_counts)
+        + f" {totals[worker_counts[0]] / max(totals[worker_counts[-1]], 1e-9):7.2f}x"
+    )
+
+
+# ==========================================
+# LaTeX-OCR：按批识别的吞吐量
+# ==========================================
+
+def bench_latexocr_batch(files, batch_sizes):
+    from engines import LaTeXOCREngine
+
+    engine = LaTeXOCREngine()
+    _ = engine.model  # 模型加载不计入耗时
+    print(f"cpu_count = {os.cpu_count()}")
+    print(
+        f"{'file':32s} {'crops':>5s} " + " ".join(f"{f'b={b} (s)':>10s}" for b in batch_sizes)
+        + f" {'speedup':>8s} {'same':>5s}"
+    )
+    totals = {b: 0.0 for b in batch_sizes}
+    crops = 0
+    for filepath in files:
+        name = os.path.basename(filepath)[:32]
+        times, outputs = {}, {}
+        for batch_size in batch_sizes:
+            start = time.perf_counter()
+            result = engine.parse(filepath, batch_size=batch_size)
+            times[batch_size] = time.perf_counter() - start
+            totals[batch_size] += times[batch_size]
+            outputs[batch_size] = [
+                (e["id"], e["type"], e.get("content"))
+                for page in result["pages"] for e in page["elements"]
+            ]
+        baseline = outputs[batch_sizes[0]]
+        count = sum(t in ("image", "formula_image") for _, t, _ in baseline)
+        crops += count
+        # beam search 的 padding 可能让个别公式的结果与逐张识别不同
+        same = all(o == baseline for o in outputs.values())
+        print(
+            f"{name:32s} {count:5d} " + " ".join(f"{times[b]:10.1f}" for b in batch_sizes)
+            + f" {times[batch_sizes[0]] / max(times[batch_sizes[-1]], 1e-9):7.2f}x {str(same):>5s}"
+        )
+    print(
+        f"{'TOTAL':32s} {crops:5d} " + " ".join(f"{totals[b]:10.1f}" for b in batch_sizes)
+        + f" {totals[batch_sizes[0]] / max(totals[batch_sizes[-1]], 1e-9):7.2f}x"
+    )
+
+
+# ==========================================
+# LaTeX-OCR：推理后端的延迟与准确率
+# ==========================================
+
+# LaTeX token：命令 (\\frac)、转义符、单个非空白字符
+_LATEX_TOKEN = re.compile(r"\\[a-zA-Z]+|\\.|\S")
+
+
+def load_formula_testset(directory):
+    """
+    公式测试集：目录下的 labels.jsonl，每行 {"image": "相对路径.png", "latex": "真值"}。
+    返回 [(PIL.Image, latex)]
+    """
+    import json
+    from PIL import Image
+
+    samples = []
+    with open(os.path.join(directory, "labels.jsonl"), encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                image = Image.open(os.path.join(directory, item["image"])).convert("RGB")
+                samples.append((image, item["latex"]))
+    return samples
+
+
+def latex_tokens(latex):
+    """按命令、转义符和单个字符切分，忽略空白"""
+    return _LATEX_TOKEN.findall(latex or "")
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y)))
+        previous = current
+    return previous[-1]
+
+
+def score_formulas(predictions, references):
+    """exact: 忽略空白后完全一致的比例；ned: 平均 token 级归一化编辑距离 (越小越好)"""
+    exact, ned = 0, 0.0
+    for prediction, reference in zip(predictions, references):
+        p, r = latex_tokens(prediction), latex_tokens(reference)
+        exact += p == r
+        ned += edit_distance(p, r) / max(len(p), len(r), 1)
+    n = max(len(references), 1)
+    return exact / n, ned / n
+
+
+def _recognize_timed(recognizer, images, batch_size, **decode):
+    """逐批识别，返回 (predictions, 每张图的毫秒数)；一批的耗时平均分给批内每张图"""
+    predictions, latencies = [], []
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        t0 = time.perf_counter()
+        predictions.extend(recognizer.recognize(batch, batch_size, **decode))
+        latencies.extend([(time.perf_counter() - t0) * 1000 / len(batch)] * len(batch))
+    return predictions, latencies
+
+
+def _latency_summary(latencies):
+    """(平均, p95) 毫秒"""
+    if not latencies:
+        return 0.0, 0.0
+    ordered = sorted(latencies)
+    return sum(ordered) / len(ordered), ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def bench_latexocr_backends(testset, backends, batch_size):
+    from engines.formula_ocr import FormulaRecognizer
+
+    samples = load_formula_testset(testset)
+    images = [image for image, _ in samples]
+    references = [latex for _, latex in samples]
+    print(f"cpu_count = {os.cpu_count()}, samples = {len(samples)}, batch_size = {batch_size}")
+    print(
+        f"{'backend':8s} {'load (s)':>8s} {'ms/crop':>8s} {'p95 (ms)':>8s} {'exact':>6s} {'ned':>6s}"
+        f" {'Δexact':>7s} {'Δned':>7s} {'agree':>6s}"
+    )
+    baseline = None
+    for backend in backends:
+        recognizer = FormulaRecognizer(backend=backend)
+        _ = recognizer.model
+        recognizer.recognize(images[:1], 1)  # 预热
+        predictions, latencies = _recognize_timed(recognizer, images, batch_size)
+        exact, ned = score_formulas(predictions, references)
+        if baseline is None:
+            baseline = (exact, ned, predictions)
+        # agree: 与第一个后端 (通常是 torch fp32) 输出完全一致的比例
+        agree = sum(
+            latex_tokens(p) == latex_tokens(q) for p, q in zip(predictions, baseline[2])
+        ) / max(len(predictions), 1)
+        mean, p95 = _latency_summary(latencies)
+        print(
+            f"{backend:8s} {recognizer.load_seconds:8.1f} {mean:8.0f} {p95:8.0f}"
+            f" {exact:6.1%} {ned:6.3f} {exact - baseline[0]:+7.1%} {ned - baseline[1]:+7.3f} {agree:6.1%}"
+        )
+        del recognizer
+        gc.collect()
+
+
+def bench_latexocr_decode(testset, profiles, max_lengths, batch_size, backend):
+    from engines.formula_ocr import FormulaRecognizer, resolve_max_length
+
+    samples = load_formula_testset(testset)
+    images = [image for image, _ in samples]
+    references = [latex for _, latex in samples]
+    recognizer = FormulaRecognizer(backend=backend)
+    _ = recognizer.model
+    recognizer.recognize(images[:1], 1)  # 预热
+    print(f"cpu_count = {os.cpu_count()}, samples = {len(samples)}, batch_size = {batch_size}, backend = {backend}")
+    print(f"{'profile':12s} {'max_len':>7s} {'ms/crop':>8s} {'p95 (ms)':>8s} {'speedup':>8s} {'exact':>6s} {'ned':>6s}")
+    baseline = None
+    for profile in profiles:
+        for max_length in max_lengths:
+            max_length = resolve_max_length(max_length)
+            predictions, latencies = _recognize_timed(
+                recognizer, images, batch_size, profile=profile, max_length=max_length
+            )
+            exact, ned = score_formulas(predictions, references)
+            mean, p95 = _latency_summary(latencies)
+            baseline = baseline or mean
+            print(
+                f"{profile:12s} {str(max_length):>7s} {mean:8.0f} {p95:8.0f} {baseline / max(mean, 1e-9):7.2f}x"
+                f" {exact:6.1%} {ned:6.3f}"
+            )
+
+
+def bench_latexocr_candidates(testset, files):
+    """
+    公式候选筛选的精确率 / 召回率。样本：
+    - PDF 中的图片块 (engine 实际会看到的区域)，记为非公式：仓库语料中的图片块是照片、图表和整页扫描
+    - 测试集 labels.jsonl 中的图片 (2 倍渲染的裁剪图)，默认记为公式；
+      可选字段 "formula": false 表示非公式，"body_size" 为所在页的正文字号 (默认 10)
+    """
+    import json
+    import fitz
+    from collections import Counter
+    from PIL import Image
+    from engines.fitz_utils import get_blocks
+    from engines.formula_candidates import body_text_size, classify_image, classify_region
+
+    counts = Counter()
+    reasons = {True: Counter(), False: Counter()}
+    elapsed, regions = 0.0, 0
+
+    def record(is_formula, is_candidate, why):
+        counts[(is_formula, is_candidate)] += 1
+        reasons[is_formula].update(why)
+
+    for filepath in files:
+        with fitz.open(filepath) as doc:
+            for page in doc:
+                blocks = get_blocks(page)
+                body_size = body_text_size(blocks)
+                for block in blocks:
+                    if block["type"] != 1:
+                        continue
+                    start = time.perf_counter()
+                    is_candidate, _, why = classify_region(page, block["bbox"], body_size)
+                    elapsed += time.perf_counter() - start
+                    regions += 1
+                    record(False, is_candidate, why)
+
+    if testset:
+        with open(os.path.join(testset, "labels.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                image = Image.open(os.path.join(testset, item["image"]))
+                is_candidate, _, why = classify_image(image, item.get("body_size", 10.0))
+                record(item.get("formula", True), is_candidate, why)
+
+    tp, fn = counts[(True, True)], counts[(True, False)]
+    fp, tn = counts[(False, True)], counts[(False, False)]
+    print(f"pdf image blocks = {regions} ({elapsed * 1000 / max(regions, 1):.2f} ms/block), testset = {testset or '-'}")
+    print(f"{'':14s} {'candidate':>9s} {'skipped':>8s}")
+    print(f"{'formula':14s} {tp:9d} {fn:8d}")
+    print(f"{'not formula':14s} {fp:9d} {tn:8d}")
+    precision = f"{tp / (tp + fp):.3f}" if tp + fp else "-"
+    recall = f"{tp / (tp + fn):.3f}" if tp + fn else "-"
+    print(f"precision = {precision}, recall = {recall}, OCR avoided on {tn}/{tn + fp} non-formula regions")
+    print(f"skip reasons (not formula): {dict(reasons[False])}")
+    print(f"skip reasons (formula):     {dict(reasons[True])}")
+
+
+# ==========================================
+# LaTeX-OCR：并发请求的跨请求批处理
+# ==========================================
+
+def bench_latexocr_concurrent(files, clients, max_batch, max_wait_ms):
+    """clients 个线程同时解析同一组 PDF (模拟并发上传)，对比各请求直接调用模型与共享批处理线程"""
+    from concurrent.futures import ThreadPoolExecutor
+    from engines import LaTeXOCREngine
+
+    print(f"cpu_count = {os.cpu_count()}, clients = {clients}, max_batch = {max_batch}, max_wait = {max_wait_ms} ms")
+    print(f"{'mode':10s} {'wall (s)':>9s} {'crops/s':>8s} {'batches':>7s} {'mean bs':>7s} {'queue p50/p95 (ms)':>19s} {'same':>5s}")
+    outputs = {}
+    for batching in (False, True):
+        engine = LaTeXOCREngine(
+            cache_path=":memory:", batching=batching, max_batch=max_batch, max_wait=max_wait_ms / 1000.0
+        )
+        _ = engine.model  # 模型加载不计入耗时
+        calls = []
+        generate = engine.recognizer._generate
+
+        def counted(images, *args, **kwargs):
+            calls.append(len(images))
+            return generate(images, *args, **kwargs)
+        engine.recognizer._generate = counted
+
+        def client(_):
+            # cache=0：每个请求都真正识别，否则第一个请求之后全部命中缓存
+            return [
+                [(e["id"], e["type"], e.get("content")) for page in engine.parse(f, cache="0")["pages"] for e in page["elements"]]
+                for f in files
+            ]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(clients) as pool:
+            results = list(pool.map(client, range(clients)))
+        wall = time.perf_counter() - start
+        outputs[batching] = results[0]
+        crops = sum(calls)
+        mode = "batched" if batching else "direct"
+        if batching:
+            queue = engine.metrics()["batcher"]["queue_ms"]
+            delay = f"{queue['p50']}/{queue['p95']}"
+        else:
+            delay = "-"
+        print(
+            f"{mode:10s} {wall:9.2f} {crops / max(wall, 1e-9):8.1f} {len(calls):7d} {crops / max(len(calls), 1):7.2f}"
+            f" {delay:>19s} {str(all(r == results[0] for r in results)):>5s}"
+        )
+    # beam search 的 padding 可能让个别公式在不同批组合下结果不同
+    print(f"batched == direct: {outputs[True] == outputs[False]}")
+
+
+# ==========================================
+# 文字层公式检测 (字体 / 上标)
+# ==========================================
+
+def _dollar_type(content):
+    # 原来 PyMuPDFEngine 按 "$" 判断的类型
+    if '$' not in content:
+        return "text"
+    return "formula" if content.startswith('$') and content.endswith('$') else "text_with_inline_formula"
+
+
+def bench_formula_spans(labels_dir, files, tolerance=2.0):
+    """
+    formula_spans.detect_regions 的耗时、检出数量，以及 PyMuPDFEngine 中类型改变的文本块数。
+    labels_dir: gen_pdf.py 生成的目录 (DOC_xxx.pdf + DOC_xxx.json)，用其中 label 为 formula 的框
+    (equation 环境，bbox = [x, y, w, h]，左上角为原点) 计算行间公式的精确率 / 召回率。
+    标注框的横向范围是整个版心，只按页码和垂直位置匹配：检出区域的垂直中心落在标注框内 (± tolerance pt) 即算命中。
+    """
+    import json
+    import fitz
+    from collections import Counter
+    from engines.fitz_utils import get_blocks
+    from engines.formula_spans import block_kind, detect_regions
+
+    pairs = [(f, None) for f in files]
+    if labels_dir:
+        pairs = [
+            (path[:-5] + ".pdf", path)
+            for path in sorted(glob.glob(os.path.join(labels_dir, "*.json")))
+            if os.path.exists(path[:-5] + ".pdf")
+        ]
+    tp = fp = fn = n_labels = 0
+    totals = Counter()
+    print(f"{'document':40s} {'pages':>5s} {'display':>7s} {'inline':>6s} {'us/page':>8s} {'changed':>7s}")
+    for filepath, label_path in pairs:
+        counts = Counter()
+        changed = Counter()
+        detected = []
+        elapsed = 0.0
+        with fitz.open(filepath) as doc:
+            for page in doc:
+                blocks = get_blocks(page)
+                start = time.perf_counter()
+                regions = detect_regions(blocks)
+                elapsed += time.perf_counter() - start
+                counts.update(region["kind"] for region in regions)
+                detected += [(page.number + 1, region) for region in regions if region["kind"] == "display"]
+                for block in blocks:
+                    if block["type"] != 0:
+                        continue
+                    content = "".join(s["text"] for line in block["lines"] for s in line["spans"]).strip()
+                    kind = block_kind(block)
+                    new = {"display": "formula", "inline": "text_with_inline_formula"}.get(kind, _dollar_type(content))
+                    if new != _dollar_type(content):
+                        changed[f"{_dollar_type(content)}->{new}"] += 1
+            pages = doc.page_count
+        totals.update(counts)
+        totals["pages"] += pages
+        totals["seconds"] += elapsed
+        name = os.path.basename(filepath)[:40]
+        print(
+            f"{name:40s} {pages:5d} {counts['display']:7d} {counts['inline']:6d}"
+            f" {elapsed * 1e6 / max(pages, 1):8.0f} {sum(changed.values()):7d}  {dict(changed)}"
+        )
+        if label_path is None:
+            continue
+        with open(label_path, encoding="utf-8") as f:
+            labels = [a for a in json.load(f)["annotations"] if a["label"] == "formula"]
+        n_labels += len(labels)
+        matched = set()
+        for page_number, region in detected:
+            centre = (region["bbox"][1] + region["bbox"][3]) / 2
+            hit = next(
+                (
+                    i for i, a in enumerate(labels)
+                    if a["page"] == page_number and a["bbox"][1] - tolerance <= centre <= a["bbox"][1] + a["bbox"][3] + tolerance
+                ),
+                None,
+            )
+            if hit is None:
+                fp += 1
+                print(f"  false positive p{page_number}: {region['text']!r}")
+            else:
+                tp += 1
+                matched.add(hit)
+        for i, a in enumerate(labels):
+            if i not in matched:
+                fn += 1
+                print(f"  missed p{a['page']} y={a['bbox'][1]:.0f}")
+    print(
+        f"total: pages = {totals['pages']}, display = {totals['display']}, inline = {totals['inline']}, "
+        f"{totals['seconds'] * 1e6 / max(totals['pages'], 1):.0f} us/page"
+    )
+    if labels_dir:
+        # 一个标注被拆成多个检出区域时，多出来的区域也计为命中 (精确率按检出区域、召回率按标注计)
+        precision = f"{tp / (tp + fp):.3f}" if tp + fp else "-"
+        recall = f"{1 - fn / n_labels:.3f}" if n_labels else "-"
+        print(f"display formulas: labels = {n_labels}, detected = {tp + fp}, precision = {precision}, recall = {recall}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("pymupdf-passes", help="PyMuPDF 每页解析次数与耗时 (重构前 vs 共享 PageAnalysis)")
+    p.add_argument("files", nargs="*", default=DEFAULT_CORPUS)
+
+    p = sub.add_parser("pdfplumber-parallel", help="PdfPlumberEngine 在 1..N 个 worker 进程下的耗时与结果一致性")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("files", nargs="*", default=FULL_CORPUS)
+
+    p = sub.add_parser("pdfplumber-words", help="extract_words 与 NumPy 向量化聚类的耗时对比和逐页一致性校验")
+    p.add_argument("files", nargs="*", default=FULL_CORPUS)
+
+    p = sub.add_parser("camelot-screen", help="Camelot lattice 全部页 vs 只跑候选页 / 候选区域的耗时与表格差异")
+    p.add_argument("files", nargs="*", default=FULL_CORPUS)
+
+    p = sub.add_parser("camelot-parallel", help="CamelotEngine 在 1..N 个 worker 进程下的耗时 (默认 data/ 下的论文)")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--all-pages", action="store_true", help="关闭候选页预筛选，所有页都交给 Camelot")
+    p.add_argument("files", nargs="*", default=DEFAULT_CORPUS)
+
+    p = sub.add_parser("latexocr-batch", help="LaTeXOCREngine 不同 batch_size 下的耗时与结果一致性 (需要 torch / transformers)")
+    p.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    p.add_argument("files", nargs="*", default=DEFAULT_CORPUS)
+
+    p = sub.add_parser("latexocr-backends", help="torch / int8 / onnx 推理后端在公式测试集上的延迟与准确率差异")
+    p.add_argument("--testset", required=True, help="含 labels.jsonl 的目录 (见 load_formula_testset)")
+    p.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"])
+    p.add_argument("--batch-size", type=int, default=1)
+
+    p = sub.add_parser("latexocr-decode", help="各解码配置 (greedy / small_beam / full_beam, 固定或预测 max_length) 的延迟与 exact match")
+    p.add_argument("--testset", required=True, help="含 labels.jsonl 的目录 (见 load_formula_testset)")
+    p.add_argument("--profiles", nargs="+", default=["full_beam", "small_beam", "greedy"])
+    p.add_argument("--max-lengths", nargs="+", default=["512", "auto"])
+    p.add_argument("--batch-size", type=int, default=1)
+    p.add_argument("--backend", default="torch")
+
+    p = sub.add_parser("latexocr-candidates", help="公式候选筛选在 PDF 图片块 (非公式) 和公式测试集上的精确率 / 召回率")
+    p.add_argument("--testset", help="含 labels.jsonl 的目录 (见 bench_latexocr_candidates)")
+    p.add_argument("files", nargs="*", default=FULL_CORPUS)
+
+    p = sub.add_parser("latexocr-concurrent", help="多个并发请求时，各请求直接调用模型 vs 共享批处理线程的吞吐与批大小")
+    p.add_argument("--clients", type=int, default=4)
+    p.add_argument("--max-batch", type=int, default=16)
+    p.add_argument("--max-wait-ms", type=float, default=20)
+    p.add_argument("files", nargs="*", default=DEFAULT_CORPUS)
+
+    p = sub.add_parser("formula-spans", help="按字体 / 上标的文字层公式检测：耗时、检出数，和 gen_pdf.py 标注比较的精确率 / 召回率")
+    p.add_argument("--labels", help="gen_pdf.py 的输出目录 (DOC_xxx.pdf + DOC_xxx.json)")
+    p.add_argument("files", nargs="*", default=FULL_CORPUS)
+
+    args = parser.parse_args()
+    if args.command == "pymupdf-passes":
+        bench_pymupdf_passes(args.files)
+    elif args.command == "pdfplumber-parallel":
+        bench_pdfplumber_parallel(args.files, args.workers)
+    elif args.command == "pdfplumber-words":
+        bench_pdfplumber_words(args.files)
+    elif args.command == "camelot-screen":
+        bench_camelot_screen(args.files)
+    elif args.command == "camelot-parallel":
+        bench_camelot_parallel(args.files, args.workers, args.all_pages)
+    elif args.command == "latexocr-batch":
+        bench_latexocr_batch(args.files, args.batch_sizes)
+    elif args.command == "latexocr-backends":
+        bench_latexocr_backends(args.testset, args.backends, args.batch_size)
+    elif args.command == "latexocr-decode":
+        bench_latexocr_decode(args.testset, args.profiles, args.max_lengths, args.batch_size, args.backend)
+    elif args.command == "latexocr-candidates":
+        bench_latexocr_candidates(args.testset, args.files)
+    elif args.command == "latexocr-concurrent":
+        bench_latexocr_concurrent(args.files, args.clients, args.max_batch, args.max_wait_ms)
+    elif args.command == "formula-spans":
+        bench_formula_spans(args.labels, args.files)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import threading
+
 import pymupdf
 
 def normalize_bbox(bbox, page_width, page_height, target_width=800):
@@ -39,11 +41,58 @@ def normalize_bbox(bbox, page_width, page_height, target_width=800):
 #         "raw": bbox
 #     }
 
+def parse_page_set(value):
+    """
+    解析页码选项："1,3-5" -> {1, 3, 4, 5}。None / "" 表示全部页面，返回 None。
+    也接受 int 或 int 列表 (直接从 Python 调用时)。
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, int):
+        return {value}
+    if not isinstance(value, str):
+        return {int(v) for v in value}
+
+    pages = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            pages.update(range(int(start), int(end) + 1))
+        else:
+            pages.add(int(part))
+    return pages
+
+def parse_flag(value):
+    """解析布尔选项：表单里的 "1" / "true" / "on" / "yes" 为 True"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "on", "yes")
+    return bool(value)
+
 class BasePDFEngine:
+    """
+    引擎实例在 app.ENGINES 中是单例，多个请求线程会同时调用同一实例的 parse。
+    元素 id 计数器因此按线程保存：每个解析在自己的线程里从 1 开始编号，互不干扰。
+    """
+
     def __init__(self):
+        self._ids = threading.local()
         self.element_counter = 0
+
+    @property
+    def element_counter(self):
+        return getattr(self._ids, "counter", 0)
+
+    @element_counter.setter
+    def element_counter(self, value):
+        self._ids.counter = value
         
-    def parse(self, filepath):
+    def parse(self, filepath, **options):
+        """
+        options 来自上传请求的表单字段 (均为字符串)，各引擎只读取自己认识的选项，其余忽略。
+        """
         self.element_counter = 0
         raise NotImplementedError
         
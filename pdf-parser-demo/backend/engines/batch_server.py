@@ -0,0 +1,215 @@
+"""
+跨请求的公式识别动态批处理
+
+多个 LaTeXOCR 上传同时解析时，每个请求各自对同一个模型调用 generate，批都很小 (往往只有几张图)，
+而且彼此抢 CPU。这里由一个进程内的推理线程统一识别：各请求把裁剪图提交到共享队列后等待结果，
+推理线程把解码参数相同的图片合成一批，凑满 max_batch 张或最早的一张已等待 max_wait 秒时执行，
+再把结果分发回各自的调用方。
+解析在 session() 内登记：所有进行中的解析都已提交并在等待结果时，不会再有新图片到来，不再等满 max_wait。
+
+配置 (环境变量，或 LaTeXOCREngine(batching=..., max_batch=..., max_wait=...))：
+- FORMULA_BATCHING:     "0" 时关闭，各请求直接调用模型 (原来的行为)
+- FORMULA_BATCH_MAX:    一批最多的图片数，默认 16
+- FORMULA_BATCH_WAIT_MS: 为凑批最多等待的毫秒数，默认 20
+
+推理线程在第一次提交时才启动，并记录所在进程：gunicorn --preload 时模型在父进程加载，
+fork 出的 worker 里没有父进程的线程，会在 worker 里重新启动自己的推理线程。
+"""
+
+import collections
+import contextlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+DEFAULT_MAX_BATCH = int(os.environ.get("FORMULA_BATCH_MAX", "16"))
+DEFAULT_MAX_WAIT = int(os.environ.get("FORMULA_BATCH_WAIT_MS", "20")) / 1000.0
+BATCHING_ENABLED = os.environ.get("FORMULA_BATCHING", "1") not in ("0", "false")
+# 排队延迟的分位数按最近这么多张图计算
+DELAY_WINDOW = 1000
+
+
+class _Request:
+    __slots__ = ("image", "key", "future", "enqueued")
+
+    def __init__(self, image, key):
+        self.image = image
+        self.key = key
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class FormulaBatcher:
+    """
+    用法：
+        batcher = FormulaBatcher(recognizer)
+        latex_codes = batcher.recognize(images, profile="full_beam", max_length=512)
+    recognize 可以在任意线程并发调用，结果与 recognizer.recognize 相同 (按输入顺序，失败为 None)。
+    """
+
+    def __init__(self, recognizer, max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT):
+        if max_batch < 1:
+            raise ValueError("max_batch must be a positive integer")
+        if max_wait < 0:
+            raise ValueError("max_wait must be non-negative")
+        self.recognizer = recognizer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "items": 0,
+            "batches": 0,
+            "infer_seconds": 0.0,
+            "queue_seconds": 0.0,
+            "max_queue_seconds": 0.0,
+            # 批大小 -> 批数
+            "batch_sizes": collections.Counter(),
+        }
+        self._delays = collections.deque(maxlen=DELAY_WINDOW)
+
+    def _ensure_started(self):
+        # fork 之后父进程的线程、锁状态都不可用，在当前进程里重新建
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._cond = threading.Condition()
+            self._queue = []
+            # 进行中的解析数 / 其中正在等待识别结果的调用数
+            self._active = 0
+            self._waiting = 0
+            if self._pid is not None:
+                self._reset_metrics()
+            self._thread = threading.Thread(target=self._run, name="formula-batcher", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, images, profile, max_length):
+        """提交一组图片 (元素可以为 None)，返回等长的 Future 列表"""
+        self._ensure_started()
+        key = (profile, max_length)
+        futures = []
+        requests = []
+        for image in images:
+            if image is None:
+                future = Future()
+                future.set_result(None)
+                futures.append(future)
+                continue
+            request = _Request(image, key)
+            requests.append(request)
+            futures.append(request.future)
+        if requests:
+            with self._cond:
+                self._queue.extend(requests)
+                self._cond.notify()
+        return futures
+
+    def recognize(self, images, profile, max_length):
+        self._ensure_started()
+        with self._cond:
+            self._waiting += 1
+            self._cond.notify()
+        try:
+            return [future.result() for future in self.submit(images, profile, max_length)]
+        finally:
+            with self._cond:
+                self._waiting -= 1
+
+    @contextlib.contextmanager
+    def session(self):
+        """一次解析：登记后，所有登记的解析都在等待结果时立即执行当前的批"""
+        self._ensure_started()
+        with self._cond:
+            self._active += 1
+        try:
+            yield self
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify()
+
+    def _everyone_waiting(self):
+        return self._active > 0 and self._waiting >= self._active
+
+    def _take_batch(self):
+        """等到队首请求所在的组凑满或超时，取出这一批 (与队首解码参数相同的请求，按提交顺序)"""
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            first = self._queue[0]
+            deadline = first.enqueued + self.max_wait
+            while True:
+                batch = [r for r in self._queue if r.key == first.key][:self.max_batch]
+                remaining = deadline - time.perf_counter()
+                if len(batch) >= self.max_batch or remaining <= 0 or self._everyone_waiting():
+                    break
+                self._cond.wait(remaining)
+            taken = set(map(id, batch))
+            self._queue = [r for r in self._queue if id(r) not in taken]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            profile, max_length = batch[0].key
+            started = time.perf_counter()
+            try:
+                results = self.recognizer.recognize(
+                    [r.image for r in batch], len(batch), profile=profile, max_length=max_length
+                )
+            except Exception as e:
+                # 模型加载失败等：这一批的调用方都收到异常
+                print(f"Formula batch failed: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            for request, latex in zip(batch, results):
+                request.future.set_result(latex)
+
+            with self._metrics_lock:
+                metrics = self._metrics
+                metrics["items"] += len(batch)
+                metrics["batches"] += 1
+                metrics["infer_seconds"] += finished - started
+                metrics["batch_sizes"][len(batch)] += 1
+                for request in batch:
+                    delay = started - request.enqueued
+                    metrics["queue_seconds"] += delay
+                    metrics["max_queue_seconds"] = max(metrics["max_queue_seconds"], delay)
+                    self._delays.append(delay)
+
+    def stats(self):
+        """批大小分布、排队延迟 (提交到开始推理) 和推理耗时"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics, batch_sizes=dict(self._metrics["batch_sizes"]))
+            delays = sorted(self._delays)
+        items, batches = metrics["items"], metrics["batches"]
+
+        def percentile(q):
+            return round(delays[min(len(delays) - 1, int(len(delays) * q))] * 1000, 1) if delays else None
+
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "queued": len(self._queue) if self._pid == os.getpid() else 0,
+            "items": items,
+            "batches": batches,
+            "mean_batch_size": round(items / batches, 2) if batches else None,
+            "batch_sizes": {str(size): count for size, count in sorted(metrics["batch_sizes"].items())},
+            "queue_ms": {
+                "mean": round(metrics["queue_seconds"] * 1000 / items, 1) if items else None,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(metrics["max_queue_seconds"] * 1000, 1),
+            },
+            "infer_seconds": round(metrics["infer_seconds"], 3),
+        }
@@ -1,106 +1,292 @@
 from .base import BasePDFEngine, normalize_bbox
+from .fitz_utils import get_image_infos
+from .geometry import get_geometry, pdfminer_to_view_bbox
+from .parallel import JobTimeout, resolve_workers, run_jobs, split_pages
+from .table_screen import (
+    CLIP_MARGIN, TableScreenStats, fitz_edges, fitz_words, raster_candidates, screen_page, search_clip
+)
 import camelot
-# 我们只用 pypdf 获取页面宽高（它是 Camelot 的底层依赖，不算引入新工具）
-from pypdf import PdfReader 
+import fitz  # PyMuPDF，只用于表格候选页的预筛选
+
+# lattice 参数：line_scale 越大越灵敏，短于 页面尺寸 / line_scale 的线段会被 Camelot 忽略
+LINE_SCALE = 40
+# Camelot lattice 会丢弃交点不超过 4 个的轮廓 (单个方框 / 页面边框)
+LATTICE_MIN_JOINTS = 4
+# stream 参数：row_tol 取候选区域内词高中位数的这个比例，介于 Camelot 默认值 2 和 10 之间
+STREAM_ROW_TOL_RATIO = 0.5
+STREAM_MIN_ROW_TOL = 2
+STREAM_MAX_ROW_TOL = 10
+# 三线表的横线组至少跨这么高 (pt)，页眉页脚的双横线跨度接近 0
+STREAM_MIN_RULE_SPAN = 20
+
+
+def _pdf_region(page, bbox):
+    """PyMuPDF 页面坐标 (左上角原点) -> Camelot 区域字符串 "x1,y1,x2,y2" (PDF 坐标，左上 / 右下两个角)"""
+    rect = fitz.Rect(bbox) * ~page.transformation_matrix
+    return f"{rect.x0},{rect.y1},{rect.x1},{rect.y0}"
+
+
+def _regions(page, candidates):
+    width, height = page.rect.width, page.rect.height
+    return [
+        _pdf_region(page, (
+            max(0.0, c.bbox[0] - CLIP_MARGIN), max(0.0, c.bbox[1] - CLIP_MARGIN),
+            min(width, c.bbox[2] + CLIP_MARGIN), min(height, c.bbox[3] + CLIP_MARGIN),
+        ))
+        for c in candidates
+    ]
+
+
+def _row_tol(words, candidates):
+    """按候选区域内文字的词高中位数估计 stream 的 row_tol"""
+    heights = sorted(
+        w[3] - w[1] for w in words
+        if any(c.bbox[1] <= (w[1] + w[3]) / 2 <= c.bbox[3] and c.bbox[0] <= (w[0] + w[2]) / 2 <= c.bbox[2]
+               for c in candidates)
+    )
+    if not heights:
+        return STREAM_MIN_ROW_TOL
+    row_tol = round(heights[len(heights) // 2] * STREAM_ROW_TOL_RATIO, 1)
+    return min(STREAM_MAX_ROW_TOL, max(STREAM_MIN_ROW_TOL, row_tol))
+
+
+def classify_page(page, line_scale=LINE_SCALE):
+    """
+    为单页选择 Camelot flavor，每页只跑一次：
+    - 有横竖线网格 (交点 > 4) 或带文字层的扫描图片 -> "lattice"
+    - 只有等宽横线 (三线表)，且附近有表格标题 -> "stream"，row_tol 按字高调整
+    - 其它 -> None，该页不可能有表格
+    返回 (flavor, candidates, row_tol)。
+    """
+    width, height = page.rect.width, page.rect.height
+    # 短于 页面尺寸 / line_scale 的线段 Camelot 看不到，预筛选时同样忽略
+    edges = [
+        e for e in fitz_edges(page.get_drawings())
+        if (e[3] - e[1] if e[0] == "h" else e[4] - e[2]) >= (width if e[0] == "h" else height) / line_scale
+    ]
+    words = None
+    image_bboxes = [info["bbox"] for info in get_image_infos(page)]
+    candidates = screen_page(edges, None, width, height)
+
+    lattice = [c for c in candidates if c.kind == "grid" and c.lines[0] * c.lines[1] > LATTICE_MIN_JOINTS]
+    if image_bboxes:
+        words = fitz_words(page.get_text("words"))
+        lattice += raster_candidates(image_bboxes, words)
+    if lattice:
+        return "lattice", lattice, None
+
+    if not any(c.kind == "rules" for c in candidates):
+        return None, [], None
+    words = words if words is not None else fitz_words(page.get_text("words"))
+    # 带上文字再筛一次，得到标题词 (caption) 标记
+    stream = [
+        c for c in screen_page(edges, words, width, height)
+        if c.kind == "rules" and c.caption and c.bbox[3] - c.bbox[1] >= STREAM_MIN_RULE_SPAN
+    ]
+    if stream:
+        return "stream", stream, _row_tol(words, stream)
+    return None, [], None
+
+
+def plan_pages(filepath, line_scale=LINE_SCALE, stats=None):
+    """
+    逐页分类，返回 {页码: {"flavor", "regions", "row_tol"}}。
+    regions 为 None 表示整页搜索，否则为 table_regions 列表；不在字典中的页跳过。
+    """
+    plans = {}
+    doc = fitz.open(filepath)
+    try:
+        for page in doc:
+            flavor, candidates, row_tol = classify_page(page, line_scale)
+            kinds = ("grid", "raster") if flavor == "lattice" else ("rules",)
+            searched, clip = search_clip(candidates, page.rect.width, page.rect.height, kinds=kinds)
+            if stats is not None:
+                stats.record(clip, searched)
+            if not searched:
+                continue
+            plans[page.number + 1] = {
+                "flavor": flavor,
+                "regions": None if clip is None else _regions(page, candidates),
+                "row_tol": row_tol,
+            }
+    finally:
+        doc.close()
+    return plans
+
+
+def read_page_tables(filepath, pages, flavor="lattice", regions=None, row_tol=None, **kwargs):
+    """按 plan_pages 给出的 flavor / regions / row_tol 对一批页执行一次 camelot.read_pdf，返回 TableList"""
+    if regions:
+        kwargs["table_regions"] = regions
+    if flavor == "lattice":
+        # 如果使用 lattice 模式，绝对不能加 row_tol
+        kwargs["line_scale"] = LINE_SCALE
+    elif row_tol is not None:
+        kwargs["row_tol"] = row_tol
+    return camelot.read_pdf(filepath, pages=pages, flavor=flavor, **kwargs)
+
+
+def _read_batch(filepath, pages, flavor="lattice", regions=None, row_tol=None):
+    """
+    read_page_tables 的进程池入口，返回可跨进程传递的表格记录：
+    {"page", "bbox" (Camelot 坐标，左下角原点), "content" (CSV), "flavor"}
+    """
+    tables = read_page_tables(filepath, pages, flavor, regions, row_tol)
+    return [
+        {
+            "page": table.page,
+            "bbox": tuple(table._bbox) if hasattr(table, '_bbox') else None,
+            "content": table.df.to_csv(index=False, header=False),
+            "flavor": flavor,
+        }
+        for table in tables
+    ]
+
+
+def _batch_timeouts(batches, page_timeout):
+    if page_timeout is None:
+        return None
+    return [page_timeout * len(b[1].split(",")) for b in batches]
+
 
 class CamelotEngine(BasePDFEngine):
     """
     纯净版 Camelot 引擎
     只使用 camelot-py 库进行识别，不依赖 pdfplumber 进行混合解析。
     """
-    def parse(self, filepath):
+    def __init__(self, table_screen=True, workers=1, page_timeout=None):
+        super().__init__()
+        # 是否先逐页分类，只在候选页 / 候选区域上以对应的 flavor 运行 Camelot (见 plan_pages)
+        self.table_screen = table_screen
+        # 默认的 worker 进程数与单页超时 (秒)，可被 workers / page_timeout 选项覆盖
+        self.workers = workers
+        self.page_timeout = page_timeout
+
+    def read_tables(self, filepath, stats=None, workers=None, page_timeout=None):
+        """
+        lattice 模式会把每一页栅格化再做线检测，论文里大部分页根本没有表格。
+        预筛选后每页只跑一次 Camelot：整页 lattice 候选按页分批；有候选区域的页 (lattice 或 stream)
+        单独一批，并用 table_regions 限定区域。
+        table_regions 只限制搜索范围，表格 bbox 仍是 Camelot 检测到的实际边界 (table_areas 会直接把区域当作表格)。
+
+        workers > 1 或设置了 page_timeout 时各批在进程池中执行 (见 parallel.run_jobs)，
+        每批的超时为 page_timeout * 页数；超时的多页批次拆成单页重试，只放弃真正卡住的页。
+        返回 (tables, failed)：tables 为 _read_batch 产出的表格记录，failed 为 {页码: 错误信息}。
+        """
+        workers = resolve_workers(self.workers if workers is None else workers)
+        page_timeout = float(page_timeout or self.page_timeout or 0) or None
+
+        if self.table_screen:
+            plans = plan_pages(filepath, stats=stats)
+        else:
+            plans = {
+                p: {"flavor": "lattice", "regions": None, "row_tol": None}
+                for p in range(1, get_geometry(filepath)["page_count"] + 1)
+            }
+        full_pages = [
+            p for p, plan in plans.items() if plan["flavor"] == "lattice" and plan["regions"] is None
+        ]
+        batches = [
+            (filepath, ",".join(map(str, chunk)), "lattice", None, None)
+            for chunk in split_pages(full_pages, workers, min_chunk=1)
+        ]
+        batches += [
+            (filepath, str(p), plan["flavor"], plan["regions"], plan["row_tol"])
+            for p, plan in plans.items() if p not in full_pages
+        ]
+
+        tables, failed = [], {}
+        if workers <= 1 and page_timeout is None:
+            for batch in batches:
+                tables.extend(_read_batch(*batch))
+        else:
+            results = run_jobs(_read_batch, batches, workers, _batch_timeouts(batches, page_timeout))
+            retry = []
+            for batch, result in zip(batches, results):
+                if not isinstance(result, Exception):
+                    tables.extend(result)
+                elif isinstance(result, JobTimeout) and "," in batch[1]:
+                    retry.extend((batch[0], p) + batch[2:] for p in batch[1].split(","))
+                else:
+                    failed.update((int(p), str(result)) for p in batch[1].split(","))
+            if retry:
+                results = run_jobs(_read_batch, retry, workers, _batch_timeouts(retry, page_timeout))
+                for batch, result in zip(retry, results):
+                    if isinstance(result, Exception):
+                        failed[int(batch[1])] = str(result)
+                    else:
+                        tables.extend(result)
+
+        tables.sort(key=lambda t: t["page"])
+        return tables, failed
+
+    def parse(self, filepath, workers=None, page_timeout=None, **options):
+        """
+        workers:      并行处理页批次的进程数 ("auto" 为全部 CPU 核)
+        page_timeout: 单页超时 (秒)，超时的页不输出表格，记录在结果的 "failed_pages" 中
+        """
         self.element_counter = 0
         pages_data = []
+        screen_stats = TableScreenStats()
         
-        # 1. 获取页面尺寸 (Metadata)
-        # Camelot 解析结果里不包含页面宽高，所以我们需要用轻量级工具读一下尺寸
-        # 这不算"作弊"，因为这是前端渲染必须的坐标系基准
-        page_dimensions = {}
-        try:
-            reader = PdfReader(filepath)
-            for i, page in enumerate(reader.pages):
-                # pypdf 的宽高单位通常是 point (72 dpi)
-                width = float(page.mediabox.width)
-                height = float(page.mediabox.height)
-                page_dimensions[i + 1] = (width, height)
-        except Exception:
-            pass
+        # 1. 页面尺寸 (Metadata)
+        # Camelot 解析结果里不包含页面宽高，用共享的几何信息 (每个文件只计算一次，见 geometry.py)
+        geometry = get_geometry(filepath)
 
         try:
             print(f"Camelot (Pure) parsing: {filepath} ...")
             
             # ==========================================
-            # 核心策略：针对三线表（无竖线）
+            # 核心策略：逐页选择 flavor (见 classify_page)
             # ==========================================
-            # 1. flavor='stream': 必须用流式，因为 Lattice 无法识别无竖线表格。
-            # 2. row_tol=10: (行容差) 默认是 2。调大可以允许稍微错位的行合并，防止文字被打散。
-            # 3. edge_tol=500: (边缘容差) 默认 50。设大一点告诉它"表格可能在页面的任何位置"。
-            # 注意：不指定 table_areas 的情况下，Camelot 会尝试猜测。
-            
-            # 如果使用 lattice 模式，绝对不能加 row_tol
-            # 如果觉得线条识别不准，可以加 line_scale (默认15，越大越灵敏，如 40)
-            tables = camelot.read_pdf(
-                filepath, 
-                pages='all', 
-                flavor='lattice', 
-                line_scale=40  # 替换 row_tol
+            # 1. flavor='lattice': 有横竖线网格的页。如果觉得线条识别不准，可以调 line_scale (默认15，越大越灵敏，如 40)
+            # 2. flavor='stream': 三线表（无竖线）只能用流式，Lattice 无法识别无竖线表格。
+            #    row_tol (行容差) 默认是 2，按表格区域的字高调大，允许稍微错位的行合并，防止文字被打散。
+            # 3. 不指定区域的情况下，Camelot 会尝试猜测；有候选区域时用 table_regions 限定。
+            tables, failed = self.read_tables(
+                filepath, stats=screen_stats, workers=workers, page_timeout=page_timeout
             )
             
-            # 如果你要用 stream 模式，才加 row_tol
-            # tables = camelot.read_pdf(
-            #     filepath, 
-            #     pages='all', 
-            #     flavor='stream', 
-            #     row_tol=10
-            # )
-            
             print(f"Camelot found {len(tables)} tables.")
 
             # 按页面分组
             tables_by_page = {}
             for table in tables:
-                p = table.page
+                p = table["page"]
                 if p not in tables_by_page: tables_by_page[p] = []
                 tables_by_page[p].append(table)
             
             # 遍历所有页面构建数据
             # 即使该页没有表格，也要返回一个空的 elements 列表，保证前端页面正常显示
-            total_pages = len(page_dimensions)
-            
-            for i in range(1, total_pages + 1):
-                width, height = page_dimensions.get(i, (600, 800)) # 默认值防崩
+            for page_geometry in geometry["pages"]:
+                i = page_geometry["page_number"]
+                width, height = page_geometry["width"], page_geometry["height"]
                 elements = []
                 
                 page_tables = tables_by_page.get(i, [])
                 
                 for table in page_tables:
-                    # 获取坐标 (Camelot 使用左下角原点)
+                    # 获取坐标 (Camelot 使用 pdfminer 的左下角原点坐标)
                     # _bbox = (x0, y0, x1, y1) -> (Left, Bottom, Right, Top)
-                    if hasattr(table, '_bbox'):
-                        c_x0, c_y0, c_x1, c_y1 = table._bbox
-                        
-                        # 坐标转换：从 Bottom-Left (PDF) 转为 Top-Left (Web)
-                        # New Top = Height - Old Top (y1)
-                        # New Bottom = Height - Old Bottom (y0)
-                        new_top = height - c_y1
-                        new_bottom = height - c_y0
-                        
+                    if table["bbox"] is not None:
+                        # 坐标转换：从 Bottom-Left (PDF) 转为 Top-Left (Web)，同时处理 MediaBox / CropBox 偏移和页面旋转
                         norm_bbox = normalize_bbox(
-                            [c_x0, new_top, c_x1, new_bottom], 
+                            pdfminer_to_view_bbox(page_geometry, table["bbox"]),
                             width, height
                         )
                     else:
                         norm_bbox = None
 
                     # 提取内容 (CSV 格式)
-                    content = table.df.to_csv(index=False, header=False)
+                    content = table["content"]
                     
                     elements.append({
                         "id": self.generate_id(),
                         "page": i,
                         "type": "table",
                         "content": content,
-                        "bbox": norm_bbox
+                        "bbox": norm_bbox,
+                        "flavor": table["flavor"]
                     })
                 
                 pages_data.append({
@@ -119,5 +305,7 @@ class CamelotEngine(BasePDFEngine):
         return {
             "metadata": {},
             "pages": pages_data,
+            "table_screen": screen_stats.to_dict(),
+            "failed_pages": [{"page": p, "error": e} for p, e in sorted(failed.items())],
             "engine": "camelot (Pure Stream)"
         }
\ No newline at end of file
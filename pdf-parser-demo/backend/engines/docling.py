@@ -1,12 +1,228 @@
-from .base import BasePDFEngine, normalize_bbox
+from .base import BasePDFEngine, normalize_bbox, parse_flag
+from .docling_cache import DEFAULT_CACHE_DIR, EXPORT_FORMATS, DocumentCache, document_id, parse_formats
+from .docling_pool import DEFAULT_POOL_SIZE, DEFAULT_PROFILE, DOCLING_AVAILABLE, ConverterPool, resolve_profile
+from .geometry import get_geometry
+from .parallel import MP_CONTEXT, resolve_workers
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import os
 import json
+import threading
+import time
+
+# 分块转换：workers > 1 且未指定 chunk_pages 时每块的页数
+DEFAULT_CHUNK_PAGES = 20
+# 每块失败后的重试次数
+DEFAULT_CHUNK_RETRIES = 1
+
+# worker 进程内的转换器池：同一进程处理的后续块复用已加载模型的转换器
+_worker_pool = None
+
+# 分块转换的进程池在各请求之间共用，不随每次解析新建，每个 profile 一个：worker 启动时构建并预热
+# 该 profile 的转换器 (_init_worker)，之后这个 profile 的块都由已加载模型的 worker 处理，
+# worker 里也只有这一个 profile 的模型。同一 profile 需要更多 worker 时才重建
+# profile -> (ProcessPoolExecutor, worker 数)
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def _init_worker(profile):
+    global _worker_pool
+    _worker_pool = ConverterPool(1)
+    try:
+        _worker_pool.warm((profile,))
+    except Exception as e:
+        # 预热失败不影响 worker 启动，第一个块转换时再构建 (并报告真正的错误)
+        print(f"Docling worker warm-up failed: {e}")
+
+
+def chunk_executor(workers, profile=DEFAULT_PROFILE):
+    """profile 专用、至少有 workers 个 worker 的共享进程池，worker 启动时预热该 profile"""
+    with _executor_lock:
+        executor, size = _executors.get(profile, (None, 0))
+        if executor is None or size < workers:
+            if executor is not None:
+                executor.shutdown(wait=False)
+            executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=MP_CONTEXT, initializer=_init_worker, initargs=(profile,)
+            )
+            _executors[profile] = (executor, workers)
+        return executor
+
+
+def _discard_executor(executor):
+    """worker 异常退出后进程池不可再用，丢弃它，下次提交时重建"""
+    with _executor_lock:
+        for profile, (current, _) in list(_executors.items()):
+            if current is executor:
+                del _executors[profile]
+    executor.shutdown(wait=False)
+
+def document_pages(doc, engine, page_offset=0):
+    """
+    DoclingDocument -> 页面列表 (与其它引擎相同的结构)，元素 id 由 engine.generate_id() 分配。
+    page_offset: 文档只包含原文件的一段页面且页码从 1 开始时，加到页码上
+    """
+    # 获取页面尺寸信息 (Docling 的 export_to_dict 可能不直接包含每页宽高，需从对象获取)
+    # 我们先建立一个页面尺寸映射
+    page_dims = {}
+    for page_no, page_obj in doc.pages.items():
+        # page_obj.size.width / height
+        page_dims[page_no] = {
+            "width": page_obj.size.width,
+            "height": page_obj.size.height
+        }
+
+    # 遍历解析后的所有文本/表格元素
+    # 在 export_to_dict() 的结构中，内容通常在 'texts', 'tables', 'pictures' 等字段
+    # 或者我们直接遍历 doc_dict['pages'] 如果存在的话
+    
+    # 新版 Docling 结构通常把所有元素扁平化放在 doc.texts 和 doc.tables 中，
+    # 并通过 prov (provenance) 字段关联到页面和坐标。
+    
+    # 初始化页面容器
+    pages_map = {}
+    for p_no in page_dims.keys():
+        pages_map[p_no] = []
+
+    # --- 处理文本 (Texts) ---
+    for item in doc.texts:
+        # item 是 TextItem 对象
+        # 它的 prov 属性是一个列表，包含位置信息
+        if not hasattr(item, "prov") or not item.prov:
+            continue
+        
+        for prov in item.prov:
+            p_no = prov.page_no
+            if p_no not in pages_map: continue
+            
+            # 获取页面尺寸用于归一化
+            p_w = page_dims[p_no]["width"]
+            p_h = page_dims[p_no]["height"]
+            
+            # 坐标转换
+            # Docling bbox: [l, b, r, t] (左, 底, 右, 顶) - 原点在左下角
+            bbox = prov.bbox
+            x0, y0, x1, y1 = bbox.l, bbox.b, bbox.r, bbox.t
+            
+            # 转换为 Top-Left (Web) 坐标系
+            # New Top = Height - Old Top (y1)
+            # New Bottom = Height - Old Bottom (y0)
+            new_top = p_h - y1
+            new_bottom = p_h - y0
+            
+            norm_bbox = normalize_bbox([x0, new_top, x1, new_bottom], p_w, p_h)
+            
+            # 确定类型
+            el_type = "text"
+            if item.label == "section_header" or item.label == "title":
+                el_type = "heading"
+            elif item.label == "code":
+                el_type = "code"
+            elif item.label == "formula":
+                el_type = "formula"
+                
+            pages_map[p_no].append({
+                "id": engine.generate_id(),
+                "page": p_no,
+                "type": el_type,
+                "content": item.text,
+                "bbox": norm_bbox
+            })
+
+    # --- 处理表格 (Tables) ---
+    for table in doc.tables:
+        if not hasattr(table, "prov") or not table.prov:
+            continue
+            
+        # 表格通常只有一个主要位置
+        prov = table.prov[0]
+        p_no = prov.page_no
+        if p_no not in pages_map: continue
+
+        p_w = page_dims[p_no]["width"]
+        p_h = page_dims[p_no]["height"]
+        
+        bbox = prov.bbox
+        x0, y0, x1, y1 = bbox.l, bbox.b, bbox.r, bbox.t
+        
+        new_top = p_h - y1
+        new_bottom = p_h - y0
+        
+        norm_bbox = normalize_bbox([x0, new_top, x1, new_bottom], p_w, p_h)
+        
+        # 导出表格内容为 CSV 或 HTML
+        # table.export_to_dataframe() 需要 pandas
+        try:
+            df = table.export_to_dataframe()
+            content = df.to_csv(index=False)
+        except:
+            content = "Table content (export failed)"
+
+        pages_map[p_no].append({
+            "id": engine.generate_id(),
+            "page": p_no,
+            "type": "table",
+            "content": content,
+            "bbox": norm_bbox
+        })
+
+    # --- 处理图片 (Pictures) ---
+    if hasattr(doc, "pictures"):
+        for pic in doc.pictures:
+            if not hasattr(pic, "prov") or not pic.prov: continue
+            prov = pic.prov[0]
+            p_no = prov.page_no
+            if p_no not in pages_map: continue
+            
+            p_w = page_dims[p_no]["width"]
+            p_h = page_dims[p_no]["height"]
+            bbox = prov.bbox
+            
+            norm_bbox = normalize_bbox(
+                [bbox.l, p_h - bbox.t, bbox.r, p_h - bbox.b], 
+                p_w, p_h
+            )
+            
+            pages_map[p_no].append({
+                "id": engine.generate_id(),
+                "page": p_no,
+                "type": "image",
+                "content": "<image>",
+                "bbox": norm_bbox
+            })
+
+    # 构建页面列表
+    pages_data = []
+    for p_no in sorted(page_dims.keys()):
+        for element in pages_map.get(p_no, []):
+            element["page"] = p_no + page_offset
+        pages_data.append({
+            "page_number": p_no + page_offset,
+            "width": page_dims[p_no]["width"],
+            "height": page_dims[p_no]["height"],
+            "elements": pages_map.get(p_no, [])
+        })
+    return pages_data
+
+
+def convert_chunk(filepath, start, end, profile, pool=None):
+    """
+    转换第 start-end 页 (含两端)，返回 (DoclingDocument, page_offset)。
+    作为 worker 进程的入口时 pool 为 None，使用进程内的 _worker_pool。
+    """
+    global _worker_pool
+    if pool is None:
+        if _worker_pool is None:
+            _worker_pool = ConverterPool(1)
+        pool = _worker_pool
+    with pool.acquire(profile) as converter:
+        result = converter.convert(filepath, page_range=(start, end))
+    doc = result.document
+    # Docling 通常保留原文件的页码；如果这一段的页码从 1 开始，平移回原页码
+    page_offset = start - 1 if doc.pages and min(doc.pages) < start else 0
+    return doc, page_offset
 
-try:
-    from docling.document_converter import DocumentConverter
-    DOCLING_AVAILABLE = True
-except ImportError:
-    DOCLING_AVAILABLE = False
 
 class DoclingEngine(BasePDFEngine):
     """
@@ -14,15 +230,34 @@ class DoclingEngine(BasePDFEngine):
     功能：SOTA 级的文档布局分析、表格识别和 Markdown 导出
     """
     
-    def __init__(self):
+    def __init__(self, profile=DEFAULT_PROFILE, pool_size=DEFAULT_POOL_SIZE, cache_dir=DEFAULT_CACHE_DIR):
         super().__init__()
-        if DOCLING_AVAILABLE:
-            self.converter = DocumentConverter()
-        else:
-            self.converter = None
+        # 默认的 pipeline 配置 (fast / tables / accurate，见 docling_pool.py)，可被 profile 选项覆盖
+        self.profile = resolve_profile(profile)
+        # 按 profile 缓存的转换器，第一次用到时才构建
+        self.pool = ConverterPool(pool_size) if DOCLING_AVAILABLE else None
+        # 转换结果 (DoclingDocument 原生 JSON) 的缓存，导出按需从这里生成 (见 docling_cache.py)
+        self.cache = DocumentCache(cache_dir)
 
-    def parse(self, filepath):
+    def parse(self, filepath, profile=None, chunk_pages=None, workers=None, retries=None,
+              export=None, cache=True, **options):
+        """
+        profile:     pipeline 配置 "fast" / "tables" / "accurate"，默认 "tables"
+        chunk_pages: 按这么多页一段分块转换，结果按页序合并；某一块失败只重试这一块
+        workers:     并行转换各块的进程数 ("auto" 为全部 CPU 核)，> 1 时默认每块 20 页
+        retries:     每块失败后的重试次数，默认 1
+        export:      同时返回这些导出，如 "markdown" / "markdown,dict"；默认不导出，
+                     之后可通过 /documents/<document_id>/export?format=markdown 获取
+        cache:       "0" 时忽略已缓存的转换结果，重新转换
+        """
         self.element_counter = 0
+        profile = resolve_profile(profile, self.profile)
+        workers = resolve_workers(workers)
+        chunk_pages = int(chunk_pages) if chunk_pages else (DEFAULT_CHUNK_PAGES if workers > 1 else None)
+        if chunk_pages is not None and chunk_pages < 1:
+            raise ValueError("chunk_pages must be a positive integer")
+        retries = DEFAULT_CHUNK_RETRIES if retries in (None, "") else int(retries)
+        formats = parse_formats(export)
         
         if not DOCLING_AVAILABLE:
             return {
@@ -31,166 +266,134 @@ class DoclingEngine(BasePDFEngine):
             }
 
         try:
-            print(f"Docling parsing: {filepath} ...")
-            # 1. 执行转换
-            result = self.converter.convert(filepath)
-            # 获取 Docling 的文档对象
-            doc = result.document
-            
+            doc_id = document_id(filepath, profile)
+            parts = self.cache.load(doc_id) if parse_flag(cache) else None
+            cached = parts is not None
+            failed_pages = []
+            chunks = None
+
+            if cached:
+                print(f"Docling cache hit ({profile}): {filepath}")
+            elif chunk_pages is not None:
+                parts, failed_pages, chunks = self._convert_chunked(filepath, profile, chunk_pages, workers, retries)
+            else:
+                print(f"Docling parsing ({profile}): {filepath} ...")
+                # 执行转换 (从池中取该 profile 的转换器)
+                with self.pool.acquire(profile) as converter:
+                    result = converter.convert(filepath)
+                parts = [(result.document, 0)]
+
+            # 只缓存完整的结果：有失败块时下次仍重新转换
+            if not cached and not failed_pages:
+                self.cache.save(doc_id, parts, source=filepath)
+
             pages_data = []
-            
-            # 2. 导出为 JSON 字典格式，这样处理结构更稳定
-            # Docling 提供了 export_to_dict() 方法，这比直接访问对象属性更安全
-            doc_dict = doc.export_to_dict()
-            
-            # 获取页面尺寸信息 (Docling 的 export_to_dict 可能不直接包含每页宽高，需从对象获取)
-            # 我们先建立一个页面尺寸映射
-            page_dims = {}
-            for page_no, page_obj in doc.pages.items():
-                # page_obj.size.width / height
-                page_dims[page_no] = {
-                    "width": page_obj.size.width,
-                    "height": page_obj.size.height
-                }
-
-            # 3. 遍历解析后的所有文本/表格元素
-            # 在 export_to_dict() 的结构中，内容通常在 'texts', 'tables', 'pictures' 等字段
-            # 或者我们直接遍历 doc_dict['pages'] 如果存在的话
-            
-            # 新版 Docling 结构通常把所有元素扁平化放在 doc.texts 和 doc.tables 中，
-            # 并通过 prov (provenance) 字段关联到页面和坐标。
-            
-            # 初始化页面容器
-            pages_map = {}
-            for p_no in page_dims.keys():
-                pages_map[p_no] = []
-
-            # --- 处理文本 (Texts) ---
-            for item in doc.texts:
-                # item 是 TextItem 对象
-                # 它的 prov 属性是一个列表，包含位置信息
-                if not hasattr(item, "prov") or not item.prov:
-                    continue
-                
-                for prov in item.prov:
-                    p_no = prov.page_no
-                    if p_no not in pages_map: continue
-                    
-                    # 获取页面尺寸用于归一化
-                    p_w = page_dims[p_no]["width"]
-                    p_h = page_dims[p_no]["height"]
-                    
-                    # 坐标转换
-                    # Docling bbox: [l, b, r, t] (左, 底, 右, 顶) - 原点在左下角
-                    bbox = prov.bbox
-                    x0, y0, x1, y1 = bbox.l, bbox.b, bbox.r, bbox.t
-                    
-                    # 转换为 Top-Left (Web) 坐标系
-                    # New Top = Height - Old Top (y1)
-                    # New Bottom = Height - Old Bottom (y0)
-                    new_top = p_h - y1
-                    new_bottom = p_h - y0
-                    
-                    norm_bbox = normalize_bbox([x0, new_top, x1, new_bottom], p_w, p_h)
-                    
-                    # 确定类型
-                    el_type = "text"
-                    if item.label == "section_header" or item.label == "title":
-                        el_type = "heading"
-                    elif item.label == "code":
-                        el_type = "code"
-                    elif item.label == "formula":
-                        el_type = "formula"
-                        
-                    pages_map[p_no].append({
-                        "id": self.generate_id(),
-                        "page": p_no,
-                        "type": el_type,
-                        "content": item.text,
-                        "bbox": norm_bbox
-                    })
-
-            # --- 处理表格 (Tables) ---
-            for table in doc.tables:
-                if not hasattr(table, "prov") or not table.prov:
-                    continue
-                    
-                # 表格通常只有一个主要位置
-                prov = table.prov[0]
-                p_no = prov.page_no
-                if p_no not in pages_map: continue
-
-                p_w = page_dims[p_no]["width"]
-                p_h = page_dims[p_no]["height"]
-                
-                bbox = prov.bbox
-                x0, y0, x1, y1 = bbox.l, bbox.b, bbox.r, bbox.t
-                
-                new_top = p_h - y1
-                new_bottom = p_h - y0
-                
-                norm_bbox = normalize_bbox([x0, new_top, x1, new_bottom], p_w, p_h)
-                
-                # 导出表格内容为 CSV 或 HTML
-                # table.export_to_dataframe() 需要 pandas
-                try:
-                    df = table.export_to_dataframe()
-                    content = df.to_csv(index=False)
-                except:
-                    content = "Table content (export failed)"
-
-                pages_map[p_no].append({
-                    "id": self.generate_id(),
-                    "page": p_no,
-                    "type": "table",
-                    "content": content,
-                    "bbox": norm_bbox
-                })
-
-            # --- 处理图片 (Pictures) ---
-            if hasattr(doc, "pictures"):
-                for pic in doc.pictures:
-                    if not hasattr(pic, "prov") or not pic.prov: continue
-                    prov = pic.prov[0]
-                    p_no = prov.page_no
-                    if p_no not in pages_map: continue
-                    
-                    p_w = page_dims[p_no]["width"]
-                    p_h = page_dims[p_no]["height"]
-                    bbox = prov.bbox
-                    
-                    norm_bbox = normalize_bbox(
-                        [bbox.l, p_h - bbox.t, bbox.r, p_h - bbox.b], 
-                        p_w, p_h
-                    )
-                    
-                    pages_map[p_no].append({
-                        "id": self.generate_id(),
-                        "page": p_no,
-                        "type": "image",
-                        "content": "<image>",
-                        "bbox": norm_bbox
-                    })
-
-            # 4. 构建最终响应
-            for p_no in sorted(page_dims.keys()):
-                pages_data.append({
-                    "page_number": p_no,
-                    "width": page_dims[p_no]["width"],
-                    "height": page_dims[p_no]["height"],
-                    "elements": pages_map.get(p_no, [])
-                })
-
-            # 导出 Markdown
-            markdown_output = doc.export_to_markdown()
-            
-            return {
-                "metadata": {"full_markdown": markdown_output},
+            for doc, page_offset in parts:
+                pages_data.extend(document_pages(doc, self, page_offset))
+
+            response = {
+                "metadata": {},
                 "pages": pages_data,
+                "profile": profile,
+                "document_id": doc_id,
+                "cached": cached,
                 "engine": "Docling (Real SOTA)"
             }
+            if chunks is not None:
+                response["chunks"] = chunks
+                response["failed_pages"] = failed_pages
+            if formats:
+                response["exports"] = {fmt: self.cache.export(parts, fmt) for fmt in formats}
+            return response
 
         except Exception as e:
             import traceback
             traceback.print_exc()
-            return {"error": f"Docling parsing failed: {str(e)}", "pages": []}
\ No newline at end of file
+            return {"error": f"Docling parsing failed: {str(e)}", "pages": []}
+
+    def warm(self, infer=True):
+        """
+        服务启动时预先构建默认 profile 的转换器并加载模型 (见 app.warm_up)。
+        只加载不做推理，infer 只是为了与其它引擎的 warm 接口一致。
+        """
+        if not DOCLING_AVAILABLE:
+            raise ImportError("Docling library not installed.")
+        start = time.perf_counter()
+        self.pool.warm((self.profile,))
+        return time.perf_counter() - start
+
+    def export(self, doc_id, fmt="markdown"):
+        """从缓存的转换结果生成导出；没有缓存时返回 None"""
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"export format must be one of {tuple(EXPORT_FORMATS)}")
+        parts = self.cache.load(doc_id)
+        if parts is None:
+            return None
+        return self.cache.export(parts, fmt)
+
+    def _convert_in_workers(self, chunks, workers, profile):
+        """在该 profile 的共享进程池中转换各块，返回与 chunks 等长的结果列表，失败的块对应位置为异常对象"""
+        executor = chunk_executor(workers, profile)
+        try:
+            futures = [executor.submit(convert_chunk, *chunk) for chunk in chunks]
+        except BrokenProcessPool as e:
+            _discard_executor(executor)
+            return [e] * len(chunks)
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result())
+            except BrokenProcessPool as e:
+                _discard_executor(executor)
+                outcomes.append(e)
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+
+    def _convert_chunked(self, filepath, profile, chunk_pages, workers, retries):
+        """
+        把文档按 chunk_pages 页一段分块，workers > 1 时在共享的进程池中并行转换 (见 chunk_executor)。
+        失败的块单独重试 retries 次，仍失败的块的页面记录在 failed_pages 中，其余结果照常返回。
+        返回 (parts, failed_pages, chunks 统计)，parts 按页序排列。
+        """
+        page_count = get_geometry(filepath)["page_count"]
+        chunks = [
+            (filepath, start, min(start + chunk_pages - 1, page_count), profile)
+            for start in range(1, page_count + 1, chunk_pages)
+        ]
+        print(f"Docling parsing ({profile}): {filepath} in {len(chunks)} chunks ...")
+
+        results = {}
+        pending = list(chunks)
+        errors = {}
+        for attempt in range(retries + 1):
+            if not pending:
+                break
+            if workers > 1:
+                outcomes = self._convert_in_workers(pending, workers, profile)
+            else:
+                outcomes = []
+                for chunk in pending:
+                    try:
+                        outcomes.append(convert_chunk(*chunk, pool=self.pool))
+                    except Exception as e:
+                        outcomes.append(e)
+            failed = []
+            for chunk, outcome in zip(pending, outcomes):
+                if isinstance(outcome, Exception):
+                    print(f"Docling chunk {chunk[1]}-{chunk[2]} failed (attempt {attempt + 1}): {outcome}")
+                    errors[chunk] = str(outcome)
+                    failed.append(chunk)
+                else:
+                    results[chunk] = outcome
+                    errors.pop(chunk, None)
+            pending = failed
+
+        parts = [results[chunk] for chunk in chunks if chunk in results]
+        failed_pages = [
+            {"page": page, "error": errors[chunk]}
+            for chunk in chunks if chunk in errors
+            for page in range(chunk[1], chunk[2] + 1)
+        ]
+        stats = {"count": len(chunks), "pages": chunk_pages, "workers": max(1, min(workers, len(chunks)))}
+        return parts, failed_pages, stats
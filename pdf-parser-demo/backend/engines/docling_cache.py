@@ -0,0 +1,185 @@
+"""
+Docling 结果缓存：按 (文件内容哈希, profile) 保存 DoclingDocument 的原生 JSON
+
+解析时不再导出 dict / markdown：响应里只有页面元素和 document_id，
+markdown、dict、html 等导出在真正需要时从缓存的 DoclingDocument 生成
+(解析选项 export=markdown，或 /documents/<document_id>/export?format=markdown)。
+同一文件用同一 profile 再次解析时直接读缓存，不再重新转换。
+
+分块转换 (见 DoclingEngine._convert_chunked) 得到多个 DoclingDocument，按页序作为多个 part 保存，
+导出时逐个导出再拼接。
+
+缓存有上限：每次写入后按最近使用时间 (文件 mtime，读缓存时会更新) 淘汰最旧的条目，直到条目数和总大小都在上限内；
+每个条目记录产生它的上传文件 (<document_id>.sources)，这些上传文件都已删除的条目先淘汰。
+"""
+
+import json
+import os
+import re
+
+from .docling_pool import PROFILES
+from .geometry import get_geometry
+
+try:
+    from docling_core.types.doc import DoclingDocument
+except ImportError:
+    DoclingDocument = None
+
+DEFAULT_CACHE_DIR = os.environ.get("DOCLING_CACHE_DIR", os.path.join("uploads", "docling_cache"))
+# 缓存条目数 / 总大小 (MB) 的上限
+DEFAULT_MAX_ENTRIES = int(os.environ.get("DOCLING_CACHE_MAX_ENTRIES", 200))
+DEFAULT_MAX_MB = float(os.environ.get("DOCLING_CACHE_MAX_MB", 1024))
+SOURCES_SUFFIX = ".sources"
+
+# format -> DoclingDocument 的导出方法
+EXPORT_FORMATS = {
+    "markdown": "export_to_markdown",
+    "text": "export_to_text",
+    "html": "export_to_html",
+    "doctags": "export_to_doctags",
+    "dict": "export_to_dict",
+}
+
+_DOCUMENT_ID = re.compile(r"^[0-9a-f]{40}-(%s)$" % "|".join(PROFILES))
+
+
+def document_id(filepath, profile):
+    return f"{get_geometry(filepath)['sha1']}-{profile}"
+
+
+def parse_formats(value):
+    """export 选项："markdown,dict" -> ["markdown", "dict"]"""
+    if not value:
+        return []
+    formats = [f.strip() for f in value.split(",") if f.strip()] if isinstance(value, str) else list(value)
+    for fmt in formats:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"export format must be one of {tuple(EXPORT_FORMATS)}")
+    return formats
+
+
+class DocumentCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES, max_mb=DEFAULT_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = float(max_mb) * 1024 * 1024
+
+    def _path(self, doc_id):
+        if not _DOCUMENT_ID.match(doc_id):
+            raise ValueError(f"Invalid document id: {doc_id}")
+        return os.path.join(self.cache_dir, doc_id + ".json")
+
+    def save(self, doc_id, parts, source=None):
+        """parts: 按页序排列的 (DoclingDocument, page_offset) 列表；source: 产生该结果的上传文件路径"""
+        path = self._path(doc_id)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write('{"page_offsets": %s, "parts": [' % json.dumps([offset for _, offset in parts]))
+                for i, (doc, _) in enumerate(parts):
+                    if i:
+                        f.write(",")
+                    # 原生序列化 (pydantic)，可以无损地加载回 DoclingDocument
+                    f.write(doc.model_dump_json())
+                f.write("]}")
+            os.replace(tmp, path)
+            if source:
+                self._add_source(doc_id, source)
+        except OSError as e:
+            print(f"Docling cache write failed: {e}")
+            return
+        self.evict(keep=doc_id)
+
+    def _add_source(self, doc_id, source):
+        sources_path = os.path.join(self.cache_dir, doc_id + SOURCES_SUFFIX)
+        source = os.path.abspath(source)
+        if source not in self._sources(doc_id):
+            with open(sources_path, "a", encoding="utf-8") as f:
+                f.write(source + "\n")
+
+    def _sources(self, doc_id):
+        try:
+            with open(os.path.join(self.cache_dir, doc_id + SOURCES_SUFFIX), encoding="utf-8") as f:
+                return [line.rstrip("\n") for line in f if line.strip()]
+        except OSError:
+            return []
+
+    def _remove(self, doc_id):
+        for suffix in (".json", SOURCES_SUFFIX):
+            try:
+                os.remove(os.path.join(self.cache_dir, doc_id + suffix))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Docling cache eviction failed ({doc_id}): {e}")
+
+    def evict(self, keep=None):
+        """
+        先删掉上传文件都已不存在的条目，再按 mtime 从旧到新删除，直到条目数和总大小都不超过上限。
+        keep (刚写入的条目) 不删除。返回删除的 document_id 列表。
+        """
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return []
+        for name in names:
+            doc_id = name[:-len(".json")]
+            if not name.endswith(".json") or not _DOCUMENT_ID.match(doc_id):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, doc_id))
+
+        removed = []
+        alive = []
+        for entry in entries:
+            sources = self._sources(entry[2])
+            if entry[2] != keep and sources and not any(os.path.exists(s) for s in sources):
+                removed.append(entry[2])
+            else:
+                alive.append(entry)
+        alive.sort()
+        count = len(alive)
+        total = sum(size for _, size, _ in alive)
+        for _, size, doc_id in alive:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            if doc_id == keep:
+                continue
+            removed.append(doc_id)
+            count -= 1
+            total -= size
+        for doc_id in removed:
+            self._remove(doc_id)
+        return removed
+
+    def load(self, doc_id):
+        """返回 (DoclingDocument, page_offset) 列表；没有缓存时返回 None"""
+        path = self._path(doc_id)
+        if DoclingDocument is None or not os.path.isfile(path):
+            return None
+        try:
+            # 记录最近使用时间，淘汰时按它排序
+            os.utime(path)
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            return [
+                (DoclingDocument.model_validate(part), offset)
+                for part, offset in zip(data["parts"], data["page_offsets"])
+            ]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Docling cache read failed ({doc_id}): {e}")
+            return None
+
+    def export(self, parts, fmt):
+        method = EXPORT_FORMATS.get(fmt)
+        if method is None:
+            raise ValueError(f"export format must be one of {tuple(EXPORT_FORMATS)}")
+        outputs = [getattr(doc, method)() for doc, _ in parts]
+        if fmt == "dict":
+            return outputs[0] if len(outputs) == 1 else {"parts": outputs}
+        return "\n\n".join(outputs)
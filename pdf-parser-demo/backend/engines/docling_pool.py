@@ -0,0 +1,115 @@
+"""
+Docling 转换器池：按 pipeline 配置 (profile) 缓存建好的 DocumentConverter
+
+Docling 的开销主要由 pipeline 选项决定 (见根目录 docling_test.py)：OCR、TableFormer 表格结构识别、
+页面图片生成。大部分文档本身有文字层，不需要为 OCR 和页面图片付出代价。
+每个 profile 对应一组固定的选项，转换器第一次用到时才构建 (模型在第一次 convert 时加载)，
+之后放回池中复用；每个 profile 最多同时存在 size 个转换器，超过时请求等待空闲的转换器。
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import PdfPipelineOptions, TableFormerMode
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+    DOCLING_AVAILABLE = True
+except ImportError:
+    DOCLING_AVAILABLE = False
+
+# fast:     只做版面分析，不识别表格结构、不 OCR、不生成页面图片
+# tables:   加上 TableFormer (FAST 模式)，适合有文字层的普通文档
+# accurate: TableFormer ACCURATE + OCR，用于扫描件 / 文字层不可靠的文档
+PROFILES = {
+    "fast": {"do_ocr": False, "do_table_structure": False, "table_mode": None},
+    "tables": {"do_ocr": False, "do_table_structure": True, "table_mode": "fast"},
+    "accurate": {"do_ocr": True, "do_table_structure": True, "table_mode": "accurate"},
+}
+DEFAULT_PROFILE = "tables"
+
+# 每个 profile 最多同时存在的转换器数量 (每个都持有一份模型)
+DEFAULT_POOL_SIZE = int(os.environ.get("DOCLING_POOL_SIZE", 1) or 1)
+
+
+def resolve_profile(value, default=DEFAULT_PROFILE):
+    profile = value or default
+    if profile not in PROFILES:
+        raise ValueError(f"profile must be one of {tuple(PROFILES)}")
+    return profile
+
+
+def pipeline_options(profile):
+    settings = PROFILES[profile]
+    options = PdfPipelineOptions()
+    options.do_ocr = settings["do_ocr"]
+    options.do_table_structure = settings["do_table_structure"]
+    if settings["table_mode"] == "accurate":
+        options.table_structure_options.mode = TableFormerMode.ACCURATE
+    elif settings["table_mode"] == "fast":
+        options.table_structure_options.mode = TableFormerMode.FAST
+    # 引擎只用到元素坐标，不需要页面 / 图片的位图
+    options.generate_page_images = False
+    options.generate_picture_images = False
+    return options
+
+
+def build_converter(profile):
+    return DocumentConverter(
+        format_options={
+            InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options(profile))
+        }
+    )
+
+
+class ConverterPool:
+    """线程安全：Flask 的多个请求线程可以同时 acquire，同一个转换器同一时间只给一个请求使用"""
+
+    def __init__(self, size=DEFAULT_POOL_SIZE):
+        self.size = max(1, int(size))
+        self._cond = threading.Condition()
+        self._idle = {}
+        self._created = {}
+
+    @contextmanager
+    def acquire(self, profile):
+        converter = self._take(profile)
+        try:
+            yield converter
+        finally:
+            with self._cond:
+                self._idle[profile].append(converter)
+                self._cond.notify()
+
+    def _take(self, profile):
+        with self._cond:
+            while True:
+                idle = self._idle.setdefault(profile, [])
+                if idle:
+                    return idle.pop()
+                if self._created.get(profile, 0) < self.size:
+                    self._created[profile] = self._created.get(profile, 0) + 1
+                    break
+                self._cond.wait()
+        # 构建转换器不持有锁，其它 profile 的请求不受影响
+        try:
+            return build_converter(profile)
+        except Exception:
+            with self._cond:
+                self._created[profile] -= 1
+                self._cond.notify()
+            raise
+
+    def warm(self, profiles=(DEFAULT_PROFILE,)):
+        """预先构建这些 profile 的转换器并加载模型，避免第一个请求承担加载时间"""
+        for profile in profiles:
+            with self.acquire(resolve_profile(profile)) as converter:
+                converter.initialize_pipeline(InputFormat.PDF)
+
+    def stats(self):
+        with self._cond:
+            return {
+                profile: {"created": created, "idle": len(self._idle.get(profile, []))}
+                for profile, created in self._created.items()
+            }
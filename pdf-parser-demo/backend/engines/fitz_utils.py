@@ -0,0 +1,240 @@
+"""
+PyMuPDF 公共工具
+
+page.get_text("dict") 默认带 TEXT_PRESERVE_IMAGES，会把每个内嵌图片解码并复制到图片块的
+"image" 字段里，而引擎只用到图片的 bbox。这里提供不带像素数据的块提取：文本块和图片元数据
+取自同一个 TextPage，图片只在前端真正请求时才按需渲染 (见 app.py 的 /uploads/<filename>/image)。
+"""
+
+import fitz  # PyMuPDF
+
+from . import raster
+
+mupdf = fitz.mupdf
+
+# 与 get_text("dict") 的默认 flags 相同：TextPage 里保留图片块 (只是引用，不复制像素)
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT
+
+# 按需渲染 (/uploads/<filename>/image) 的缩放范围和输出像素上限 (约 120MB RGB)，防止一次请求渲染出巨大的位图
+MIN_RENDER_SCALE = 0.1
+MAX_RENDER_SCALE = 4.0
+MAX_RENDER_PIXELS = 40_000_000
+
+# PyMuPDF 缺少底层接口时的提示只打印一次
+_lowlevel_warned = False
+
+
+def _image_xrefs(page):
+    """
+    {fz_image 指针: xref}。MuPDF 按对象缓存已加载的图片，TextPage 的图片块引用的就是同一个 fz_image，
+    所以按指针对应 page.get_images() 的 xref，不解码像素。对不上的 (内联图片等) xref 为 0。
+    """
+    pdf = mupdf.pdf_specifics(page.parent.this)
+    xrefs = {}
+    for item in page.get_images():
+        try:
+            image = mupdf.pdf_load_image(pdf, mupdf.pdf_new_indirect(pdf, item[0], 0))
+        except mupdf.FzErrorBase:
+            continue
+        xrefs[image.m_internal_value()] = item[0]
+    return xrefs
+
+
+def _image_block(number, block, xrefs):
+    image = block.i_image()
+    colorspace = image.colorspace()
+    return {
+        "type": 1,
+        "number": number,
+        "bbox": fitz.JM_py_from_rect(block.m_internal.bbox),
+        "xref": xrefs.get(image.m_internal_value(), 0),
+        "width": image.w(),
+        "height": image.h(),
+        "colorspace": mupdf.fz_colorspace_n(colorspace) if colorspace.m_internal else 0,
+    }
+
+
+def _text_block(number, block, buff, tp_rect, infinite):
+    """同 PyMuPDF 的 JM_make_text_block：逐行调用 C 实现的 JM_make_spanlist，块 bbox 为各行的并集"""
+    lines = []
+    block_rect = mupdf.FzRect(mupdf.FzRect.Fixed_EMPTY)
+    for line in block:
+        if not infinite and mupdf.fz_is_empty_rect(mupdf.fz_intersect_rect(tp_rect, mupdf.FzRect(line.m_internal.bbox))):
+            continue
+        line_dict = {}
+        line_rect = fitz.JM_make_spanlist(line_dict, line, False, buff, tp_rect)
+        block_rect = mupdf.fz_union_rect(block_rect, line_rect)
+        line_dict["wmode"] = line.m_internal.wmode
+        line_dict["dir"] = fitz.JM_py_from_point(line.m_internal.dir)
+        line_dict["bbox"] = fitz.JM_py_from_rect(line_rect)
+        lines.append(line_dict)
+    # "flags" 是段落对齐方式，只有 TEXT_SEGMENT 时 MuPDF 才会分析，TEXT_FLAGS 下总是 0 (UNKNOWN)
+    return {"type": 0, "number": number, "flags": 0, "bbox": fitz.JM_py_from_rect(block_rect), "lines": lines}
+
+
+def _textpage_blocks(page, textpage):
+    """
+    按 extractDICT 的规则 (JM_make_textpage_dict) 逐块生成：文本行交给同一个 C 实现，
+    图片块只读元数据，跳过 "image" 字段的像素复制。用的是 PyMuPDF 的底层接口。
+    """
+    stext = textpage.this
+    tp_rect = mupdf.FzRect(stext.m_internal.mediabox)
+    infinite = mupdf.fz_is_infinite_rect(tp_rect)
+    buff = mupdf.fz_new_buffer(128)
+    xrefs = None
+    blocks = []
+    for block in stext:
+        bbox = mupdf.FzRect(block.m_internal.bbox)
+        is_image = block.m_internal.type == mupdf.FZ_STEXT_BLOCK_IMAGE
+        # 与 extractDICT 一样，number 是输出序列中的位置：跳过的块不占序号
+        number = len(blocks)
+        if not infinite:
+            # 超出页面的图片不输出
+            if is_image and not mupdf.fz_contains_rect(tp_rect, bbox):
+                continue
+            if mupdf.fz_is_empty_rect(mupdf.fz_intersect_rect(tp_rect, bbox)):
+                continue
+        if is_image:
+            if xrefs is None:
+                xrefs = _image_xrefs(page)
+            blocks.append(_image_block(number, block, xrefs))
+        else:
+            blocks.append(_text_block(number, block, buff, tp_rect, infinite))
+    return blocks
+
+
+def get_blocks(page, textpage=None):
+    """
+    等价于 page.get_text("dict")["blocks"]，顺序也相同，
+    但图片块 (type == 1) 只包含元数据：bbox / xref / width / height / colorspace，没有 "image" 字段。
+    textpage 需以 TEXT_FLAGS 创建 (见 PageAnalysis)。
+    """
+    global _lowlevel_warned
+    if textpage is None:
+        textpage = page.get_textpage(flags=TEXT_FLAGS)
+    try:
+        return _textpage_blocks(page, textpage)
+    except AttributeError:
+        # PyMuPDF 改了底层接口：退回 extractDICT，结果相同，只是多复制一遍图片像素
+        if not _lowlevel_warned:
+            _lowlevel_warned = True
+            print("PyMuPDF low-level text block API not available, image pixels will be copied")
+    blocks = page.get_text("dict", textpage=textpage).get("blocks", [])
+    for block in blocks:
+        if block["type"] == 1:
+            for key in list(block):
+                if key not in ("type", "number", "bbox", "width", "height", "colorspace"):
+                    del block[key]
+            block["xref"] = 0
+    return blocks
+
+
+def get_image_infos(page, textpage=None):
+    """页面上图片的元数据 (number / bbox / width / height / colorspace / xref)，不解码也不复制像素"""
+    return [block for block in get_blocks(page, textpage) if block["type"] == 1]
+
+
+class PageAnalysis:
+    """
+    单页共享分析：一个 TextPage + 一份 drawings 列表。
+    表格预筛选、文本块、图片 (含 xref)、链接都从这里读取，各自只在第一次用到时计算，
+    避免同一页被 PyMuPDF 反复解析。页面处理完后调用 close() (或用 with) 立即释放。
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self._textpage = None
+        self._drawings = None
+        self._blocks = None
+        self._words = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def textpage(self):
+        if self._textpage is None:
+            self._textpage = self.page.get_textpage(flags=TEXT_FLAGS)
+        return self._textpage
+
+    @property
+    def drawings(self):
+        if self._drawings is None:
+            self._drawings = self.page.get_drawings()
+        return self._drawings
+
+    def blocks(self):
+        if self._blocks is None:
+            self._blocks = get_blocks(self.page, textpage=self.textpage)
+        return self._blocks
+
+    def words(self):
+        if self._words is None:
+            self._words = self.textpage.extractWORDS()
+        return self._words
+
+    def find_tables(self, clip=None, **settings):
+        # 矢量图形直接复用，不再重复 get_drawings()。字符表仍由 find_tables 自己建：它需要
+        # TEXT_ACCURATE_BBOXES / TEXT_COLLECT_STYLES 的 rawdict，而且遇到图片块会出错，不能共用 self.textpage
+        return self.page.find_tables(clip=clip, paths=self.drawings, **settings)
+
+    def links(self):
+        """页面上的链接及其覆盖的文字 (取中心点落在链接区域内的词)"""
+        links = []
+        for link in self.page.get_links():
+            rect = link.get("from")
+            if rect is None:
+                continue
+            x0, y0, x1, y1 = rect
+            text = " ".join(
+                w[4] for w in self.words()
+                if x0 <= (w[0] + w[2]) / 2 <= x1 and y0 <= (w[1] + w[3]) / 2 <= y1
+            )
+            links.append({
+                "bbox": tuple(rect),
+                "uri": link.get("uri"),
+                "target_page": link["page"] + 1 if link.get("page", -1) >= 0 else None,
+                "text": text,
+            })
+        return links
+
+    def close(self):
+        self._textpage = None
+        self._drawings = None
+        self._blocks = None
+        self._words = None
+
+
+def render_image(filepath, page_number, xref=None, clip=None, scale=2):
+    """
+    按需渲染单个图片元素，返回 PNG 字节：
+    - xref: 直接解码内嵌图片 (原始分辨率)
+    - clip: 按 PDF 坐标 (x0, y0, x1, y1) 截取页面区域，适用于内联图片 (xref == 0) 或矢量图
+    参数不合法 (页码、缩放、裁剪区域超出范围) 或 MuPDF 渲染失败时抛出 ValueError。
+    """
+    if not MIN_RENDER_SCALE <= scale <= MAX_RENDER_SCALE:
+        raise ValueError(f"scale must be between {MIN_RENDER_SCALE:g} and {MAX_RENDER_SCALE:g}")
+    doc = fitz.open(filepath)
+    try:
+        if not 1 <= page_number <= doc.page_count:
+            raise ValueError(f"Page {page_number} out of range")
+        if xref:
+            pix = fitz.Pixmap(doc, xref)
+        elif clip is not None:
+            page = doc[page_number - 1]
+            rect = fitz.Rect(clip) & page.rect
+            if rect.is_empty:
+                raise ValueError("bbox does not intersect the page")
+            if rect.width * rect.height * scale * scale > MAX_RENDER_PIXELS:
+                raise ValueError("Requested image is too large, use a smaller bbox or scale")
+            pix = raster.render(page, rect, scale)
+        else:
+            raise ValueError("Either xref or clip is required")
+        return raster.to_png(pix)
+    except fitz.mupdf.FzErrorBase as e:
+        raise ValueError(f"Render failed: {e}") from e
+    finally:
+        doc.close()
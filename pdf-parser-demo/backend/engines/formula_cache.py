@@ -0,0 +1,155 @@
+"""
+公式识别结果缓存：键为 (渲染后裁剪图的像素哈希, 模型名, 解码参数)
+
+期刊模板里同样的公式、logo、页眉装饰图会在很多页、很多次上传中反复出现，
+每次都重新跑一遍 beam search。渲染是确定性的 (同一区域、同一缩放得到同样的像素)，
+所以用像素的精确哈希作键：进程内是 LRU，磁盘上是 sqlite (多个进程 / 重启后共用)。
+模型或解码参数变了，键随之变化，旧结果不会被误用 (旧键不再被读到，最终被淘汰)。
+sqlite 里每行记录最后读写时间，写入后行数超过上限时删掉最久没用到的行。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_PATH = os.environ.get("FORMULA_CACHE_PATH", os.path.join("uploads", "formula_cache.sqlite"))
+# 进程内最多保留的条目数 (每条只是一段 LaTeX)
+DEFAULT_CACHE_SIZE = int(os.environ.get("FORMULA_CACHE_SIZE", 4096) or 4096)
+# sqlite 最多保留的行数 (每行约几百字节)
+DEFAULT_MAX_ROWS = int(os.environ.get("FORMULA_CACHE_MAX_ROWS", 100000) or 100000)
+
+
+def image_hash(image):
+    """PIL 图片像素的 sha1 (含模式和尺寸，避免不同形状的相同字节冲突)"""
+    digest = hashlib.sha1(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class FormulaCache:
+    """
+    线程安全。path 为 None 时只用内存。
+    只缓存识别成功的结果 (包括识别出空串)；识别出错的图片下次仍会重试。
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, size=DEFAULT_CACHE_SIZE, max_rows=DEFAULT_MAX_ROWS):
+        self.path = path
+        self.size = max(1, int(size))
+        self.max_rows = max(1, int(max_rows))
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self):
+        # 调用方已持有锁
+        if self._conn is None and self.path:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS formulas "
+                    "(key TEXT PRIMARY KEY, latex TEXT NOT NULL, accessed REAL NOT NULL DEFAULT 0)"
+                )
+                # 旧版本建的表没有 accessed 列：补上，旧行按最久没用到处理
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(formulas)")]
+                if "accessed" not in columns:
+                    conn.execute("ALTER TABLE formulas ADD COLUMN accessed REAL NOT NULL DEFAULT 0")
+                conn.execute("CREATE INDEX IF NOT EXISTS formulas_accessed ON formulas (accessed)")
+                conn.commit()
+                self._conn = conn
+            except (OSError, sqlite3.Error) as e:
+                # 磁盘不可用时退化为只用内存
+                print(f"Formula cache disabled on disk ({self.path}): {e}")
+                self.path = None
+        return self._conn
+
+    def _remember(self, key, latex):
+        self._memory[key] = latex
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys):
+        """返回 {key: latex}，只含命中的键"""
+        found = {}
+        with self._lock:
+            missing = []
+            for key in dict.fromkeys(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    missing.append(key)
+            db = self._db() if missing else None
+            if db is not None:
+                try:
+                    for start in range(0, len(missing), 500):
+                        batch = missing[start:start + 500]
+                        rows = db.execute(
+                            "SELECT key, latex FROM formulas WHERE key IN (%s)" % ",".join("?" * len(batch)),
+                            batch,
+                        ).fetchall()
+                        for key, latex in rows:
+                            found[key] = latex
+                            self._remember(key, latex)
+                except sqlite3.Error as e:
+                    print(f"Formula cache read failed: {e}")
+            # 命中的行 (包括进程内命中的) 刷新最后使用时间，淘汰时保留常用的公式
+            db = self._db() if found else None
+            if db is not None:
+                try:
+                    now = time.time()
+                    db.executemany("UPDATE formulas SET accessed = ? WHERE key = ?", [(now, key) for key in found])
+                    db.commit()
+                except sqlite3.Error as e:
+                    print(f"Formula cache write failed: {e}")
+        return found
+
+    def put_many(self, items):
+        """items: {key: latex}"""
+        if not items:
+            return
+        with self._lock:
+            for key, latex in items.items():
+                self._remember(key, latex)
+            db = self._db()
+            if db is not None:
+                try:
+                    now = time.time()
+                    db.executemany(
+                        "INSERT OR REPLACE INTO formulas (key, latex, accessed) VALUES (?, ?, ?)",
+                        [(key, latex, now) for key, latex in items.items()],
+                    )
+                    excess = db.execute("SELECT COUNT(*) FROM formulas").fetchone()[0] - self.max_rows
+                    if excess > 0:
+                        db.execute(
+                            "DELETE FROM formulas WHERE key IN "
+                            "(SELECT key FROM formulas ORDER BY accessed LIMIT ?)",
+                            (excess,),
+                        )
+                    db.commit()
+                except sqlite3.Error as e:
+                    print(f"Formula cache write failed: {e}")
+
+    def record(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self):
+        """进程启动以来的累计命中率"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else None,
+            }
@@ -0,0 +1,163 @@
+"""
+公式候选筛选：在昂贵的 LaTeX-OCR 之前，用几何和像素特征排除明显不是公式的图片块
+
+原来每个图片块 (照片、图表、扫描整页、logo) 都要 2 倍渲染再跑 beam search，
+之后才根据输出判断像不像 LaTeX。这里先看 bbox (相对正文行高的高度、宽高比)，
+几何上可能是公式的再以 1 倍分辨率渲染一张小图，计算：
+- ink:        墨迹 (深色像素) 占比，照片 / 填充图形很高，空白图很低
+- colour:     平均色度 (max(R,G,B) - min(R,G,B))，公式是单色的，照片和彩色图表不是
+- components: 墨迹的连通域数 (字形数)，公式至少有一个，噪点纹理会有非常多
+
+任何一项不满足就跳过 OCR，原因写在元素的 skip_reasons 里。阈值见下方常量，
+可用 bench_engines.py latexocr-candidates 在带标注的数据上检查精确率 / 召回率。
+"""
+
+import numpy as np
+import fitz  # PyMuPDF
+
+from . import raster
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+# 特征图的渲染倍率 (72 dpi)：10pt 正文约 10 像素高，足够区分字形
+FEATURE_SCALE = 1.0
+# 页面上没有文字层 (扫描件) 时假定的正文字号
+DEFAULT_BODY_SIZE = 10.0
+
+# 几何规则 (以正文字号为单位)
+MAX_LINES = 6.0         # 高于 6 行正文：图、照片、整页扫描 (3x3 矩阵约 4.5 行)
+MIN_SIZE = 0.4          # 宽或高小于 0.4 个字号：装饰性的点、线
+MIN_ASPECT = 0.25       # 宽 / 高 过小：竖条
+# 像素规则
+INK_THRESHOLD = 160     # 灰度低于此值算墨迹 (抗锯齿的字形边缘较浅)
+MIN_INK = 0.005
+MAX_INK = 0.25
+MAX_COLOUR = 0.05
+# 噪点纹理：连通域很多且密度很高 (每个 "字号 x 字号" 方格内的连通域数)。
+# 低分辨率下一个字形可能断成几段，小公式的密度也会偏高，所以同时要求总数足够多
+MIN_NOISY_COMPONENTS = 20
+MAX_COMPONENTS_PER_CELL = 4.0
+
+SKIP_REASONS = (
+    "too_tall", "too_small", "too_narrow", "blank", "dense_ink", "colourful", "noisy",
+)
+
+
+def body_text_size(blocks, default=DEFAULT_BODY_SIZE):
+    """页面正文字号：按字符数加权的 span 字号中位数"""
+    sizes = []
+    for block in blocks:
+        if block.get("type") != 0:
+            continue
+        for line in block["lines"]:
+            for span in line["spans"]:
+                count = len(span["text"].strip())
+                if count and span["size"] > 0:
+                    sizes.append((span["size"], count))
+    if not sizes:
+        return default
+    sizes.sort()
+    half = sum(count for _, count in sizes) / 2
+    seen = 0
+    for size, count in sizes:
+        seen += count
+        if seen >= half:
+            return size
+    return default
+
+
+def geometry_features(width, height, body_size):
+    """bbox 宽高 (pt) -> 以正文字号为单位的特征"""
+    return {
+        "lines": round(height / body_size, 2),
+        "width": round(width / body_size, 2),
+        "aspect": round(width / height, 2) if height > 0 else 0.0,
+    }
+
+
+def pixel_features(samples, cell_pixels):
+    """
+    samples: H x W x 3 的 uint8 数组 (RGB)。cell_pixels: 正文字号对应的像素数。
+    返回 ink / colour / components (没有 OpenCV 时 components 为 None)。
+    """
+    rgb = samples.astype(np.int16)
+    gray = rgb.mean(axis=2)
+    ink = gray < INK_THRESHOLD
+    chroma = (rgb.max(axis=2) - rgb.min(axis=2)) / 255.0
+    components = None
+    if CV2_AVAILABLE:
+        count, _ = cv2.connectedComponents(ink.astype(np.uint8), connectivity=8)
+        components = count - 1  # 去掉背景
+    cells = max(1.0, samples.shape[0] * samples.shape[1] / float(cell_pixels * cell_pixels))
+    return {
+        "ink": round(float(ink.mean()), 4),
+        "colour": round(float(chroma.mean()), 4),
+        "components": components,
+        "components_per_cell": None if components is None else round(components / cells, 2),
+    }
+
+
+def geometry_reasons(features):
+    reasons = []
+    if features["lines"] > MAX_LINES:
+        reasons.append("too_tall")
+    if features["lines"] < MIN_SIZE or features["width"] < MIN_SIZE:
+        reasons.append("too_small")
+    if features["aspect"] < MIN_ASPECT:
+        reasons.append("too_narrow")
+    return reasons
+
+
+def pixel_reasons(features):
+    reasons = []
+    if features["ink"] < MIN_INK or features["components"] == 0:
+        reasons.append("blank")
+    elif features["ink"] > MAX_INK:
+        reasons.append("dense_ink")
+    if features["colour"] > MAX_COLOUR:
+        reasons.append("colourful")
+    if (
+        features["components"] is not None
+        and features["components"] > MIN_NOISY_COMPONENTS
+        and features["components_per_cell"] > MAX_COMPONENTS_PER_CELL
+    ):
+        reasons.append("noisy")
+    return reasons
+
+
+def classify_region(page, bbox, body_size):
+    """
+    判断页面上的区域是否值得送去公式识别。
+    返回 (是否候选, 特征, 跳过原因列表)；几何规则不通过时不渲染。
+    """
+    rect = fitz.Rect(bbox)
+    features = geometry_features(rect.width, rect.height, body_size)
+    reasons = geometry_reasons(features)
+    if reasons:
+        return False, features, reasons
+    pix = raster.render(page, rect, FEATURE_SCALE)
+    features.update(pixel_features(raster.pixmap_to_array(pix), body_size * FEATURE_SCALE))
+    reasons = pixel_reasons(features)
+    return not reasons, features, reasons
+
+
+def classify_image(image, body_size=DEFAULT_BODY_SIZE, scale=2):
+    """
+    对已经渲染好的 PIL 图片做同样的判断 (基准测试用)。scale: 图片相对 72 dpi 的倍率，
+    引擎裁剪图为 2 倍。
+    """
+    width, height = image.size
+    features = geometry_features(width / scale, height / scale, body_size)
+    reasons = geometry_reasons(features)
+    if reasons:
+        return False, features, reasons
+    if scale != FEATURE_SCALE:
+        size = (max(1, round(width * FEATURE_SCALE / scale)), max(1, round(height * FEATURE_SCALE / scale)))
+        image = image.resize(size)
+    features.update(pixel_features(np.asarray(image.convert("RGB")), body_size * FEATURE_SCALE))
+    reasons = pixel_reasons(features)
+    return not reasons, features, reasons
@@ -0,0 +1,230 @@
+"""
+公式识别 (LaTeX-OCR) 的模型封装：按批识别
+
+原来每遇到一个图片块就单独跑一次 generate：编码器每次只处理一张图，beam search 的每一步
+也只解码一个序列。这里把一批裁剪图一次送进 processor (统一缩放成模型输入尺寸后堆叠成一个张量)，
+一次 generate 同时解码整批，结果按输入顺序返回。
+
+推理后端 (backend，按部署选择，见 LATEXOCR_BACKEND)：
+- torch: 原始 fp32 PyTorch 模型
+- int8:  对全部 nn.Linear 做动态 int8 量化 (权重 int8，激活运行时量化)，只需 torch
+- onnx:  用 optimum 导出的 ONNX Runtime 编码器 / 解码器 (带 KV-cache 的 decoder_with_past)，
+         第一次使用时导出到 LATEXOCR_ONNX_DIR 下，之后直接加载
+不同后端的识别结果可能不同，所以后端也是识别结果缓存键的一部分。
+
+解码配置 (profile，可按请求选择)：greedy / small_beam / full_beam；
+max_length 可以固定，也可以是 "auto"：按裁剪图的宽高估算 (行内的单个符号只需要几个 token)。
+"""
+
+import math
+import os
+import threading
+import time
+
+from PIL import Image
+
+try:
+    import torch
+    from transformers import AutoProcessor, VisionEncoderDecoderModel
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    TRANSFORMERS_AVAILABLE = False
+
+try:
+    from optimum.onnxruntime import ORTModelForVision2Seq
+    ORT_AVAILABLE = True
+except ImportError:
+    ORT_AVAILABLE = False
+
+DEFAULT_MODEL = "rokmr/latex-ocr-base"
+BACKENDS = ("torch", "int8", "onnx")
+DEFAULT_BACKEND = os.environ.get("LATEXOCR_BACKEND", "torch")
+# 导出的 ONNX 模型的存放目录 (每个模型一个子目录)
+ONNX_DIR = os.environ.get("LATEXOCR_ONNX_DIR", os.path.join("uploads", "onnx"))
+# 一次 generate 的图片数：CPU 上 8 左右已能摊薄大部分开销，再大收益有限而峰值内存线性增长
+DEFAULT_BATCH_SIZE = 8
+# generate 的解码参数 (不含 max_length)
+DECODE_PROFILES = {
+    "greedy": {"num_beams": 1},
+    "small_beam": {"num_beams": 3, "early_stopping": True},
+    "full_beam": {"num_beams": 5, "early_stopping": True},
+}
+DEFAULT_DECODE = os.environ.get("LATEXOCR_DECODE", "full_beam")
+DEFAULT_MAX_LENGTH = 512
+# max_length="auto"：把裁剪图 (2 倍渲染) 按约 12pt 见方的"字符格"计数，每格最多约 4 个 token。
+# 这两个系数是估计值，没有用真实模型的输出长度校准过 (见 bench_engines.py latexocr-decode)
+CELL_PIXELS = 24
+TOKENS_PER_CELL = 4
+MIN_MAX_LENGTH = 32
+# 预热用的空白图 (约一个行内符号大小)
+WARMUP_IMAGE_SIZE = (48, 24)
+
+
+def resolve_batch_size(value, default=DEFAULT_BATCH_SIZE):
+    batch_size = int(value) if value not in (None, "") else default
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer")
+    return batch_size
+
+
+def resolve_backend(value, default=DEFAULT_BACKEND):
+    backend = value or default
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}")
+    return backend
+
+
+def resolve_decode(value, default=DEFAULT_DECODE):
+    profile = value or default
+    if profile not in DECODE_PROFILES:
+        raise ValueError(f"decode must be one of {tuple(DECODE_PROFILES)}")
+    return profile
+
+
+def resolve_max_length(value, default=DEFAULT_MAX_LENGTH):
+    """max_length 选项：正整数或 "auto" (按裁剪图尺寸估算)"""
+    if value in (None, ""):
+        return default
+    if value == "auto":
+        return value
+    max_length = int(value)
+    if max_length < 1:
+        raise ValueError("max_length must be a positive integer or 'auto'")
+    return max_length
+
+
+def predict_max_length(image):
+    """按裁剪图的宽高估算公式最多需要的 token 数"""
+    width, height = image.size
+    cells = max(1.0, width / CELL_PIXELS) * max(1.0, height / CELL_PIXELS)
+    return min(DEFAULT_MAX_LENGTH, MIN_MAX_LENGTH + TOKENS_PER_CELL * math.ceil(cells))
+
+
+def _load_onnx(model_name):
+    if not ORT_AVAILABLE:
+        raise ImportError("optimum[onnxruntime] is required for the onnx backend.")
+    export_dir = os.path.join(ONNX_DIR, model_name.replace("/", "--"))
+    if os.path.isdir(export_dir):
+        return ORTModelForVision2Seq.from_pretrained(export_dir, use_cache=True)
+    print(f"Exporting {model_name} to ONNX ({export_dir})...")
+    model = ORTModelForVision2Seq.from_pretrained(model_name, export=True, use_cache=True)
+    try:
+        model.save_pretrained(export_dir)
+    except OSError as e:
+        # 目录不可写时只是下次还要重新导出
+        print(f"ONNX export not saved: {e}")
+    return model
+
+
+class FormulaRecognizer:
+    def __init__(self, model_name=DEFAULT_MODEL, backend=DEFAULT_BACKEND):
+        self.model_name = model_name
+        self.backend = resolve_backend(backend)
+        self._model = None
+        self._processor = None
+        # 多个请求线程同时第一次用到模型时只加载一次
+        self._load_lock = threading.Lock()
+        # 模型加载耗时 / 预热 (一次推理，模型未加载时含加载) 耗时 (秒)，未发生时为 None
+        self.load_seconds = None
+        self.warmup_seconds = None
+
+    def settings_key(self, profile=DEFAULT_DECODE, max_length=DEFAULT_MAX_LENGTH):
+        """
+        模型名 + 后端 + 解码参数，作为识别结果缓存键的一部分 (见 formula_cache.py)。
+        max_length="auto" 时实际值只取决于图片尺寸，而图片尺寸已包含在像素哈希里。
+        """
+        options = ",".join(f"{k}={v}" for k, v in sorted(DECODE_PROFILES[profile].items()))
+        return f"{self.model_name}|{self.backend}|{options},max_length={max_length}"
+
+    @property
+    def model(self):
+        # 双重检查：加载完成后读取不加锁
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    self._load()
+        return self._model
+
+    def _load(self):
+        """调用方已持有 _load_lock。_processor 先于 _model 赋值，看到 _model 时 processor 一定可用"""
+        if not TRANSFORMERS_AVAILABLE:
+            raise ImportError("Transformers library is not installed.")
+        print(f"Loading LaTeX-OCR model: {self.model_name} ({self.backend})...")
+        start = time.perf_counter()
+        self._processor = AutoProcessor.from_pretrained(self.model_name)
+        if self.backend == "onnx":
+            model = _load_onnx(self.model_name)
+        else:
+            model = VisionEncoderDecoderModel.from_pretrained(self.model_name)
+            model.eval()
+            if self.backend == "int8":
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.load_seconds = time.perf_counter() - start
+        self._model = model
+        print(f"✓ Model loaded successfully ({self.load_seconds:.1f}s)")
+
+    @property
+    def processor(self):
+        if self._processor is None:
+            _ = self.model
+        return self._processor
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def warm(self, profile=DEFAULT_DECODE, infer=True):
+        """
+        加载模型并识别一张空白图：第一次真实请求不再承担 from_pretrained 和首次推理
+        (算子初始化、内存分配) 的开销。结果不写入缓存。
+        infer=False 时只加载权重不做前向推理，用于随后要 fork 的进程 (见 gunicorn.conf.py)。
+        """
+        start = time.perf_counter()
+        if not infer:
+            _ = self.processor
+            return time.perf_counter() - start
+        self._generate([Image.new("RGB", WARMUP_IMAGE_SIZE, "white")], profile, MIN_MAX_LENGTH)
+        self.warmup_seconds = time.perf_counter() - start
+        return self.warmup_seconds
+
+    def _generate(self, images, profile, max_length):
+        pixel_values = self.processor(images=images, return_tensors="pt").pixel_values
+        with torch.no_grad():
+            generated_ids = self.model.generate(
+                pixel_values, max_length=max_length, **DECODE_PROFILES[profile]
+            )
+        return self.processor.batch_decode(generated_ids, skip_special_tokens=True)
+
+    def recognize(self, images, batch_size=DEFAULT_BATCH_SIZE, profile=DEFAULT_DECODE,
+                  max_length=DEFAULT_MAX_LENGTH):
+        """
+        images: PIL 图片列表 (元素可以为 None)。返回等长的 LaTeX 列表，失败或空图片对应 None。
+        某一批出错时 (如个别图片尺寸异常) 该批退回逐张识别，不影响其它图片。
+        max_length="auto" 时按预测长度排序后再分批，一批的 max_length 取批内最大值，
+        避免一个长公式把整批小符号的解码上限拉高。
+        """
+        results = [None] * len(images)
+        indices = [i for i, image in enumerate(images) if image is not None]
+        if max_length == "auto":
+            lengths = {i: predict_max_length(images[i]) for i in indices}
+            indices.sort(key=lengths.get)
+        else:
+            lengths = dict.fromkeys(indices, max_length)
+        for start in range(0, len(indices), batch_size):
+            batch = indices[start:start + batch_size]
+            try:
+                latex_codes = self._generate(
+                    [images[i] for i in batch], profile, max(lengths[i] for i in batch)
+                )
+                for i, latex in zip(batch, latex_codes):
+                    results[i] = latex
+            except Exception as e:
+                print(f"Formula recognition error (batch of {len(batch)}): {e}")
+                if len(batch) == 1:
+                    continue
+                for i in batch:
+                    try:
+                        results[i] = self._generate([images[i]], profile, lengths[i])[0]
+                    except Exception as e:
+                        print(f"Formula recognition error: {e}")
+        return results
@@ -0,0 +1,338 @@
+"""
+基于字体的公式检测 (文字层)
+
+编译出来的 LaTeX PDF 里不会有 "$"，原来按 "$" / \\frac 匹配文本的检测在这类文档上什么都找不到，
+LaTeXOCR 又只看图片块。但公式的字形几乎总是来自专门的数学字体：
+- TeX:        CMMI (数学斜体)、CMSY (符号)、CMEX (大运算符 / 括号)、MSAM / MSBM (AMS 符号)、EUFM 等
+- 其它排版:   Symbol、MathematicalPi、MathGreek、AdvMT_MI / AdvMT_SY (MathTime)、
+              TeX_CM_Maths_*、Cambria Math、STIX Math、Noto Sans Math ……
+所以只看 get_text("dict") 里每个 span 的字体名和 flags 就能以很低的代价找到公式区域：
+
+1. span 分类: 数学字体 (或整段都是数学符号，如 ± ≤ ∑ α) 为 math (只有 − ′ ⋯ 等正文也常用的符号时除外)；上标 flag 或字号明显小于本行
+   的为 script；短的数字 / 括号 / 运算符 / sin、log 等为 bridge (TeX 里它们用正文字体 CMR)
+2. 每行中以 math span 开头、由 math / script / bridge / 空白组成的连续片段是一个行内公式 (run)，
+   片段末尾的公式编号 "(1)" 和标点不算在内
+3. run 覆盖本行 (去掉公式编号) 60% 以上字符的行是行间公式行；相邻的行间公式行 (分式的分子 / 分母、
+   多行公式) 合并为一个行间公式区域
+4. 区域要有公式的结构才保留：既有运算符 / 关系符又有字母 (变量)，或至少 3 个字母。单独的 ≥ ± μ、
+   统计正文里的 "<0.001"、"= 5958)" 这类片段不算公式，不改块类型也不送 OCR
+
+没有 ToUnicode 的数学字体 (AdvMT_SY、MathematicalPi 等) 会把减号之类的字形提取成 \x01 / \x15 这样的控制字符，
+它们不算数学符号 (不能开始一个公式)，只能出现在公式中间。
+
+detect_regions(blocks) 返回页面上的公式区域，LaTeXOCR 只渲染识别这些区域；
+block_kind / spans_kind 给出文本块 (或 pdfplumber 的文本元素) 的公式类型。
+"""
+
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# 去掉子集前缀 (ABCDEF+CMMI10) 后匹配
+_MATH_FONT = re.compile(
+    r"^(?:CMMIB?|CMB?SY|CMEX|MSAM|MSBM|EU[FSRE][MBX]|RSFS|ESINT|STMARY|WASY"
+    r"|N?TX(?:MI|SY|EX)|PX(?:MI|SY|EX)|MT(?:MI|SY|EX)|LM(?:MI|SY|EX)|ADVMT_|ADVPI)"
+    r"|MATH|SYMBOL|EUCLID|MT-?EXTRA",
+    re.IGNORECASE,
+)
+# 不论字体都算数学符号的字符：希腊字母、数学运算符、数学字母数字、常用的 ± × ÷ ′ ∞ 和黑板粗体 / 花体字母
+_MATH_CHAR_RANGES = (
+    (0x0391, 0x03C9), (0x03D0, 0x03F6), (0x2200, 0x22FF), (0x27C0, 0x27EF),
+    (0x2980, 0x2AFF), (0x1D400, 0x1D7FF),
+)
+_MATH_CHARS = frozenset("±×÷′″∞ℂℊℋℌℍℎℏℐℑℒℓℕ℘ℙℚℛℜℝℤℨℬℭℯℰℱℳℴ")
+# 正文里也常见的符号 (页码范围的减号、化学式的撇号、中文的省略号 ⋯⋯)：只由它们组成的 span 不能开始一个公式，
+# 但可以出现在公式中间
+_WEAK_MATH_CHARS = frozenset("−′″‴∗⋅·⋯…∼~*")
+# 公式中用正文字体排的部分：数字、括号、运算符、标点和函数名
+_BRIDGE = re.compile(
+    r"^(?:[\d\s()\[\]{}=+\-−–,.;:/|<>!'*^_]|sin|cos|tan|cot|sec|csc|log|ln|lg|exp|max|min|lim|sup|inf|det|arg|mod|dim|ker|deg|gcd)+$"
+)
+MAX_BRIDGE_CHARS = 12
+# 字号不超过本行最大字号的这个比例时视为上下标
+SCRIPT_SIZE_RATIO = 0.8
+# 行内公式字符占本行字符的比例达到此值时为行间公式行
+DISPLAY_RATIO = 0.6
+# 相邻行间公式区域的最大垂直间隔 (pt)，分式的分子 / 分母之间通常只有 1 ~ 3pt
+DISPLAY_MERGE_GAP = 4.0
+# 同一高度上左右相邻的行间公式区域 (大运算符与其后的被加项被拆成不同的块) 的最大水平间隔 (pt)
+DISPLAY_MERGE_HGAP = 12.0
+# 没有公式结构 (运算符 + 字母) 时，区域里至少要有这么多字母才算公式
+MIN_FORMULA_LETTERS = 3
+# 运算符 / 关系符 (另外所有非字母、非 _WEAK_MATH_CHARS 的数学符号也算)
+_OPERATORS = frozenset("=+-<>/^−")
+_EQUATION_NUMBER = re.compile(r"^\(\d+(?:[.\-]\d+)*[a-z]?\)$")
+_TRAILING_PUNCT = re.compile(r"^[\s,.;:]*$")
+
+# pdfplumber 的 span 内字符 top 的最大差 (pt)，超过时认为换行或上下标
+_CHAR_TOP_TOLERANCE = 0.5
+# pdfminer 把没有 Unicode 映射的字形输出为 "(cid:21)"，按替换字符处理 (同 PyMuPDF 的控制字符)
+_CID = re.compile(r"\(cid:\d+\)")
+
+
+@lru_cache(maxsize=512)
+def is_math_font(fontname):
+    return bool(_MATH_FONT.search(fontname.rsplit("+", 1)[-1])) if fontname else False
+
+
+def is_math_char(ch):
+    if ch in _MATH_CHARS:
+        return True
+    code = ord(ch)
+    return any(low <= code <= high for low, high in _MATH_CHAR_RANGES)
+
+
+def _is_unmapped(ch):
+    # 没有 Unicode 映射的字形：控制字符和替换字符
+    return ord(ch) < 0x20 or ch == "\ufffd"
+
+
+def _visible(text):
+    """去掉空白和没有映射的字形"""
+    return "".join(ch for ch in text if not ch.isspace() and not _is_unmapped(ch))
+
+
+def has_formula_structure(text):
+    """区域文本是否像公式：有运算符和字母，或至少 MIN_FORMULA_LETTERS 个字母"""
+    letters = 0
+    operator = False
+    for ch in _visible(text):
+        if ch.isalpha():
+            letters += 1
+        elif ch in _OPERATORS or (is_math_char(ch) and ch not in _WEAK_MATH_CHARS):
+            operator = True
+    return letters >= MIN_FORMULA_LETTERS or (operator and letters > 0)
+
+
+def _span_kind(span, max_size):
+    raw = span["text"].strip()
+    if not raw:
+        return "space"
+    text = _visible(raw)
+    if not text:
+        # 只有没有映射的字形 (通常是数学字体里的减号等)：可以在公式中间，不能开始公式
+        return "bridge"
+    if is_math_font(span["font"]) or all(is_math_char(ch) for ch in text if not ch.isspace()):
+        if any(ch not in _WEAK_MATH_CHARS for ch in text if not ch.isspace()):
+            return "math"
+        return "bridge" if len(text) <= MAX_BRIDGE_CHARS else "text"
+    if span["flags"] & 1 or span["size"] <= max_size * SCRIPT_SIZE_RATIO:
+        return "script"
+    if len(text) <= MAX_BRIDGE_CHARS and _BRIDGE.match(text):
+        return "bridge"
+    return "text"
+
+
+def _is_tail(span):
+    text = span["text"].strip()
+    return bool(_TRAILING_PUNCT.match(text) or _EQUATION_NUMBER.match(text))
+
+
+def line_runs(spans):
+    """
+    spans: 一行的 span (get_text("dict") 的格式：text / font / size / flags / bbox)。
+    返回 (runs, 公式字符数, 总字符数)：runs 为 [(起始下标, 结束下标 (不含))]，字符数不含空白和公式编号。
+    """
+    if not spans:
+        return [], 0, 0
+    max_size = max(span["size"] for span in spans)
+    kinds = [_span_kind(span, max_size) for span in spans]
+    runs = []
+    i = 0
+    while i < len(spans):
+        if kinds[i] != "math":
+            i += 1
+            continue
+        end = i + 1
+        while end < len(spans) and kinds[end] != "text":
+            end += 1
+        # 末尾的空白、标点、公式编号不属于公式
+        while end > i + 1 and (kinds[end - 1] == "space" or (kinds[end - 1] == "bridge" and _is_tail(spans[end - 1]))):
+            end -= 1
+        runs.append((i, end))
+        i = end
+
+    def count(span):
+        return len(_visible(span["text"]))
+
+    math_chars = sum(count(spans[j]) for start, end in runs for j in range(start, end))
+    total = sum(count(span) for span in spans if not _EQUATION_NUMBER.match(span["text"].strip()))
+    return runs, math_chars, total
+
+
+def spans_kind(spans):
+    """一组 span (一行或一个元素) 的公式类型："display" / "inline" / None"""
+    return block_kind({"lines": [{"spans": spans}]})
+
+
+def _union(boxes):
+    return [min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)]
+
+
+def _region(kind, spans, block_index):
+    return {
+        "kind": kind,
+        "bbox": _union([span["bbox"] for span in spans]),
+        "text": "".join(span["text"] for span in spans).strip(),
+        "block": block_index,
+        "blocks": [block_index],
+        "scripts": any(span["flags"] & 1 for span in spans) or len({round(span["size"], 1) for span in spans}) > 1,
+    }
+
+
+def _adjacent(a, b):
+    # 上下相邻且水平重叠，或左右相邻且垂直重叠
+    if b[0] <= a[2] and a[0] <= b[2]:
+        return b[1] - a[3] <= DISPLAY_MERGE_GAP and a[1] - b[3] <= DISPLAY_MERGE_GAP
+    if b[1] <= a[3] and a[1] <= b[3]:
+        return b[0] - a[2] <= DISPLAY_MERGE_HGAP and a[0] - b[2] <= DISPLAY_MERGE_HGAP
+    return False
+
+
+def _merge_display(regions):
+    """相邻 (见 _adjacent) 的行间公式区域合并为一个"""
+    merged = []
+    for region in regions:
+        if region["kind"] == "display":
+            for other in merged:
+                if other["kind"] == "display" and _adjacent(other["bbox"], region["bbox"]):
+                    a, b = other["bbox"], region["bbox"]
+                    other["bbox"] = _union([a, b])
+                    other["text"] = f"{other['text']}\n{region['text']}"
+                    other["scripts"] = other["scripts"] or region["scripts"]
+                    if region["block"] not in other["blocks"]:
+                        other["blocks"].append(region["block"])
+                    break
+            else:
+                merged.append(region)
+        else:
+            merged.append(region)
+    return merged
+
+
+def _block_regions(block, index):
+    """一个文本块的候选公式区域 (未合并、未按结构筛选) 和每个非空行的 spans_kind (单独成行的公式编号除外)"""
+    regions = []
+    kinds = []
+    for line in block.get("lines", []):
+        spans = line["spans"]
+        runs, math_chars, total = line_runs(spans)
+        text = "".join(span["text"] for span in spans).strip()
+        # 单独成行的公式编号 "(1)" 不影响判断
+        if text and not _EQUATION_NUMBER.match(text):
+            kinds.append(None if not runs else "display" if math_chars >= DISPLAY_RATIO * total else "inline")
+        if not runs:
+            continue
+        if math_chars >= DISPLAY_RATIO * total:
+            # 整行作为行间公式 (不含公式编号)
+            start, end = runs[0][0], runs[-1][1]
+            regions.append(_region("display", spans[start:end], index))
+        else:
+            regions.extend(_region("inline", spans[start:end], index) for start, end in runs)
+    return regions, kinds
+
+
+def _formula_regions(regions):
+    return [region for region in _merge_display(regions) if has_formula_structure(region["text"])]
+
+
+def detect_regions(blocks):
+    """
+    blocks: get_text("dict")["blocks"] (或 fitz_utils.get_blocks)。
+    返回公式区域列表 {"kind": "display" / "inline", "bbox", "text", "block": 起始块下标,
+    "blocks": 涉及的块下标 (合并的行间公式可能跨块), "scripts": 是否有上下标}，按阅读顺序。
+    """
+    regions = []
+    for index, block in enumerate(blocks):
+        if block.get("type") == 0:
+            regions += _block_regions(block, index)[0]
+    return _formula_regions(regions)
+
+
+def block_kind(block):
+    """
+    文本块的公式类型：所有非空行都是行间公式行时为 "display"，有行内公式时为 "inline"，否则 None。
+    只看通过结构检查 (见 has_formula_structure) 的区域，与 detect_regions 一致。
+    """
+    regions, kinds = _block_regions(block, 0)
+    regions = _formula_regions(regions)
+    if not regions:
+        return None
+    return "display" if all(kind == "display" for kind in kinds) else "inline"
+
+
+# ==========================================
+# pdfplumber: page.chars -> span
+# ==========================================
+
+def chars_to_spans(chars):
+    """把连续、同字体同字号、同一基线的字符合并成与 get_text("dict") 相同格式的 span"""
+    spans = []
+    for char in chars:
+        text = _CID.sub("\ufffd", char["text"])
+        last = spans[-1] if spans else None
+        if (
+            last is not None
+            and last["font"] == char["fontname"]
+            and abs(last["size"] - char["size"]) < 0.01
+            and abs(last["bbox"][1] - char["top"]) <= _CHAR_TOP_TOLERANCE
+        ):
+            last["text"] += text
+            last["bbox"][2] = max(last["bbox"][2], char["x1"])
+            last["bbox"][3] = max(last["bbox"][3], char["bottom"])
+        else:
+            spans.append({
+                "text": text,
+                "font": char["fontname"],
+                "size": char["size"],
+                # pdfplumber 没有上标 flag，上下标靠字号判断
+                "flags": 0,
+                "bbox": [char["x0"], char["top"], char["x1"], char["bottom"]],
+            })
+    return spans
+
+
+def _split_lines(spans):
+    """按垂直位置把 span 分行：span 的中心不在当前行的上下范围内时换行 (上下标仍在本行范围内)"""
+    lines = []
+    for span in spans:
+        centre = (span["bbox"][1] + span["bbox"][3]) / 2
+        if lines and lines[-1]["top"] <= centre <= lines[-1]["bottom"]:
+            lines[-1]["spans"].append(span)
+        else:
+            lines.append({"top": span["bbox"][1], "bottom": span["bbox"][3], "spans": [span]})
+    return lines
+
+
+class CharFormulaIndex:
+    """
+    pdfplumber 页面的字符索引：kind(bbox) 给出落在 bbox 内的字符 (按行) 的公式类型，与 block_kind 相同。
+    页面上没有数学字体 / 数学符号时不建索引，kind 直接返回 None。
+    """
+
+    def __init__(self, chars):
+        self.chars = chars
+        self.enabled = any(
+            is_math_font(char["fontname"]) or is_math_char(char["text"][:1] or " ") for char in chars
+        )
+        if self.enabled:
+            cx = np.array([(c["x0"] + c["x1"]) / 2 for c in chars])
+            cy = np.array([(c["top"] + c["bottom"]) / 2 for c in chars])
+            # 按字符中心的 y 排序，查询时先二分出 y 范围，再筛 x
+            self._order = np.argsort(cy, kind="stable")
+            self._cy = cy[self._order]
+            self._cx = cx[self._order]
+
+    def kind(self, bbox):
+        if not self.enabled:
+            return None
+        x0, top, x1, bottom = bbox
+        lo = np.searchsorted(self._cy, top, side="left")
+        hi = np.searchsorted(self._cy, bottom, side="right")
+        rows = np.flatnonzero((self._cx[lo:hi] >= x0) & (self._cx[lo:hi] <= x1))
+        if len(rows) == 0:
+            return None
+        # 恢复内容流顺序
+        inside = np.sort(self._order[lo:hi][rows])
+        return block_kind({"lines": _split_lines(chars_to_spans([self.chars[i] for i in inside]))})
@@ -0,0 +1,198 @@
+"""
+文档几何信息：页数、MediaBox / CropBox、旋转、每页内容哈希
+
+各引擎原来各自打开一遍文档只为读页面尺寸 (Camelot 用 pypdf 读 mediabox，PyPDF 干脆返回 0)。
+这里用 PyMuPDF 对每个文件只计算一次，结果以 <文件名>.geometry.json 存在上传文件旁边，
+文件大小 / 修改时间不变时直接读缓存。所有引擎和前端 (/uploads/<filename>/geometry) 共用同一份数据。
+
+坐标约定：
+- mediabox / cropbox: PDF 用户空间 (左下角原点)，即文件里写的 [x0, y0, x1, y1]
+- width / height:     显示尺寸 (CropBox 按 /Rotate 旋转后)，与 PyMuPDF 的 page.rect 一致
+- pdf_to_view:        PDF 用户空间 -> 显示坐标 (左上角原点、已旋转) 的 6 元矩阵 [a, b, c, d, e, f]
+"""
+
+import collections
+import hashlib
+import json
+import os
+import threading
+
+import fitz  # PyMuPDF
+
+GEOMETRY_SUFFIX = ".geometry.json"
+# 字段变化时递增，旧的缓存文件会被重新计算
+GEOMETRY_VERSION = 1
+
+
+def _file_sha1(filepath, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _page_geometry(page):
+    mediabox = page.mediabox
+    # PyMuPDF 的 page.cropbox 的 y 是从 MediaBox 顶边往下量的，换回 PDF 坐标
+    crop = page.cropbox
+    cropbox = fitz.Rect(crop.x0, mediabox.y1 - crop.y1, crop.x1, mediabox.y1 - crop.y0)
+    # PDF 坐标 -> 未旋转的页面坐标 (左上角原点，相对 CropBox)，再按 /Rotate 旋转
+    # 不用 page.transformation_matrix：CropBox 不从原点开始时它的平移量不对
+    to_page = fitz.Matrix(1, 0, 0, -1, -cropbox.x0, cropbox.y1)
+    to_view = to_page * page.rotation_matrix
+    return {
+        "page_number": page.number + 1,
+        "width": page.rect.width,
+        "height": page.rect.height,
+        "rotation": page.rotation,
+        "mediabox": list(mediabox),
+        "cropbox": list(cropbox),
+        "pdf_to_view": list(to_view),
+        # 页面内容流 (解压后) 的哈希，可用于按页缓存解析结果
+        "hash": hashlib.sha1(page.read_contents()).hexdigest(),
+    }
+
+
+def compute_geometry(filepath):
+    """打开一次文档，计算全部页面的几何信息 (不读缓存)"""
+    stat = os.stat(filepath)
+    with fitz.open(filepath) as doc:
+        pages = [_page_geometry(page) for page in doc]
+    return {
+        "version": GEOMETRY_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha1": _file_sha1(filepath),
+        "page_count": len(pages),
+        "pages": pages,
+    }
+
+
+def geometry_path(filepath):
+    return filepath + GEOMETRY_SUFFIX
+
+
+def _is_current(geometry, stat):
+    return (
+        geometry.get("version") == GEOMETRY_VERSION
+        and geometry.get("size") == stat.st_size
+        and geometry.get("mtime_ns") == stat.st_mtime_ns
+    )
+
+
+# 进程内缓存：(路径, 大小, 修改时间) -> 几何信息，最多保留 _LOADED_SIZE 个文件
+_loaded = collections.OrderedDict()
+_LOADED_SIZE = 32
+_loaded_lock = threading.Lock()
+
+
+def _load(filepath, size, mtime_ns):
+    # size / mtime_ns 只作为进程内缓存的键，文件被覆盖后自然失效
+    key = (filepath, size, mtime_ns)
+    with _loaded_lock:
+        if key in _loaded:
+            _loaded.move_to_end(key)
+            return _loaded[key]
+    geometry = _read_or_compute(filepath)
+    with _loaded_lock:
+        _loaded[key] = geometry
+        while len(_loaded) > _LOADED_SIZE:
+            _loaded.popitem(last=False)
+    return geometry
+
+
+def _read_or_compute(filepath):
+    stat = os.stat(filepath)
+    cache_file = geometry_path(filepath)
+    try:
+        with open(cache_file, encoding="utf-8") as f:
+            geometry = json.load(f)
+        if _is_current(geometry, stat):
+            return geometry
+    except (OSError, ValueError):
+        pass
+
+    geometry = compute_geometry(filepath)
+    try:
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump(geometry, f)
+    except OSError as e:
+        # 上传目录不可写时只是没有磁盘缓存
+        print(f"Geometry cache write failed: {e}")
+    return geometry
+
+
+def get_geometry(filepath):
+    """
+    返回文件的几何信息 (见模块说明)，优先使用进程内缓存和 <文件名>.geometry.json。
+    返回的 dict 被多个调用方共享，不要修改。
+    """
+    filepath = os.path.abspath(filepath)
+    stat = os.stat(filepath)
+    return _load(filepath, stat.st_size, stat.st_mtime_ns)
+
+
+def cached_geometry(filepath):
+    """
+    已经算好的几何信息 (进程内缓存或当前的 <文件名>.geometry.json)，没有时返回 None，不打开文档。
+    给不想为了几何信息多做一遍 PyMuPDF 解析的引擎 (pypdf) 使用。
+    """
+    filepath = os.path.abspath(filepath)
+    stat = os.stat(filepath)
+    with _loaded_lock:
+        geometry = _loaded.get((filepath, stat.st_size, stat.st_mtime_ns))
+    if geometry is not None:
+        return geometry
+    try:
+        with open(geometry_path(filepath), encoding="utf-8") as f:
+            geometry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return geometry if _is_current(geometry, stat) else None
+
+
+def page_sizes(geometry):
+    """{页码: (width, height)}，显示尺寸"""
+    return {p["page_number"]: (p["width"], p["height"]) for p in geometry["pages"]}
+
+
+def pdf_to_view_bbox(page_geometry, bbox):
+    """PDF 用户空间的 bbox (x0, y0, x1, y1) -> 显示坐标 (左上角原点、已旋转) 的 [x0, top, x1, bottom]"""
+    rect = fitz.Rect(bbox) * fitz.Matrix(page_geometry["pdf_to_view"])
+    return [rect.x0, rect.y0, rect.x1, rect.y1]
+
+
+def _pdfminer_ctm(page_geometry):
+    """pdfminer (PDFPageInterpreter.process_page) 使用的页面变换：平移到 MediaBox 原点并按 /Rotate 旋转"""
+    x0, y0, x1, y1 = page_geometry["mediabox"]
+    rotation = page_geometry["rotation"] % 360
+    if rotation == 90:
+        return fitz.Matrix(0, -1, 1, 0, -y0, x1)
+    if rotation == 180:
+        return fitz.Matrix(-1, 0, 0, -1, x1, y1)
+    if rotation == 270:
+        return fitz.Matrix(0, 1, -1, 0, y1, -x0)
+    return fitz.Matrix(1, 0, 0, 1, -x0, -y0)
+
+
+def pdfminer_to_view_bbox(page_geometry, bbox):
+    """
+    pdfminer 版面坐标 -> 显示坐标。Camelot / pdfminer 的 bbox 是相对 MediaBox 原点、
+    已按 /Rotate 旋转的左下角原点坐标，不是 PDF 用户空间。
+    """
+    matrix = ~_pdfminer_ctm(page_geometry) * fitz.Matrix(page_geometry["pdf_to_view"])
+    rect = fitz.Rect(bbox) * matrix
+    return [rect.x0, rect.y0, rect.x1, rect.y1]
+
+
+def summary(geometry):
+    """给前端的精简版：不含矩阵和哈希"""
+    return {
+        "page_count": geometry["page_count"],
+        "sha1": geometry["sha1"],
+        "pages": [
+            {k: p[k] for k in ("page_number", "width", "height", "rotation")}
+            for p in geometry["pages"]
+        ],
+    }
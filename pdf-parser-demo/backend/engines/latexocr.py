@@ -3,169 +3,355 @@
 使用开放的 LaTeX OCR 模型进行数学公式识别
 """
 
-from .base import BasePDFEngine, normalize_bbox
+from .base import BasePDFEngine, normalize_bbox, parse_flag
+from .batch_server import BATCHING_ENABLED, DEFAULT_MAX_BATCH, DEFAULT_MAX_WAIT, FormulaBatcher
+from .fitz_utils import get_blocks
+from .formula_cache import DEFAULT_CACHE_PATH, FormulaCache, image_hash
+from .formula_candidates import body_text_size, classify_region
+from .formula_spans import block_kind, detect_regions
+from .formula_ocr import (
+    DEFAULT_BACKEND, DEFAULT_MODEL, TRANSFORMERS_AVAILABLE, FormulaRecognizer,
+    resolve_batch_size, resolve_decode, resolve_max_length
+)
+from .pipeline import BatchPipeline
+from . import raster
 import fitz  # PyMuPDF
-from PIL import Image
-import io
-import os
+import time
 
-# 尝试导入依赖
-try:
-    import torch
-    from transformers import AutoProcessor, VisionEncoderDecoderModel
-    TRANSFORMERS_AVAILABLE = True
-except ImportError:
-    TRANSFORMERS_AVAILABLE = False
+# 文字层公式区域裁剪时四周留白 (pt)
+REGION_PADDING = 2.0
 
 
 class LaTeXOCREngine(BasePDFEngine):
     """
     使用 Hugging Face Transformers 的 LaTeX-OCR 模型识别数学公式
+
+    图片块不再在页面循环里逐个识别：先收集一个窗口 (window_pages 页，默认整个文档) 内的全部裁剪图，
+    再按 batch_size 分批识别，最后按元素 id 把结果填回对应元素。
+    识别结果按裁剪图的像素哈希缓存 (见 formula_cache.py)，只有未命中的图片才送进模型。
+    默认以流水线方式运行 (见 pipeline.py)：页面循环渲染裁剪图的同时，推理线程按批识别。
+    同一进程内并发的解析共用一个批处理线程 (见 batch_server.py)，不同请求的裁剪图可以合成一批。
+    编译出的 LaTeX PDF 的公式在文字层里：按 span 的数学字体 / 上标找出公式区域 (见 formula_spans.py)，
+    只渲染识别这些区域，不对整页 OCR。
     """
     
-    def __init__(self, model_name="rokmr/latex-ocr-base"):
+    def __init__(self, model_name=DEFAULT_MODEL, cache_path=DEFAULT_CACHE_PATH, backend=DEFAULT_BACKEND,
+                 batching=BATCHING_ENABLED, max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT):
         super().__init__()
         self.model_name = model_name
-        self._model = None
-        self._processor = None
+        # 推理后端 torch / int8 / onnx (见 formula_ocr.py)
+        self.recognizer = FormulaRecognizer(model_name, backend)
+        self.cache = FormulaCache(cache_path)
+        # batching=False 时每个请求直接调用模型
+        self.batcher = FormulaBatcher(self.recognizer, max_batch, max_wait) if batching else None
     
     @property
     def model(self):
-        if self._model is None:
-            if not TRANSFORMERS_AVAILABLE:
-                raise ImportError("Transformers library is not installed.")
-            print(f"Loading LaTeX-OCR model: {self.model_name}...")
-            self._processor = AutoProcessor.from_pretrained(self.model_name)
-            self._model = VisionEncoderDecoderModel.from_pretrained(self.model_name)
-            print("✓ Model loaded successfully")
-        return self._model
+        return self.recognizer.model
     
     @property
     def processor(self):
-        if self._processor is None:
-            _ = self.model
-        return self._processor
+        return self.recognizer.processor
     
     def _extract_image_from_pdf_page(self, page, bbox, scale=2):
         try:
-            rect = fitz.Rect(bbox)
-            pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), clip=rect)
-            img_data = pix.tobytes("png")
-            image = Image.open(io.BytesIO(img_data))
-            return image
+            # 直接用 Pixmap 的 RGB 像素构造图片，不经过 PNG 压缩 / 解压
+            return raster.render_image(page, bbox, scale)
         except Exception as e:
             print(f"Error extracting image: {e}")
             return None
     
-    def _recognize_formula(self, image):
-        try:
-            if image is None: return None
-            pixel_values = self.processor(images=image, return_tensors="pt").pixel_values
-            with torch.no_grad():
-                generated_ids = self.model.generate(
-                    pixel_values, max_length=512, num_beams=5, early_stopping=True
-                )
-            latex = self.processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
-            return latex
-        except Exception as e:
-            print(f"Formula recognition error: {e}")
-            return None
+    def _region_element(self, region, page_num, width, height, parent, content):
+        """文字层公式区域的元素：先用原文本占位，识别后 content 换成 LaTeX"""
+        element = {
+            "id": self.generate_id(),
+            "page": page_num + 1,
+            "type": "formula",
+            "formula_type": region["kind"],
+            "content": region["text"],
+            # 行间公式保留整块的原文本 (含公式编号)
+            "text": region["text"] if parent is not None else content,
+            "bbox": normalize_bbox(region["bbox"], width, height)
+        }
+        if parent is not None:
+            element["parent"] = parent
+        return element
+
+    def _region_clip(self, page, bbox):
+        """公式区域四周留 REGION_PADDING pt 再裁剪，上下标和根号的笔画常常超出 span 的 bbox"""
+        pad = REGION_PADDING
+        return (fitz.Rect(bbox) + (-pad, -pad, pad, pad)) & page.rect
+
+    def _recognize_formula(self, image, **decode):
+        return self.recognizer.recognize([image], **decode)[0]
+    
+    def _recognize_images(self, images, batch_size, decode):
+        if self.batcher is not None:
+            # 批大小由共享的批处理线程决定 (max_batch)，batch_size 只决定本请求每次提交多少张
+            return self.batcher.recognize(images, **decode)
+        return self.recognizer.recognize(images, batch_size, **decode)
+    
+    def warm(self, infer=True):
+        """
+        服务启动时加载模型并做一次推理 (见 app.warm_up)；不启动批处理线程。
+        fork 之前只能用 infer=False (只加载权重)，推理预热在 fork 之后的进程里做。
+        """
+        return self.recognizer.warm(infer=infer)
     
-    def parse(self, filepath):
+    def metrics(self):
+        """/metrics 用：模型加载耗时、跨请求批处理和识别结果缓存的统计"""
+        recognizer = self.recognizer
+        return {
+            "backend": recognizer.backend,
+            "model": {
+                "loaded": recognizer.loaded,
+                "load_seconds": None if recognizer.load_seconds is None else round(recognizer.load_seconds, 3),
+                "warmup_seconds": None if recognizer.warmup_seconds is None else round(recognizer.warmup_seconds, 3),
+            },
+            "batcher": self.batcher.stats() if self.batcher is not None else None,
+            "formula_cache": self.cache.stats(),
+        }
+    
+    def _recognize_pending(self, pending, batch_size, decode, use_cache, stats):
+        """
+        pending: [(element, image)]，识别后原地把图片元素改成 formula_image，失败的保持 image；
+        文字层检测出的公式元素 (type 为 formula) 识别后 content 换成 LaTeX，原文本保留在 text 中。
+        decode: {"profile", "max_length"}，见 formula_ocr.py。
+        缓存命中或与本批中另一张图完全相同的图片不再识别，计为命中 (stats["hits"])。
+        """
+        if not pending:
+            return
+        settings = self.recognizer.settings_key(**decode)
+        keys = [f"{settings}|{image_hash(image)}" for _, image in pending]
+        results = self.cache.get_many(keys) if use_cache else {}
+
+        # 每个未命中的键只识别一次
+        todo = {}
+        for key, (_, image) in zip(keys, pending):
+            if key not in results and key not in todo:
+                todo[key] = image
+        latex_codes = self._recognize_images(list(todo.values()), batch_size, decode)
+        fresh = {key: latex for key, latex in zip(todo, latex_codes) if latex is not None}
+        self.cache.put_many(fresh)
+        results.update(fresh)
+
+        misses = len(todo)
+        stats["hits"] += len(pending) - misses
+        stats["misses"] += misses
+        self.cache.record(len(pending) - misses, misses)
+
+        for (element, _), key in zip(pending, keys):
+            latex_code = results.get(key)
+            if latex_code and len(latex_code.strip()) > 0:
+                if element["type"] == "image":
+                    element.pop("xref", None)
+                    element["type"] = "formula_image"
+                element["content"] = latex_code
+                element["recognized"] = True
+    
+    def parse(self, filepath, **options):
+        """选项见 _parse。使用共享批处理线程时在其中登记本次解析 (见 FormulaBatcher.session)"""
+        if self.batcher is None:
+            return self._parse(filepath, **options)
+        with self.batcher.session():
+            return self._parse(filepath, **options)
+    
+    def _parse(self, filepath, batch_size=None, window_pages=None, cache=True,
+              decode=None, max_length=None, candidate_filter=True, pipeline=True, queue_size=None,
+              text_formulas=True, **options):
+        """
+        batch_size:   每次 generate 的图片数，默认 DEFAULT_BATCH_SIZE
+        decode:       解码配置 "greedy" / "small_beam" / "full_beam"，默认 full_beam (LATEXOCR_DECODE)
+        max_length:   生成的最大 token 数，默认 512；"auto" 按每张裁剪图的宽高估算
+        pipeline:     默认渲染和识别同时进行；"0" 时先渲染再识别 (按 window_pages 分段)
+        queue_size:   流水线中等待识别的裁剪图上限，默认 2 x batch_size
+        window_pages: 仅 pipeline=0 时有效：每收集多少页的图片识别一次，默认 0 (整个文档一起)；
+                      页数很多、图片很多时用它限制同时保留在内存里的裁剪图
+        cache:        "0" 时不读缓存 (全部重新识别)，新结果仍写入缓存
+        candidate_filter: "0" 时不做公式候选筛选 (见 formula_candidates.py)，所有图片块都送去识别
+        text_formulas: 默认按文字层 span 的字体 / 上标找出公式区域 (见 formula_spans.py)，
+                      只渲染识别这些区域；"0" 时文本块不识别 (只看 "$")
+        """
         self.element_counter = 0
         if not TRANSFORMERS_AVAILABLE:
             raise ImportError("Transformers is required.")
+        batch_size = resolve_batch_size(batch_size)
+        window_pages = int(window_pages or 0)
+        if window_pages < 0:
+            raise ValueError("window_pages must be a non-negative integer")
+        decode = {"profile": resolve_decode(decode), "max_length": resolve_max_length(max_length)}
+        use_cache = parse_flag(cache)
+        use_filter = parse_flag(candidate_filter)
+        use_pipeline = parse_flag(pipeline)
+        use_text_formulas = parse_flag(text_formulas)
+        queue_size = int(queue_size) if queue_size else None
+        if queue_size is not None and queue_size < 1:
+            raise ValueError("queue_size must be a positive integer")
+        stats = {"hits": 0, "misses": 0}
+        candidates = {"images": 0, "skipped": 0, "reasons": {}}
+        text_stats = {"regions": 0, "display": 0, "inline": 0, "ocr": 0, "detect_seconds": 0.0}
         
-        doc = fitz.open(filepath)
-        metadata = doc.metadata if doc.metadata else {}
         pages_data = []
-        all_formulas = []
+        pending = []
+        runner = None
+        render_seconds = 0.0
+        started = time.perf_counter()
         
-        for page_num, page in enumerate(doc):
-            width, height = page.rect.width, page.rect.height
-            text_page = page.get_text("dict")
-            blocks = text_page["blocks"] if "blocks" in text_page else []
-            elements = []
-            
-            for block in blocks:
-                bbox = block["bbox"]
-                norm = normalize_bbox(bbox, width, height)
+        doc = fitz.open(filepath)
+        try:
+            metadata = doc.metadata if doc.metadata else {}
+            if use_pipeline:
+                runner = BatchPipeline(
+                    lambda batch: self._recognize_pending(batch, batch_size, decode, use_cache, stats),
+                    batch_size, queue_size,
+                ).start()
+            for page_num, page in enumerate(doc):
+                width, height = page.rect.width, page.rect.height
+                blocks = get_blocks(page)
+                elements = []
+                body_size = None
+                regions = []
+                if use_text_formulas:
+                    detect_start = time.perf_counter()
+                    regions = detect_regions(blocks)
+                    text_stats["detect_seconds"] += time.perf_counter() - detect_start
+                    text_stats["regions"] += len(regions)
+                
+                for index, block in enumerate(blocks):
+                    bbox = block["bbox"]
+                    norm = normalize_bbox(bbox, width, height)
 
-                if block["type"] == 0:  # Text
-                    text = ""
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            text += span["text"]
-                        text += "\n"
-                    content = text.strip()
+                    if block["type"] == 0:  # Text
+                        text = ""
+                        for line in block["lines"]:
+                            for span in line["spans"]:
+                                text += span["text"]
+                            text += "\n"
+                        content = text.strip()
+                        block_regions = [region for region in regions if index in region["blocks"]]
+                        
+                        # 整块都是行间公式时块本身就是公式元素，否则公式元素跟在所在文本块之后
+                        # (跨块合并的行间公式只在第一个块输出)
+                        parent = None
+                        if not (block_regions and block_kind(block) == "display"):
+                            parent = self.generate_id()
+                            elements.append({
+                                "id": parent,
+                                "page": page_num + 1,
+                                "type": "text_with_inline_formula" if block_regions or '$' in content else "text",
+                                "content": content,
+                                "bbox": norm
+                            })
+                        for region in block_regions:
+                            if region["block"] != index:
+                                continue
+                            element = self._region_element(region, page_num, width, height, parent, content)
+                            elements.append(element)
+                            text_stats[region["kind"]] += 1
+                            # 单个字符 (x、α) 的文本就是结果，不必识别
+                            if sum(not ch.isspace() for ch in region["text"]) <= 1:
+                                continue
+                            render_start = time.perf_counter()
+                            image = self._extract_image_from_pdf_page(page, self._region_clip(page, region["bbox"]))
+                            render_seconds += time.perf_counter() - render_start
+                            if not image:
+                                continue
+                            text_stats["ocr"] += 1
+                            if runner is not None:
+                                runner.put((element, image))
+                            else:
+                                pending.append((element, image))
                     
-                    if '$' in content:
-                        elements.append({
-                            "id": self.generate_id(),
-                            "page": page_num + 1,
-                            "type": "text_with_inline_formula",
-                            "content": content,
-                            "bbox": norm
-                        })
-                    else:
-                        elements.append({
-                            "id": self.generate_id(),
-                            "page": page_num + 1,
-                            "type": "text",
-                            "content": content,
-                            "bbox": norm
-                        })
-                
-                elif block["type"] == 1:  # Image
-                    # 检查是否可能是公式图像（基于大小）
-                    # 尝试识别公式
-                    image = self._extract_image_from_pdf_page(page, bbox)
-                    latex_code = None
-                    if image:
-                        try:
-                            latex_code = self._recognize_formula(image)
-                        except Exception:
-                            pass
-                            
-                    if latex_code and len(latex_code.strip()) > 0:
-                        formula_id = self.generate_id()
-                        elements.append({
-                            "id": formula_id,
-                            "page": page_num + 1,
-                            "type": "formula_image",
-                            "content": latex_code,
-                            "bbox": norm,
-                            "recognized": True
-                        })
-                        all_formulas.append({
-                            "id": formula_id,
-                            "page": page_num + 1,
-                            "latex": latex_code,
-                            "bbox": norm
-                        })
-                    else:
-                        elements.append({
+                    elif block["type"] == 1:  # Image
+                        # 先按图片占位，识别成功后再改成 formula_image
+                        element = {
                             "id": self.generate_id(),
                             "page": page_num + 1,
                             "type": "image",
-                            "bbox": norm
-                        })
-            
-            # 【核心修改】已删除 elements.sort(...)
-            # 保持 PDF 原生阅读顺序
+                            "bbox": norm,
+                            "xref": block["xref"]
+                        }
+                        elements.append(element)
+                        candidates["images"] += 1
+                        if use_filter:
+                            # 照片、图表、整页扫描等明显不是公式的图片不渲染也不识别，标注跳过原因
+                            if body_size is None:
+                                body_size = body_text_size(blocks)
+                            is_candidate, features, reasons = classify_region(page, bbox, body_size)
+                            if not is_candidate:
+                                element["skip_reasons"] = reasons
+                                element["candidate_features"] = features
+                                candidates["skipped"] += 1
+                                for reason in reasons:
+                                    candidates["reasons"][reason] = candidates["reasons"].get(reason, 0) + 1
+                                continue
+                        render_start = time.perf_counter()
+                        image = self._extract_image_from_pdf_page(page, bbox)
+                        render_seconds += time.perf_counter() - render_start
+                        if not image:
+                            continue
+                        if runner is not None:
+                            runner.put((element, image))
+                        else:
+                            pending.append((element, image))
+                
+                # 【核心修改】已删除 elements.sort(...)
+                # 保持 PDF 原生阅读顺序
+                
+                pages_data.append({
+                    "page_number": page_num + 1,
+                    "width": width,
+                    "height": height,
+                    "elements": elements
+                })
+                
+                if runner is None and window_pages and (page_num + 1) % window_pages == 0:
+                    self._recognize_pending(pending, batch_size, decode, use_cache, stats)
+                    pending = []
             
-            pages_data.append({
-                "page_number": page_num + 1,
-                "width": width,
-                "height": height,
-                "elements": elements
-            })
+        except BaseException:
+            # 解析出错时队列里剩下的裁剪图不再识别
+            if runner is not None:
+                runner.cancel()
+            raise
+        finally:
+            doc.close()
+            timings = runner.close() if runner is not None else None
         
-        doc.close()
+        if runner is None:
+            infer_start = time.perf_counter()
+            self._recognize_pending(pending, batch_size, decode, use_cache, stats)
+            timings = {"infer_seconds": round(time.perf_counter() - infer_start, 3)}
+        timings["render_seconds"] = round(render_seconds, 3)
+        timings["wall_seconds"] = round(time.perf_counter() - started, 3)
+        timings["pipelined"] = runner is not None
+        text_stats["detect_seconds"] = round(text_stats["detect_seconds"], 4)
+        
+        all_formulas = [
+            {
+                "id": element["id"],
+                "page": element["page"],
+                "latex": element["content"],
+                "bbox": element["bbox"],
+                # image / display / inline
+                "kind": element.get("formula_type", "image")
+            }
+            for page_data in pages_data
+            for element in page_data["elements"]
+            if element["type"] == "formula_image" or element.get("recognized")
+        ]
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / total, 4) if total else None
         return {
             "metadata": metadata,
             "pages": pages_data,
             "formulas": all_formulas,
+            "formula_cache": stats,
+            "backend": self.recognizer.backend,
+            "decode": decode,
+            "candidates": candidates,
+            "text_formulas": text_stats,
+            "timings": timings,
             "engine": "latexocr (Natural Order)"
         }
 
@@ -173,7 +359,7 @@ class LaTeXOCREngine(BasePDFEngine):
 class SimpleFormulaDetector(BasePDFEngine):
     r"""
     简单的公式检测器 - 基于规则的检测方法
-    识别常见的数学公式模式，如：
+    先按 span 的字体 / 上标判断 (编译后的 PDF，见 formula_spans.py)，没有数学字体的块再匹配 LaTeX 源码模式，如：
     - 分数: \frac{...}{...}
     - 根号: \sqrt{...}
     """
@@ -201,7 +387,7 @@ class SimpleFormulaDetector(BasePDFEngine):
         elif '$' in text: return "inline"
         else: return "standalone"
     
-    def parse(self, filepath):
+    def parse(self, filepath, **options):
         self.element_counter = 0
         doc = fitz.open(filepath)
         metadata = doc.metadata if doc.metadata else {}
@@ -209,11 +395,11 @@ class SimpleFormulaDetector(BasePDFEngine):
         
         for page_num, page in enumerate(doc):
             width, height = page.rect.width, page.rect.height
-            text_page = page.get_text("dict")
-            blocks = text_page["blocks"] if "blocks" in text_page else []
+            blocks = get_blocks(page)
+            regions = detect_regions(blocks)
             elements = []
             
-            for block in blocks:
+            for index, block in enumerate(blocks):
                 bbox = block["bbox"]
                 norm = normalize_bbox(bbox, width, height)
 
@@ -225,7 +411,27 @@ class SimpleFormulaDetector(BasePDFEngine):
                         text += "\n"
                     content = text.strip()
                     
-                    if self._contains_formula(content):
+                    kind = block_kind(block)
+                    if kind is not None:
+                        elements.append({
+                            "id": self.generate_id(),
+                            "page": page_num + 1,
+                            "type": "formula",
+                            "content": content,
+                            "bbox": norm,
+                            "formula_type": kind,
+                            "detected_by": "font",
+                            # 块内的公式区域 (行内公式只占块的一部分)
+                            "regions": [
+                                {
+                                    "kind": region["kind"],
+                                    "text": region["text"],
+                                    "bbox": normalize_bbox(region["bbox"], width, height)
+                                }
+                                for region in regions if region["block"] == index
+                            ]
+                        })
+                    elif self._contains_formula(content):
                          elements.append({
                             "id": self.generate_id(),
                             "page": page_num + 1,
@@ -248,7 +454,8 @@ class SimpleFormulaDetector(BasePDFEngine):
                         "id": self.generate_id(),
                         "page": page_num + 1,
                         "type": "image",
-                        "bbox": norm
+                        "bbox": norm,
+                        "xref": block["xref"]
                     })
             
             # 【核心修改】已删除 elements.sort(...)
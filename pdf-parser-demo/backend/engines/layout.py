@@ -0,0 +1,202 @@
+"""
+词 -> 行 -> 块 的版面聚合
+
+pdfplumber 的 extract_words() 每个词一个元素，中文长文档动辄几万个元素。
+这里按基线 (bottom) 和间距统计把词聚成行、把行聚成块，输出合并后的 bbox。
+
+中日文 (CJK) 没有词间空格，段落之间通常也没有额外的行距，所以大部分是 CJK 的页面另有规则：
+行内与 CJK 字符相邻的词直接拼接；栏间距按字高判断；只有上一行排满 (折行) 时下一行才并入同一块。
+"""
+
+from statistics import median
+
+GRANULARITIES = ("word", "line", "block")
+
+# 页面可见字符中 CJK 占比超过这个值时按 CJK 规则聚合
+CJK_PAGE_RATIO = 0.5
+
+
+def _is_cjk(ch):
+    """汉字、假名、CJK 标点和全角字符 (韩文有词间空格，不算)"""
+    code = ord(ch)
+    return (
+        0x2E80 <= code <= 0x30FF      # 部首、CJK 标点、假名
+        or 0x3400 <= code <= 0x9FFF   # 汉字
+        or 0xF900 <= code <= 0xFAFF   # 兼容汉字
+        or 0xFF00 <= code <= 0xFFEF   # 全角字母数字 / 标点
+    )
+
+
+def _no_space(ch):
+    """拼接时两侧不加空格的字符：CJK 字符，但全角字母数字按西文词处理 ("ＤＩＮＧ Ｌｉｎ")"""
+    return _is_cjk(ch) and not (0xFF00 <= ord(ch) <= 0xFFEF and ch.isalnum())
+
+
+def mostly_cjk(items):
+    """items 的 "text" 中 CJK 字符 (含全角字符) 是否占多数"""
+    chars = [ch for item in items for ch in item["text"] if not ch.isspace()]
+    return bool(chars) and sum(map(_is_cjk, chars)) > CJK_PAGE_RATIO * len(chars)
+
+
+def _join_words(words):
+    """词之间用空格连接，接缝任一侧是 CJK 字符时直接拼接 (pdfplumber 会在字距较大处把中文断成多个 "词")"""
+    text = words[0]["text"]
+    for word in words[1:]:
+        if text and word["text"] and (_no_space(text[-1]) or _no_space(word["text"][0])):
+            text += word["text"]
+        else:
+            text += " " + word["text"]
+    return text
+
+
+def _bbox(items):
+    return [
+        min(i["x0"] for i in items),
+        min(i["top"] for i in items),
+        max(i["x1"] for i in items),
+        max(i["bottom"] for i in items),
+    ]
+
+
+def _line_item(words):
+    x0, top, x1, bottom = _bbox(words)
+    return {
+        "words": words,
+        "text": _join_words(words),
+        "x0": x0, "top": top, "x1": x1, "bottom": bottom,
+    }
+
+
+def group_lines(words):
+    """
+    同一基线 (bottom 相差不超过半个字高) 的词为一行；
+    行内水平间距超过 max(3 倍中位词距, 半个字高) 时断开 (双栏排版的栏间距)。
+    CJK 页面的 "词距" 只出现在少数字距较大的地方，中位数不可靠，改为超过 1.5 个字高时断开。
+    """
+    if not words:
+        return []
+
+    heights = [w["bottom"] - w["top"] for w in words]
+    y_tol = max(median(heights) * 0.5, 1.0)
+
+    rows = []
+    for w in sorted(words, key=lambda w: (w["bottom"], w["x0"])):
+        if rows and w["bottom"] - rows[-1][-1]["bottom"] <= y_tol:
+            rows[-1].append(w)
+        else:
+            rows.append([w])
+    for row in rows:
+        row.sort(key=lambda w: w["x0"])
+
+    gaps = [
+        cur["x0"] - prev["x1"]
+        for row in rows
+        for prev, cur in zip(row, row[1:])
+        if cur["x0"] > prev["x1"]
+    ]
+    if mostly_cjk(words):
+        split_gap = median(heights) * 1.5
+    else:
+        split_gap = max(3 * median(gaps) if gaps else 0, median(heights) * 0.5)
+
+    lines = []
+    for row in rows:
+        current = [row[0]]
+        for prev, cur in zip(row, row[1:]):
+            if cur["x0"] - prev["x1"] > split_gap:
+                lines.append(_line_item(current))
+                current = []
+            current.append(cur)
+        lines.append(_line_item(current))
+    return lines
+
+
+def _height(line):
+    return line["bottom"] - line["top"]
+
+
+def _full_lines(lines):
+    """
+    两端对齐排版中排满 (折行) 的行的 id：右端与至少另外两行对齐，且不短于中位行宽的一半。
+    段落末行、标题、短列表项的右端各不相同。
+    """
+    width = median(l["x1"] - l["x0"] for l in lines)
+    full = set()
+    for line in lines:
+        tol = _height(line) * 0.5
+        aligned = sum(1 for other in lines if abs(other["x1"] - line["x1"]) <= tol)
+        if aligned >= 3 and line["x1"] - line["x0"] >= width * 0.5:
+            full.add(id(line))
+    return full
+
+
+def _cjk_continues(last, line, full):
+    """CJK 页面：上一行排满、本行没有首行缩进、两行字高相近且行距不超过一个字高时才属于同一段"""
+    height = min(_height(last), _height(line))
+    gap = line["top"] - last["bottom"]
+    overlap = min(last["x1"], line["x1"]) - max(last["x0"], line["x0"])
+    return (
+        overlap > 0
+        and -height * 0.5 <= gap <= height
+        and max(_height(last), _height(line)) <= height * 1.3
+        and id(last) in full
+        and line["x0"] <= last["x0"] + height * 0.5
+    )
+
+
+def group_blocks(lines):
+    """
+    行距不超过 1.5 倍中位行高、且水平方向有重叠的相邻行为一块。
+    CJK 页面的段间距与行距相同，按行距会把整节合成一块，改按折行和首行缩进分段 (见 _cjk_continues)。
+    返回按块首行位置排序的块列表，每块内的行按从上到下排序。
+    """
+    if not lines:
+        return []
+
+    cjk = mostly_cjk(lines)
+    full = _full_lines(lines) if cjk else set()
+    line_height = median(_height(l) for l in lines)
+    max_gap = line_height * 1.5
+
+    blocks = []
+    for line in sorted(lines, key=lambda l: (l["top"], l["x0"])):
+        for block in reversed(blocks):
+            last = block[-1]
+            if cjk:
+                joined = _cjk_continues(last, line, full)
+            else:
+                gap = line["top"] - last["bottom"]
+                overlap = min(last["x1"], line["x1"]) - max(last["x0"], line["x0"])
+                joined = overlap > 0 and -line_height * 0.5 <= gap <= max_gap
+            if joined:
+                block.append(line)
+                break
+        else:
+            blocks.append([line])
+    return blocks
+
+
+def group_words(words, granularity="line"):
+    """
+    把词按 granularity 聚合，返回 [{"text", "bbox"}]，顺序为按块的阅读顺序。
+    granularity == "word" 时原样返回每个词。
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {GRANULARITIES}")
+    if granularity == "word":
+        return [
+            {"text": w["text"], "bbox": [w["x0"], w["top"], w["x1"], w["bottom"]]}
+            for w in words
+        ]
+
+    blocks = group_blocks(group_lines(words))
+    if granularity == "line":
+        return [
+            {"text": line["text"], "bbox": [line["x0"], line["top"], line["x1"], line["bottom"]]}
+            for block in blocks
+            for line in block
+        ]
+    return [
+        {"text": "\n".join(line["text"] for line in block), "bbox": _bbox(block)}
+        for block in blocks
+    ]
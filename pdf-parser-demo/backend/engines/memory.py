@@ -0,0 +1,107 @@
+"""
+进程内存 (RSS) 监控
+
+pdfplumber / pdfminer 解析大文档时内存随页数线性增长，一个 worker 很容易被撑到几个 GB。
+RSSGuard 在每页处理完后检查当前进程的 RSS 比解析开始时增长了多少：超过增长上限时先 gc 一次，仍超过则抛出
+MemoryLimitExceeded，由调用方中止解析，而不是等着被 OOM killer 杀掉。
+这是增长量上限，不是进程 RSS 的上限：预加载的模型和解析开始前已占用的内存不计入，进程的 RSS 可以远高于它；
+但 RSS 只能按进程测量，同一进程里同时进行的其它请求在这段时间内增长的内存也会算进来。
+process_memory_mb 给出 /metrics 用的 rss / uss / pss (多个 worker 共享预加载模型时看 uss)。
+"""
+
+import gc
+import os
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 默认的增长上限 (MB，解析期间 RSS 的增长量)，设为 0 表示不限制。
+# 语料库里最大的文档 low_memory 解析时增长不到 30 MB，1 GB 留出了同进程其它请求的余量，只拦住失控的文档
+DEFAULT_MAX_RSS_GROWTH_MB = float(os.environ.get("PDF_PARSER_MAX_RSS_GROWTH_MB", 1024))
+
+
+class MemoryLimitExceeded(RuntimeError):
+    pass
+
+
+def current_rss_mb():
+    """当前进程的常驻内存 (MB)。没有 psutil 时读 /proc/self/statm (仅 Linux)"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def process_memory_mb():
+    """
+    当前进程的 rss / uss / pss (MB)。uss 是只属于本进程的内存 (进程退出时真正释放的部分)，
+    fork 前加载、之后只读的模型权重与父进程共享，计入 rss 但不计入 uss。
+    没有 psutil 时读 /proc/self/smaps_rollup (Linux 4.14+)，都不可用时 uss / pss 为 None。
+    """
+    if psutil is not None:
+        try:
+            info = psutil.Process().memory_full_info()
+            return {
+                "rss_mb": round(info.rss / (1024 * 1024), 1),
+                "uss_mb": round(info.uss / (1024 * 1024), 1),
+                "pss_mb": round(info.pss / (1024 * 1024), 1) if hasattr(info, "pss") else None,
+            }
+        except (psutil.Error, OSError):
+            pass
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    if "Rss" not in fields:
+        return {"rss_mb": round(current_rss_mb(), 1), "uss_mb": None, "pss_mb": None}
+    return {
+        "rss_mb": round(fields["Rss"], 1),
+        "uss_mb": round(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), 1),
+        "pss_mb": round(fields["Pss"], 1) if "Pss" in fields else None,
+    }
+
+
+class RSSGuard:
+    """
+    growth_limit_mb: 允许的 RSS 增长量 (相对创建时的 RSS，不是 RSS 本身的上限)，为 None / 0 时只记录峰值，不做限制。
+    check() 应在每个可释放内存的节点 (如每页处理完) 调用。
+    """
+
+    def __init__(self, growth_limit_mb=None):
+        limit = float(growth_limit_mb or 0)
+        self.growth_limit_mb = limit if limit > 0 else None
+        self.start_mb = current_rss_mb()
+        self.peak_mb = self.start_mb
+
+    def check(self, context=""):
+        rss = current_rss_mb()
+        if self.growth_limit_mb is not None and rss - self.start_mb > self.growth_limit_mb:
+            gc.collect()
+            rss = current_rss_mb()
+            if rss - self.start_mb > self.growth_limit_mb:
+                self.peak_mb = max(self.peak_mb, rss)
+                raise MemoryLimitExceeded(
+                    f"RSS grew {rss - self.start_mb:.0f} MB (to {rss:.0f} MB), "
+                    f"exceeds growth limit {self.growth_limit_mb:.0f} MB {context}".strip()
+                )
+        self.peak_mb = max(self.peak_mb, rss)
+        return rss
+
+    def to_dict(self):
+        return {
+            "growth_limit_mb": self.growth_limit_mb,
+            "start_rss_mb": round(self.start_mb, 1),
+            "peak_rss_mb": round(self.peak_mb, 1),
+            "growth_mb": round(self.peak_mb - self.start_mb, 1),
+        }
@@ -0,0 +1,126 @@
+"""
+按页分块的多进程解析
+
+pdfminer 的版面分析是纯 Python，受 GIL 限制只能用满一个核。这里把页码列表切成连续的块，
+每个 worker 进程自己打开 PDF 处理一块，主进程按页序合并，并重新编排元素 id。
+
+默认不并行 (workers=1)。并行只在有空闲 CPU 核时才可能更快：每块都要重新打开 PDF，worker 启动、
+结果序列化回主进程也有开销。目前只在 1 核机器上测过 (bench_engines.py pdfplumber-parallel)，
+workers=2 / 4 没有加速，反而更慢 (xia2007 1.94s -> 2.42s / 1.90s，adgate2014 4.16s -> 4.64s / 5.02s)。
+多核机器上能快多少没有实测；gunicorn 的各 worker 已经在并行处理请求时，再开进程只会互相抢核。
+按需对单个大文档使用 workers=N (N 不超过空闲核数)，先用上面的基准确认。
+"""
+
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# 解析在 Flask / gunicorn 的请求线程里进行，直接 fork 会把其它线程当时持有的锁 (malloc、日志、
+# 模型的线程池) 原样复制进子进程，子进程可能永远等不到它们释放。
+# forkserver 从一个单线程的服务进程 fork 出 worker，不继承请求进程的线程状态；没有 forkserver 的平台用 spawn。
+# 服务进程预先导入 engines，worker 启动时不必重新导入 pdfplumber / fitz 等依赖。
+START_METHOD = os.environ.get("PDF_PARSER_START_METHOD") or (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+MP_CONTEXT = multiprocessing.get_context(START_METHOD)
+if START_METHOD == "forkserver":
+    MP_CONTEXT.set_forkserver_preload(["engines"])
+
+# 每个 worker 分到的块数：块越多负载越均衡 (含表格的页明显更慢)，但每块都要重新打开一次 PDF
+CHUNKS_PER_WORKER = 4
+# 每块最少页数，避免小文档被切得过碎
+MIN_CHUNK_PAGES = 4
+
+
+def resolve_workers(value):
+    """workers 选项："auto" / "0" 表示使用全部 CPU 核，默认 1 (不并行)"""
+    if value in (None, "", 1, "1"):
+        return 1
+    if value in ("auto", 0, "0"):
+        return os.cpu_count() or 1
+    workers = int(value)
+    if workers < 1:
+        raise ValueError("workers must be a positive integer or 'auto'")
+    return workers
+
+
+def split_pages(page_numbers, workers, chunks_per_worker=CHUNKS_PER_WORKER, min_chunk=MIN_CHUNK_PAGES):
+    """把有序页码列表切成连续的块"""
+    page_numbers = list(page_numbers)
+    if not page_numbers:
+        return []
+    size = max(min_chunk, math.ceil(len(page_numbers) / (workers * chunks_per_worker)))
+    return [page_numbers[i:i + size] for i in range(0, len(page_numbers), size)]
+
+
+def map_chunks(func, chunks, workers, *args):
+    """
+    在进程池中执行 func(chunk, *args)，按 chunks 的顺序逐个产出结果 (先完成的块会等待前面的块)。
+    只有一个块或 workers == 1 时直接在当前进程执行。
+    """
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield func(chunk, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=MP_CONTEXT) as pool:
+        futures = [pool.submit(func, chunk, *args) for chunk in chunks]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # 调用方提前停止 (如流式响应被客户端断开) 时不再启动剩余的块
+            for future in futures:
+                future.cancel()
+
+
+def renumber_ids(engine, page_data):
+    """worker 中的 id 各自从 1 开始，合并时按页序用主进程的计数器重新编号"""
+    for element in page_data.get("elements", []):
+        element["id"] = engine.generate_id()
+    return page_data
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def run_jobs(func, jobs, workers, timeouts=None):
+    """
+    在进程池中执行 func(*job)，返回与 jobs 等长的结果列表；失败的 job 对应位置为异常对象
+    (超时为 JobTimeout)，由调用方决定如何处理。
+    timeouts: 每个 job 的超时秒数列表 (None 表示不限)。计时从主进程开始等待该 job 时算起，
+    因此实际允许时间不少于 timeout。某个 job 超时后，卡住的 worker 无法单独结束：
+    整个进程池被终止，尚未完成的 job 在新的进程池中重新提交。
+    """
+    results = [None] * len(jobs)
+    timeouts = timeouts or [None] * len(jobs)
+    pending = list(range(len(jobs)))
+    while pending:
+        pool = MP_CONTEXT.Pool(min(workers, len(pending)))
+        handles = {i: pool.apply_async(func, jobs[i]) for i in pending}
+        resubmit = []
+        try:
+            for k, i in enumerate(pending):
+                try:
+                    results[i] = handles[i].get(timeouts[i])
+                except multiprocessing.TimeoutError:
+                    results[i] = JobTimeout(f"timed out after {timeouts[i]:g}s")
+                    # 收集已经完成的结果，其余的重新提交
+                    for j in pending[k + 1:]:
+                        if handles[j].ready():
+                            try:
+                                results[j] = handles[j].get()
+                            except Exception as e:
+                                results[j] = e
+                        else:
+                            resubmit.append(j)
+                    break
+                except Exception as e:
+                    results[i] = e
+        finally:
+            pool.terminate()
+            pool.join()
+        pending = resubmit
+    return results
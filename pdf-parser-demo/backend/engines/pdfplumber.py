@@ -1,91 +1,324 @@
-from .base import BasePDFEngine, normalize_bbox
+from .base import BasePDFEngine, normalize_bbox, parse_page_set, parse_flag
+from .geometry import get_geometry
+from .layout import GRANULARITIES, group_words
+from .memory import DEFAULT_MAX_RSS_GROWTH_MB, RSSGuard
+from .parallel import map_chunks, renumber_ids, resolve_workers, split_pages
+from .word_cluster import BACKENDS as WORD_BACKENDS, page_words
+from .table_screen import TEXT_STRATEGY, TableScreenStats, rules_regions, screen_page, search_clip, plumber_edges, plumber_words
+from .formula_spans import CharFormulaIndex
 import pdfplumber
+from pdfplumber.page import Page
+import pdfminer
+from pdfminer.pdfpage import PDFPage
+
+ENGINE_NAME = "pdfplumber (Fully Unleashed)"
+
+
+# low_memory 释放缓存用到的 PDFDocument._cached_objs 在这个 pdfminer.six 版本上确认过 (requirements.txt 固定了版本)
+PDFMINER_CHECKED_VERSION = "20251230"
+
+# 缺少 pdfminer 私有缓存属性的提示只打印一次
+_cache_warned = False
+
+
+def _iter_pages_lazily(pdf, page_numbers=None):
+    """
+    逐页创建 pdfplumber Page。pdf.pages 会一次性为所有页建立 Page 对象并在整个 with 块内持有，
+    每页的内容流 / 版面对象也就一直挂在上面；这里每次只持有当前页。
+    """
+    doctop = 0
+    for i, page_obj in enumerate(PDFPage.create_pages(pdf.doc)):
+        page = Page(pdf, page_obj, page_number=i + 1, initial_doctop=doctop)
+        doctop += page.height
+        if page_numbers is None or page.page_number in page_numbers:
+            yield page
+
+
+def _clear_object_cache(pdf):
+    """
+    清空 pdfminer 按对象号缓存的已解码对象 (PDFDocument._cached_objs，私有属性)。
+    pdfminer 升级后没有这个属性时只是少释放一些内存，打印一次提示，不影响解析。
+    """
+    global _cache_warned
+    cached = getattr(getattr(pdf, "doc", None), "_cached_objs", None)
+    if hasattr(cached, "clear"):
+        cached.clear()
+    elif not _cache_warned:
+        _cache_warned = True
+        print(f"pdfminer.six {pdfminer.__version__} PDFDocument has no _cached_objs "
+              f"(checked on {PDFMINER_CHECKED_VERSION}), low_memory will not release decoded objects")
+
+
+def _close_stream(pdf):
+    """关闭 pdfplumber 打开的文件。pdf.close() 会经由 pdf.pages 为所有页重新建立 Page 对象，所以只关文件"""
+    stream = getattr(pdf, "stream", None)
+    if stream is not None and hasattr(stream, "close"):
+        stream.close()
+    else:
+        pdf.close()
+
+
+def _parse_chunk(page_numbers, filepath, table_screen, options):
+    """worker 进程入口：解析一块连续的页，返回 (pages, summary)"""
+    engine = PdfPlumberEngine(table_screen=table_screen)
+    pages_data = []
+    summary = {}
+    for record in engine.stream(filepath, pages=page_numbers, workers=1, **options):
+        if record["type"] == "page":
+            pages_data.append(record["page"])
+        else:
+            summary = record
+    return pages_data, summary
+
 
 class PdfPlumberEngine(BasePDFEngine):
-    def parse(self, filepath):
-        self.element_counter = 0
+    def __init__(self, table_screen=True, max_rss_growth_mb=DEFAULT_MAX_RSS_GROWTH_MB, workers=1, word_backend="numpy"):
+        super().__init__()
+        # 是否在 find_tables 之前做表格预筛选 (见 table_screen.py)
+        self.table_screen = table_screen
+        # low_memory 模式下解析期间 RSS 增长量的上限 (MB，见 memory.RSSGuard)，0 表示不限制；可被 max_rss_growth_mb 选项覆盖
+        self.max_rss_growth_mb = max_rss_growth_mb
+        # 默认的 worker 进程数，可被 workers 选项覆盖 (见 parallel.py)
+        self.workers = workers
+        # 字符 -> 词 的聚类实现："numpy" (见 word_cluster.py) 或 "pdfplumber" (page.extract_words)
+        self.word_backend = word_backend
+
+    def parse(self, filepath, **options):
+        """
+        granularity: 文本元素粒度 "word" / "line" / "block"，默认 "block" (每块一个元素；英文论文的 JSON 比 "word" 小 16-26 倍，"line" 只小 5-7 倍)。
+                     中文为主的页面按折行 / 首行缩进分段，见 layout.group_blocks
+        word_pages:  这些页仍输出词级元素，如 "3,5-7"
+        pages:       只解析这些页 (默认全部)，如 "1-10"
+        low_memory:  每页输出后立即释放该页的缓存，并检查 RSS 自解析开始的增长量是否超过 max_rss_growth_mb
+                     (增长量上限，默认 1024 MB，0 为不限制；不是进程 RSS 的上限)
+        workers:     worker 进程数 ("auto" 为全部 CPU 核)，按页分块并行解析；默认 1，
+                     只在有空闲核时可能更快，1 核机器上更慢 (见 parallel.py)
+        word_backend: 字符聚类成词的实现 "numpy" / "pdfplumber"，两者输出一致
+        """
         pages_data = []
+        summary = {}
+        for record in self.stream(filepath, **options):
+            if record["type"] == "page":
+                pages_data.append(record["page"])
+            else:
+                summary = record
+
+        result = {
+            "metadata": {}, 
+            "pages": pages_data,
+            "table_screen": summary.get("table_screen"),
+            "engine": ENGINE_NAME
+        }
+        for key in ("memory", "workers"):
+            if key in summary:
+                result[key] = summary[key]
+        return result
+
+    def stream(self, filepath, granularity="block", word_pages=None, pages=None,
+               low_memory=False, max_rss_growth_mb=None, workers=None, word_backend=None, **options):
+        """
+        逐页产出结果：{"type": "page", "page": {...}}，最后是 {"type": "summary", ...}。
+        low_memory 时内存峰值与文档页数基本无关，RSS 增长超过上限时抛出 MemoryLimitExceeded。
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {GRANULARITIES}")
+        word_pages = parse_page_set(word_pages) or set()
+        pages = parse_page_set(pages)
+        low_memory = parse_flag(low_memory)
+        workers = resolve_workers(self.workers if workers is None else workers)
+        word_backend = word_backend or self.word_backend
+        if word_backend not in WORD_BACKENDS:
+            raise ValueError(f"word_backend must be one of {WORD_BACKENDS}")
+
+        if workers > 1:
+            yield from self._stream_parallel(filepath, pages, workers, {
+                "granularity": granularity,
+                "word_pages": word_pages,
+                "low_memory": low_memory,
+                "max_rss_growth_mb": max_rss_growth_mb,
+                "word_backend": word_backend,
+            })
+            return
+
+        if max_rss_growth_mb is None:
+            max_rss_growth_mb = self.max_rss_growth_mb
+        guard = RSSGuard(max_rss_growth_mb) if low_memory else None
+
+        self.element_counter = 0
+        screen_stats = TableScreenStats()
         
-        with pdfplumber.open(filepath) as pdf:
-            for i, page in enumerate(pdf.pages):
-                width = float(page.width)
-                height = float(page.height)
-                
-                elements = []
-                
-                # 1. 提取表格 (Tables)
-                # pdfplumber 的表格提取非常强大
-                try:
-                    tables = page.find_tables()
-                    for table in tables:
-                        norm = normalize_bbox(table.bbox, width, height)
-                        # 尝试提取表格数据作为 content，而不仅仅是 "Table Data"
-                        # extract() 返回 [['row1_col1', ...], ...]
-                        table_content = table.extract() 
-                        content_str = str(table_content) if table_content else "Table"
-                        
-                        elements.append({
-                            "id": self.generate_id(),
-                            "page": i + 1,
-                            "type": "table",
-                            "content": content_str, 
-                            "bbox": norm,
-                            "raw_bbox": table.bbox # 用于后续去重
-                        })
-                except Exception as e:
-                    print(f"Table extraction error on page {i+1}: {e}")
-
-                # 2. 提取图片 (Images) - 【新功能已释放】
-                # pdfplumber 原生支持图片对象提取
-                try:
-                    for img in page.images:
-                        # pdfplumber image dict contains x0, top, x1, bottom
-                        bbox = [img['x0'], img['top'], img['x1'], img['bottom']]
-                        norm = normalize_bbox(bbox, width, height)
-                        elements.append({
-                            "id": self.generate_id(),
-                            "page": i + 1,
-                            "type": "image",
-                            "bbox": norm
-                        })
-                except Exception as e:
-                    print(f"Image extraction error on page {i+1}: {e}")
-
-                # 3. 提取文本 (Text words)
-                words = page.extract_words()
-                for word in words:
-                    bbox = [word['x0'], word['top'], word['x1'], word['bottom']]
-                    norm = normalize_bbox(bbox, width, height)
-                    content = word['text']
-                    
-                    # 简单的去重逻辑：如果文本完全在某个表格内部，可以选择忽略
-                    # 这里为了"全能力释放"，我们保留所有内容，交给前端去渲染
-                    
-                    # 简单公式检测
-                    type_ = "text"
-                    if content.startswith('$') and content.endswith('$'):
-                        type_ = "formula"
-
-                    elements.append({
-                        "id": self.generate_id(),
-                        "page": i + 1,
-                        "type": type_,
-                        "content": content,
-                        "bbox": norm
-                    })
-                
-                # 【重要】不要在这里强制排序，信任提取顺序
-                # 或者按照垂直位置微调（可选），但 pdfplumber extract_words 默认已经是排好序的
+        if not low_memory:
+            with pdfplumber.open(filepath, pages=sorted(pages) if pages else None) as pdf:
+                for page in pdf.pages:
+                    page_granularity = "word" if page.page_number in word_pages else granularity
+                    yield {"type": "page", "page": self._parse_page(page, page_granularity, word_backend, screen_stats)}
+        else:
+            pdf = pdfplumber.open(filepath)
+            try:
+                for page in _iter_pages_lazily(pdf, pages):
+                    page_granularity = "word" if page.page_number in word_pages else granularity
+                    page_data = self._parse_page(page, page_granularity, word_backend, screen_stats)
+                    # 释放本页的版面对象 / 文本缓存，以及 pdfminer 按对象号缓存的已解码内容流
+                    # (字体由 PDFResourceManager 单独缓存，不受影响)
+                    page.close()
+                    del page
+                    _clear_object_cache(pdf)
+                    guard.check(f"after page {page_data['page_number']}")
+                    yield {"type": "page", "page": page_data}
+            finally:
+                # 不调用 pdf.close()：它会经由 pdf.pages 为所有页重新建立 Page 对象
+                _close_stream(pdf)
+
+        summary = {
+            "type": "summary",
+            "table_screen": screen_stats.to_dict(),
+            "engine": ENGINE_NAME
+        }
+        if guard is not None:
+            summary["memory"] = guard.to_dict()
+        yield summary
+
+    def _stream_parallel(self, filepath, pages, workers, chunk_options):
+        """按页分块交给 worker 进程，按页序合并；元素 id 在主进程中重新连续编号"""
+        # 页数取自共享的几何信息，不再为了数页数让 pdfplumber 建立全部 Page 对象
+        page_count = get_geometry(filepath)["page_count"]
+        page_numbers = [n for n in range(1, page_count + 1) if pages is None or n in pages]
+        chunks = split_pages(page_numbers, workers)
+
+        self.element_counter = 0
+        screen_totals = TableScreenStats().to_dict()
+        memories = []
+        for chunk_pages, chunk_summary in map_chunks(
+            _parse_chunk, chunks, workers, filepath, self.table_screen, chunk_options
+        ):
+            for page_data in chunk_pages:
+                yield {"type": "page", "page": renumber_ids(self, page_data)}
+            for key, value in chunk_summary["table_screen"].items():
+                screen_totals[key] = screen_totals.get(key, 0) + value
+            if "memory" in chunk_summary:
+                memories.append(chunk_summary["memory"])
+
+        summary = {
+            "type": "summary",
+            "table_screen": screen_totals,
+            "engine": ENGINE_NAME,
+            "workers": max(1, min(workers, len(chunks))),
+        }
+        if memories:
+            # 每个 worker 进程单独受 RSS 上限约束，这里报告各块中的最大峰值
+            summary["memory"] = {
+                "growth_limit_mb": memories[0]["growth_limit_mb"],
+                "start_rss_mb": min(m["start_rss_mb"] for m in memories),
+                "peak_rss_mb": max(m["peak_rss_mb"] for m in memories),
+                "growth_mb": max(m["growth_mb"] for m in memories),
+            }
+        yield summary
+
+    def _parse_page(self, page, granularity, word_backend, screen_stats):
+        i = page.page_number - 1
+        width = float(page.width)
+        height = float(page.height)
+        
+        elements = []
+        # 文本词在表格预筛选和第 3 步中都会用到，只提取一次
+        words = page_words(page, word_backend)
+
+        # 0. 表格预筛选：默认的 lines 策略只能在横竖线网格里找到表格，标题附近的三线表另用 text 策略搜索
+        searched, clip, regions = True, None, []
+        if self.table_screen:
+            candidates = screen_page(plumber_edges(page), plumber_words(words), width, height)
+            searched, clip = search_clip(candidates, width, height)
+            regions = rules_regions(candidates, width, height)
+            screen_stats.record(clip, searched, len(regions))
+        
+        # 1. 提取表格 (Tables)
+        # pdfplumber 的表格提取非常强大
+        try:
+            if not searched:
+                tables = []
+            elif clip is not None:
+                # crop 后对象保留原页面坐标，table.bbox 无需转换
+                tables = page.crop(clip).find_tables()
+            else:
+                tables = page.find_tables()
+            for region in regions:
+                tables += page.crop(region).find_tables(table_settings=TEXT_STRATEGY)
+            for table in tables:
+                norm = normalize_bbox(table.bbox, width, height)
+                # 尝试提取表格数据作为 content，而不仅仅是 "Table Data"
+                # extract() 返回 [['row1_col1', ...], ...]
+                table_content = table.extract() 
+                content_str = str(table_content) if table_content else "Table"
                 
-                pages_data.append({
-                    "page_number": i + 1,
-                    "width": width,
-                    "height": height,
-                    "elements": elements
+                elements.append({
+                    "id": self.generate_id(),
+                    "page": i + 1,
+                    "type": "table",
+                    "content": content_str, 
+                    "bbox": norm,
+                    "raw_bbox": table.bbox # 用于后续去重
                 })
-                
+        except Exception as e:
+            print(f"Table extraction error on page {i+1}: {e}")
+
+        # 2. 提取图片 (Images) - 【新功能已释放】
+        # pdfplumber 原生支持图片对象提取
+        try:
+            for img in page.images:
+                # pdfplumber image dict contains x0, top, x1, bottom
+                bbox = [img['x0'], img['top'], img['x1'], img['bottom']]
+                norm = normalize_bbox(bbox, width, height)
+                elements.append({
+                    "id": self.generate_id(),
+                    "page": i + 1,
+                    "type": "image",
+                    "bbox": norm
+                })
+        except Exception as e:
+            print(f"Image extraction error on page {i+1}: {e}")
+
+        # 3. 提取文本 (按 granularity 聚合成 词 / 行 / 块)
+        # char_start / char_end 是该元素在本页合成文本中的偏移：
+        # 本页文本 = 本页所有文本元素的 content 按顺序用 "\n" 连接。content 是词 / 行拼出来的
+        # (行内词间补空格，CJK 之间不补；块内行间用 "\n")，所以偏移不对应 page.chars 或 extract_text() 的下标
+        offset = 0
+        # 公式按字符的字体 / 字号判断 (见 formula_spans.py)，页面没有数学字体时不建索引
+        formula_index = CharFormulaIndex(page.chars)
+        for item in group_words(words, granularity):
+            norm = normalize_bbox(item['bbox'], width, height)
+            content = item['text']
+            
+            # 简单的去重逻辑：如果文本完全在某个表格内部，可以选择忽略
+            # 这里为了"全能力释放"，我们保留所有内容，交给前端去渲染
+            
+            # 公式检测：数学字体 / 上下标，没有时再看 "$"
+            type_ = "text"
+            kind = formula_index.kind(item['bbox'])
+            if kind == "display":
+                type_ = "formula"
+            elif kind == "inline":
+                type_ = "text_with_inline_formula"
+            elif content.startswith('$') and content.endswith('$'):
+                type_ = "formula"
+
+            elements.append({
+                "id": self.generate_id(),
+                "page": i + 1,
+                "type": type_,
+                "content": content,
+                "bbox": norm,
+                "char_start": offset,
+                "char_end": offset + len(content)
+            })
+            offset += len(content) + 1
+        
+        # 【重要】不要在这里强制排序，信任提取顺序
+        # 词级输出沿用 extract_words 的顺序；行 / 块按块的阅读顺序输出
+        
         return {
-            "metadata": {}, 
-            "pages": pages_data,
-            "engine": "pdfplumber (Fully Unleashed)"
-        }
\ No newline at end of file
+            "page_number": i + 1,
+            "width": width,
+            "height": height,
+            "granularity": granularity,
+            "elements": elements
+        }
@@ -0,0 +1,119 @@
+"""
+渲染 -> 推理 的生产者 / 消费者流水线
+
+LaTeXOCREngine 原来先渲染一个窗口内的全部裁剪图，再整批识别：渲染时模型空闲，识别时渲染空闲，
+总耗时是两段之和。这里调用方线程 (页面循环) 负责渲染并把裁剪图放进有界队列，
+一个推理线程从队列里按批取出识别，两段同时进行，总耗时接近较慢的一段。
+队列有上限：推理跟不上时渲染会等待，同时保留在内存里的裁剪图不超过 queue_size 张。
+
+PyMuPDF 的文档对象不能跨线程使用，所以渲染只在打开文档的线程里进行；
+torch 在算子内部释放 GIL，推理线程不会阻塞渲染。
+"""
+
+import queue
+import threading
+import time
+
+# 队列空、但渲染还没结束时，推理线程为凑满一批最多再等这么久 (秒)
+DEFAULT_MAX_WAIT = 0.05
+
+_DONE = object()
+
+
+class BatchPipeline:
+    """
+    process_batch(items) 在推理线程中调用，items 为 put 进来的对象列表 (最多 batch_size 个)。
+    用法：
+        with BatchPipeline(process_batch, 8) as pipeline:
+            for item in produce():
+                pipeline.put(item)
+        pipeline.stats
+    """
+
+    def __init__(self, process_batch, batch_size, queue_size=None, max_wait=DEFAULT_MAX_WAIT):
+        self.process_batch = process_batch
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue(maxsize=queue_size or 2 * batch_size)
+        self._thread = threading.Thread(target=self._run, name="formula-infer", daemon=True)
+        self._cancelled = False
+        self.stats = {
+            "items": 0,
+            "batches": 0,
+            "infer_seconds": 0.0,
+            # 渲染因队列已满而等待的时间 (推理是瓶颈)
+            "producer_wait_seconds": 0.0,
+            # 推理线程等待新裁剪图的时间 (渲染是瓶颈)
+            "consumer_idle_seconds": 0.0,
+        }
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def put(self, item):
+        start = time.perf_counter()
+        self._queue.put(item)
+        self.stats["producer_wait_seconds"] += time.perf_counter() - start
+
+    def cancel(self):
+        """丢弃还没识别的裁剪图 (生产方出错时用)，之后的 close 只等正在识别的那一批"""
+        self._cancelled = True
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def close(self):
+        """通知推理线程渲染已结束，等待剩余的裁剪图识别完"""
+        if self._thread.is_alive():
+            self._queue.put(_DONE)
+            self._thread.join()
+        for key in ("infer_seconds", "producer_wait_seconds", "consumer_idle_seconds"):
+            self.stats[key] = round(self.stats[key], 3)
+        return self.stats
+
+    def _take(self, timeout):
+        start = time.perf_counter()
+        try:
+            return self._queue.get(timeout=timeout)
+        finally:
+            self.stats["consumer_idle_seconds"] += time.perf_counter() - start
+
+    def _run(self):
+        done = False
+        while not done:
+            item = self._take(None)
+            if item is _DONE:
+                break
+            batch = [item]
+            # 凑批：队列里已有的直接取，不够时最多再等 max_wait
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._take(max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+
+            if self._cancelled:
+                continue
+            start = time.perf_counter()
+            try:
+                self.process_batch(batch)
+            except Exception as e:
+                # 一批失败不影响后续：这些元素保持未识别
+                print(f"Formula pipeline batch failed: {e}")
+            self.stats["infer_seconds"] += time.perf_counter() - start
+            self.stats["items"] += len(batch)
+            self.stats["batches"] += 1
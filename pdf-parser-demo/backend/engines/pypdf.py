@@ -1,46 +1,313 @@
-from .base import BasePDFEngine, normalize_bbox
-from langchain_community.document_loaders import PyPDFLoader
+"""
+PyPDF 引擎：纯 Python 的轻量兜底解析
+
+直接用 pypdf 逐页读取，不再经过 langchain 的 PyPDFLoader：它会先把所有页加载成 Document，
+而且光导入就要将近 1 秒。行的位置来自 extract_text 的 visitor_text 回调 (文本矩阵 x 变换矩阵)。
+页面尺寸和 PDF -> 显示坐标的变换按 pypdf 读到的 CropBox / MediaBox / Rotate 计算，不依赖 PyMuPDF；
+其它引擎已经为同一文件算好共享的几何信息 (geometry.py) 时直接使用，与它们的坐标保持一致。
+
+pypdf 不给出字形宽度：行宽按字体的 /Widths 计算，复合字体 (中文等) 按字号估算，
+一个片段跨多行时后面几行的基线按行距推算，所以 bbox 是近似值。
+"""
+
+from .base import BasePDFEngine, normalize_bbox, parse_page_set
+from .layout import group_blocks
+from pypdf import PdfReader
+
+# 其它引擎已经算好的几何信息 (PyMuPDF，见 geometry.py) 只在有缓存时借用，没有 PyMuPDF 也能运行
+try:
+    from .geometry import cached_geometry
+    GEOMETRY_AVAILABLE = True
+except ImportError:
+    GEOMETRY_AVAILABLE = False
+
+ENGINE_NAME = "pypdf"
+
+GRANULARITIES = ("line", "block")
+
+# 字形在文本空间中的上下范围 (相对字号)
+ASCENT = 0.8
+DESCENT = 0.2
+# 一个片段内换行时，下一行基线相对字号的下移量
+LINE_ADVANCE = 1.2
+# 没有 /Widths 时的字宽估算 (相对字号)：半角 0.5，CJK 等全角字符 1
+HALF_WIDTH = 0.5
+FULL_WIDTH = 1.0
+
+
+def _mult(m, n):
+    return [
+        m[0] * n[0] + m[1] * n[2],
+        m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2],
+        m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4],
+        m[4] * n[1] + m[5] * n[3] + n[5],
+    ]
+
+
+def _apply(m, rect):
+    """6 元矩阵作用于矩形，返回四个角变换后的外接矩形 (x0, y0, x1, y1)"""
+    xs, ys = [], []
+    for x in (rect[0], rect[2]):
+        for y in (rect[1], rect[3]):
+            xs.append(m[0] * x + m[2] * y + m[4])
+            ys.append(m[1] * x + m[3] * y + m[5])
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def page_geometry(page, page_number):
+    """
+    pypdf 页面 -> 与 geometry.py 相同字段的几何信息 (width / height / rotation / mediabox / cropbox / pdf_to_view)。
+    PDF 坐标先平移翻转到 CropBox 左上角为原点，再按 /Rotate 顺时针旋转。
+    """
+    mediabox = [float(v) for v in page.mediabox]
+    cropbox = [float(v) for v in page.cropbox]
+    # CropBox 超出 MediaBox 的部分不显示
+    cropbox = [
+        max(cropbox[0], mediabox[0]), max(cropbox[1], mediabox[1]),
+        min(cropbox[2], mediabox[2]), min(cropbox[3], mediabox[3]),
+    ]
+    w, h = cropbox[2] - cropbox[0], cropbox[3] - cropbox[1]
+    rotation = (page.rotation or 0) % 360
+    to_page = [1, 0, 0, -1, -cropbox[0], cropbox[3]]
+    rotate = {
+        0: [1, 0, 0, 1, 0, 0],
+        90: [0, 1, -1, 0, h, 0],
+        180: [-1, 0, 0, -1, w, h],
+        270: [0, -1, 1, 0, 0, w],
+    }[rotation]
+    width, height = (h, w) if rotation in (90, 270) else (w, h)
+    return {
+        "page_number": page_number,
+        "width": width,
+        "height": height,
+        "rotation": rotation,
+        "mediabox": mediabox,
+        "cropbox": cropbox,
+        "pdf_to_view": _mult(to_page, rotate),
+    }
+
+
+def _squash(text):
+    return "".join(text.split())
+
+
+def _font_widths(font_dict):
+    """简单字体的 {字符码: 字宽 (相对字号)}；没有 /Widths (如 Type0 复合字体) 时为空"""
+    try:
+        widths = font_dict["/Widths"].get_object()
+        first = int(font_dict.get("/FirstChar", 0))
+        return {first + i: float(w) / 1000 for i, w in enumerate(widths)}
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return {}
+
+
+class _TextCollector:
+    """
+    extract_text 的回调：记录每个文本片段及其在 PDF 坐标中的近似 bbox。
+    pypdf 在 Form XObject 处理完后会把其中的文字作为一个整体再回调一次，这里去掉这份重复。
+    """
+
+    def __init__(self):
+        self.fragments = []  # {"text", "rect": (x0, y0, x1, y1) PDF 坐标, "new_line"}
+        self._calls = []     # (原始文本, 该次回调的第一个片段下标)
+        self._forms = []
+        self._widths = {}
+        self._break = False
+
+    def _widths_of(self, font_dict):
+        if font_dict is None:
+            return {}
+        key = id(font_dict)
+        if key not in self._widths:
+            self._widths[key] = _font_widths(font_dict)
+        return self._widths[key]
+
+    def visit_text(self, text, cm, tm, font_dict, font_size):
+        self._calls.append((text, len(self.fragments)))
+        if not text:
+            return
+        m = _mult(tm, cm)
+        widths = self._widths_of(font_dict)
+        for k, piece in enumerate(text.split("\n")):
+            if k > 0:
+                self._break = True
+            if not piece.strip():
+                continue
+            advance = sum(
+                widths.get(ord(ch)) or (FULL_WIDTH if ord(ch) >= 0x2E80 else HALF_WIDTH)
+                for ch in piece
+            )
+            # 文本空间中的字形框，经 m 变换到 PDF 坐标 (旋转的文字也适用)
+            base = -k * LINE_ADVANCE * font_size
+            corners = [
+                (x * font_size, base + y * font_size)
+                for x in (0, advance) for y in (-DESCENT, ASCENT)
+            ]
+            xs = [m[0] * x + m[2] * y + m[4] for x, y in corners]
+            ys = [m[1] * x + m[3] * y + m[5] for x, y in corners]
+            self.fragments.append({
+                "text": piece,
+                "rect": (min(xs), min(ys), max(xs), max(ys)),
+                "new_line": self._break,
+            })
+            self._break = False
+
+    def before_operand(self, operator, operands, cm, tm):
+        if operator == b"Do":
+            self._forms.append(len(self._calls))
+
+    def after_operand(self, operator, operands, cm, tm):
+        if operator != b"Do" or not self._forms:
+            return
+        calls = self._calls[self._forms.pop():]
+        if len(calls) < 2:
+            return
+        echo, first = calls[-1]
+        inner = _squash("".join(text for text, _ in calls[:-1]))
+        if _squash(echo) and inner.endswith(_squash(echo)):
+            del self.fragments[first:]
+            self._calls.pop()
+
+
+def _assemble_lines(fragments, page_geometry):
+    """按内容顺序把同一基线上的片段拼成行，返回显示坐标下的行 ({"text", "x0", "top", "x1", "bottom"})"""
+    width, height = page_geometry["width"], page_geometry["height"]
+    lines = []
+    for fragment in fragments:
+        x0, top, x1, bottom = _apply(page_geometry["pdf_to_view"], fragment["rect"])
+        line = lines[-1] if lines else None
+        if line is not None and not fragment["new_line"]:
+            overlap = min(bottom, line["bottom"]) - max(top, line["top"])
+            same_line = overlap >= 0.5 * min(bottom - top, line["bottom"] - line["top"])
+        else:
+            same_line = False
+        if same_line:
+            line["text"] += fragment["text"]
+            line["x0"], line["top"] = min(line["x0"], x0), min(line["top"], top)
+            line["x1"], line["bottom"] = max(line["x1"], x1), max(line["bottom"], bottom)
+        else:
+            lines.append({"text": fragment["text"], "x0": x0, "top": top, "x1": x1, "bottom": bottom})
+
+    result = []
+    for line in lines:
+        line["text"] = line["text"].strip()
+        if not line["text"]:
+            continue
+        # pypdf 的位置偶尔落在页面外 (如 Form XObject 内的文字不含外层变换)，裁到页面内
+        line["x0"], line["top"] = max(0.0, line["x0"]), max(0.0, line["top"])
+        line["x1"], line["bottom"] = min(width, line["x1"]), min(height, line["bottom"])
+        line["outside"] = line["x0"] >= line["x1"] or line["top"] >= line["bottom"]
+        result.append(line)
+    return result
+
 
 class PyPDFEngine(BasePDFEngine):
-    def parse(self, filepath):
-        self.element_counter = 0
-        loader = PyPDFLoader(filepath)
-        pages = loader.load()
-        
+    def parse(self, filepath, **options):
+        """
+        granularity: 文本元素粒度 "line" / "block"，默认 "line"
+        pages:       只解析这些页 (默认全部)，如 "1-10"
+        """
         pages_data = []
-        for i, doc in enumerate(pages):
-            # Split content by lines to find potential formulas
-            lines = doc.page_content.split('\n')
-            elements = []
-            for line in lines:
-                content = line.strip()
-                if not content: continue
-                
-                if content.startswith('$') and content.endswith('$'):
-                    elements.append({
-                        "id": self.generate_id(),
-                        "page": i + 1,
-                        "type": "formula",
-                        "content": content,
-                        "bbox": None
-                    })
-                else:
-                    elements.append({
-                        "id": self.generate_id(),
-                        "page": i + 1,
-                        "type": "text",
-                        "content": content,
-                        "bbox": None
-                    })
-            
-            pages_data.append({
-                "page_number": i + 1,
-                "width": 0,
-                "height": 0,
-                "elements": elements
-            })
+        metadata = {}
+        for record in self.stream(filepath, **options):
+            if record["type"] == "page":
+                pages_data.append(record["page"])
+            else:
+                metadata = record["metadata"]
         return {
-            "metadata": {},
-            "pages": pages_data
+            "metadata": metadata,
+            "pages": pages_data,
+            "engine": ENGINE_NAME
         }
 
+    def stream(self, filepath, granularity="line", pages=None, **options):
+        """
+        逐页产出结果：{"type": "page", "page": {...}}，最后是 {"type": "summary", ...}。
+        页面对象按需读取，解析过的页不保留在内存里。
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {GRANULARITIES}")
+        pages = parse_page_set(pages)
+
+        self.element_counter = 0
+        geometry = cached_geometry(filepath) if GEOMETRY_AVAILABLE else None
+        shared_pages = geometry["pages"] if geometry else []
+        reader = PdfReader(filepath)
+        if reader.is_encrypted:
+            reader.decrypt("")
+
+        for index in range(len(reader.pages)):
+            if pages is not None and index + 1 not in pages:
+                continue
+            # pypdf 与 PyMuPDF 数出的页数可能不同 (损坏的页树)，超出共享几何信息的页按 pypdf 自己计算
+            if index < len(shared_pages):
+                geo = shared_pages[index]
+            else:
+                geo = page_geometry(reader.pages[index], index + 1)
+            yield {"type": "page", "page": self._parse_page(reader, index, geo, granularity)}
+
+        metadata = {}
+        try:
+            metadata = {key.lstrip("/"): str(value) for key, value in (reader.metadata or {}).items()}
+        except Exception as e:
+            print(f"PyPDF metadata error: {e}")
+        yield {"type": "summary", "metadata": metadata, "engine": ENGINE_NAME}
+
+    def _parse_page(self, reader, index, page_geometry, granularity):
+        width, height = page_geometry["width"], page_geometry["height"]
+        collector = _TextCollector()
+        try:
+            reader.pages[index].extract_text(
+                visitor_text=collector.visit_text,
+                visitor_operand_before=collector.before_operand,
+                visitor_operand_after=collector.after_operand,
+            )
+        except Exception as e:
+            print(f"PyPDF text extraction error on page {index + 1}: {e}")
+
+        lines = _assemble_lines(collector.fragments, page_geometry)
+        if granularity == "block":
+            items = [
+                {
+                    "text": "\n".join(line["text"] for line in block),
+                    "bbox": [
+                        min(l["x0"] for l in block), min(l["top"] for l in block),
+                        max(l["x1"] for l in block), max(l["bottom"] for l in block),
+                    ],
+                    "outside": all(l["outside"] for l in block),
+                }
+                for block in group_blocks(lines)
+            ]
+        else:
+            items = [
+                {"text": l["text"], "bbox": [l["x0"], l["top"], l["x1"], l["bottom"]], "outside": l["outside"]}
+                for l in lines
+            ]
+
+        # char_start / char_end：本页文本 = 本页所有元素的 content 按顺序用 "\n" 连接
+        elements = []
+        offset = 0
+        for item in items:
+            content = item["text"]
+            type_ = "text"
+            if content.startswith('$') and content.endswith('$'):
+                type_ = "formula"
+            elements.append({
+                "id": self.generate_id(),
+                "page": index + 1,
+                "type": type_,
+                "content": content,
+                "bbox": None if item["outside"] else normalize_bbox(item["bbox"], width, height),
+                "char_start": offset,
+                "char_end": offset + len(content)
+            })
+            offset += len(content) + 1
+
+        return {
+            "page_number": index + 1,
+            "width": width,
+            "height": height,
+            "elements": elements
+        }
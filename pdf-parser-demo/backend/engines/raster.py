@@ -0,0 +1,58 @@
+"""
+渲染结果 (fitz.Pixmap) -> NumPy 数组 / PIL 图片，不经过 PNG 编解码
+
+原来裁剪图先 pix.tobytes("png") 压缩，再 Image.open(BytesIO(...)) 解压，
+一张 2 倍渲染的公式图要白白做一次 zlib 压缩和解压。Pixmap 的 samples 本来就是
+连续的 RGB 字节，可以直接构造数组 / 图片；只有真正要传出去的地方 (HTTP 响应、API 请求体) 才编码 PNG。
+"""
+
+import numpy as np
+from PIL import Image
+import fitz  # PyMuPDF
+
+
+def to_rgb(pix):
+    """灰度 / CMYK / 带 alpha 的 Pixmap 转成不带 alpha 的 RGB；已经是 RGB 时原样返回"""
+    if pix.alpha:
+        pix = fitz.Pixmap(pix, 0)
+    if pix.colorspace is None or pix.colorspace.n != 3:
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    return pix
+
+
+def render(page, clip=None, scale=1.0):
+    """按 scale 渲染页面 (或 clip 区域，PDF 坐标) 为 RGB Pixmap"""
+    return page.get_pixmap(
+        matrix=fitz.Matrix(scale, scale),
+        clip=fitz.Rect(clip) if clip is not None else None,
+        alpha=False,
+    )
+
+
+def pixmap_to_array(pix):
+    """
+    H x W x 3 的 uint8 数组。RGB Pixmap 直接引用其像素内存 (零拷贝、只读)，
+    数组只在 pix 存活期间有效，需要长期保存时用 .copy()；需要转换色彩空间时返回独立的拷贝。
+    """
+    rgb = to_rgb(pix)
+    array = np.frombuffer(rgb.samples_mv, dtype=np.uint8)
+    array = array.reshape(rgb.height, rgb.stride)[:, :rgb.width * 3].reshape(rgb.height, rgb.width, 3)
+    # 转换出的临时 Pixmap 在函数返回后释放，不能引用它的内存
+    return array if rgb is pix else array.copy()
+
+
+def pixmap_to_image(pix):
+    """PIL RGB 图片。只拷贝一次像素 (PIL 必须持有自己的内存，Pixmap 释放后仍可使用)"""
+    pix = to_rgb(pix)
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", pix.stride)
+
+
+def render_image(page, clip=None, scale=1.0):
+    return pixmap_to_image(render(page, clip, scale))
+
+
+def to_png(pix):
+    """只在需要压缩传输时 (HTTP 响应、API 请求体) 编码 PNG。灰度 / alpha 可以直接写，CMYK 等需先转 RGB"""
+    if pix.colorspace and pix.colorspace.n > 3:
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    return pix.tobytes("png")
@@ -0,0 +1,321 @@
+"""
+表格预筛选 (Table pre-screening)
+
+find_tables() 在长篇纯文本文档上往往是最大的单项开销。这里用页面上的廉价信号
+先判断一页是否可能存在表格，以及表格可能位于哪个区域：
+
+- 矢量线 (ruling lines)：来自 drawing 列表 / pdfplumber edges，区分横线和竖线
+- 表格标题词 ("Table" / "Tab." / "表") 是否出现在候选区域附近
+
+每个候选区域都带有 kind：
+- "grid"  : 横竖线相交构成网格 —— 基于 lines 策略的 find_tables / Camelot lattice 只能在这里找到表格
+- "rules" : 只有等宽的横线 (三线表 / booktabs)，标题词附近的才用 text 策略搜索 (rules_regions)
+- "raster": 带文字层的大图 (扫描页 / 图片形式的表格)，只有先栅格化再找线的 Camelot lattice 能看到其中的表格线
+
+完全没有线的表格不做检测：按对齐的文本列判断在语料库里几乎都是双栏正文 (zhong2021 p4)。
+"""
+
+import bisect
+import re
+
+# 线段的最大粗细 (pt)，超过这个值的填充矩形按边框处理
+RULE_MAX_THICKNESS = 2.0
+# 与 pdfplumber / PyMuPDF 的 edge_min_length 保持一致
+EDGE_MIN_LENGTH = 3.0
+# 与 snap / join / intersection tolerance 保持一致
+EDGE_TOLERANCE = 3.0
+# 三线表横线的最小长度 (相对页宽)，用来过滤下划线、分数线
+RULE_MIN_WIDTH_RATIO = 0.2
+# 候选区域向外扩展的边距 (pt)，避免裁掉表格边框
+CLIP_MARGIN = 5.0
+# 标题词距离候选区域的最大距离 (pt)
+CAPTION_DISTANCE = 40.0
+# 图片区域内至少有这么多词才视为带文字层的扫描表格
+RASTER_MIN_WORDS = 10
+# 三线表最上与最下横线之间的最小距离 (pt)，更近的是下划线 / 分隔线
+RULES_MIN_SPAN = 20.0
+
+# 三线表没有竖线，find_tables 的默认 lines 策略找不到，改用按文字对齐切分行列的 text 策略
+# (PyMuPDF 的 find_tables 参数与 pdfplumber 的 table_settings 同名)
+TEXT_STRATEGY = {"vertical_strategy": "text", "horizontal_strategy": "text"}
+
+CAPTION_PATTERN = re.compile(r'^(Table|TABLE|Tab\.|表)')
+
+
+class TableCandidate:
+    def __init__(self, bbox, kind, caption=False, lines=None):
+        self.bbox = bbox  # (x0, top, x1, bottom)，左上角原点
+        self.kind = kind
+        self.caption = caption
+        # grid 候选中互不重合的 (横线, 竖线) 数量，交点数约为两者之积
+        self.lines = lines
+
+    def to_dict(self):
+        return {"bbox": list(self.bbox), "kind": self.kind, "caption": self.caption, "lines": self.lines}
+
+
+class TableScreenStats:
+    """统计被跳过 / 被裁剪的页面数，便于在 benchmark 语料上调参"""
+
+    def __init__(self):
+        self.pages = 0
+        self.skipped = 0
+        self.clipped = 0
+        self.rules = 0
+
+    def record(self, clip, searched, rules=0):
+        """rules: 该页另外用 text 策略搜索的三线表区域数 (rules_regions)"""
+        self.pages += 1
+        if not searched:
+            self.skipped += 1
+        elif clip is not None:
+            self.clipped += 1
+        self.rules += rules
+
+    def to_dict(self):
+        return {
+            "pages": self.pages,
+            "skipped": self.skipped,
+            "clipped": self.clipped,
+            "searched": self.pages - self.skipped,
+            "rules_regions": self.rules,
+        }
+
+
+def _union_bbox(boxes):
+    return (
+        min(b[0] for b in boxes),
+        min(b[1] for b in boxes),
+        max(b[2] for b in boxes),
+        max(b[3] for b in boxes),
+    )
+
+
+def _expand(bbox, margin, page_width, page_height):
+    return (
+        max(0.0, bbox[0] - margin),
+        max(0.0, bbox[1] - margin),
+        min(page_width, bbox[2] + margin),
+        min(page_height, bbox[3] + margin),
+    )
+
+
+def _rect_edges(x0, top, x1, bottom):
+    """把矩形转成边：细矩形视为一条线，否则拆成四条边"""
+    w, h = x1 - x0, bottom - top
+    if h <= RULE_MAX_THICKNESS:
+        return [("h", x0, top, x1, bottom)]
+    if w <= RULE_MAX_THICKNESS:
+        return [("v", x0, top, x1, bottom)]
+    return [
+        ("h", x0, top, x1, top),
+        ("h", x0, bottom, x1, bottom),
+        ("v", x0, top, x0, bottom),
+        ("v", x1, top, x1, bottom),
+    ]
+
+
+def fitz_edges(drawings):
+    """从 page.get_drawings() 的结果中提取水平 / 竖直线段"""
+    edges = []
+    for path in drawings:
+        items = path.get("items", [])
+        if path.get("type") == "f":
+            # 纯填充路径：细条是"模拟线段"，大块无曲线的是单元格底纹，带曲线的是图标/字形
+            r = path["rect"]
+            if min(r.width, r.height) <= RULE_MAX_THICKNESS or not any(it[0] == "c" for it in items):
+                edges.extend(_rect_edges(r.x0, r.y0, r.x1, r.y1))
+            continue
+
+        for item in items:
+            if item[0] == "l":
+                p1, p2 = item[1], item[2]
+                if abs(p1.y - p2.y) <= RULE_MAX_THICKNESS:
+                    edges.append(("h", min(p1.x, p2.x), p1.y, max(p1.x, p2.x), p1.y))
+                elif abs(p1.x - p2.x) <= RULE_MAX_THICKNESS:
+                    edges.append(("v", p1.x, min(p1.y, p2.y), p1.x, max(p1.y, p2.y)))
+            elif item[0] in ("re", "qu"):
+                r = item[1] if item[0] == "re" else item[1].rect
+                edges.extend(_rect_edges(r.x0, r.y0, r.x1, r.y1))
+    return edges
+
+
+def plumber_edges(page):
+    """pdfplumber 已经把 line / rect / curve 统一成 edges"""
+    return [
+        (e["orientation"], e["x0"], e["top"], e["x1"], e["bottom"])
+        for e in page.edges
+    ]
+
+
+def fitz_words(word_tuples):
+    """page.get_text("words") -> (x0, top, x1, bottom, text)"""
+    return [(w[0], w[1], w[2], w[3], w[4]) for w in word_tuples]
+
+
+def plumber_words(words):
+    """page.extract_words() -> (x0, top, x1, bottom, text)"""
+    return [(w["x0"], w["top"], w["x1"], w["bottom"], w["text"]) for w in words]
+
+
+def _distinct_positions(values):
+    """容差内视为同一位置，返回不同位置的个数"""
+    count = 0
+    last = None
+    for v in sorted(values):
+        if last is None or v - last > EDGE_TOLERANCE:
+            count += 1
+        last = v
+    return count
+
+
+def _grid_components(h_edges, v_edges):
+    """横线与竖线相交 (容差内) 即连通，返回每个连通分量的 (横线, 竖线) 列表"""
+    parent = list(range(len(h_edges) + len(v_edges)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    tol = EDGE_TOLERANCE
+    v_sorted = sorted(range(len(v_edges)), key=lambda j: v_edges[j][1])
+    v_xs = [v_edges[j][1] for j in v_sorted]
+
+    for i, (_, hx0, hy, hx1, _) in enumerate(h_edges):
+        lo = bisect.bisect_left(v_xs, hx0 - tol)
+        hi = bisect.bisect_right(v_xs, hx1 + tol)
+        for k in range(lo, hi):
+            j = v_sorted[k]
+            _, _, vtop, _, vbottom = v_edges[j]
+            if vtop - tol <= hy <= vbottom + tol:
+                a, b = find(i), find(len(h_edges) + j)
+                if a != b:
+                    parent[a] = b
+
+    groups = {}
+    for i in range(len(h_edges)):
+        groups.setdefault(find(i), ([], []))[0].append(h_edges[i])
+    for j in range(len(v_edges)):
+        groups.setdefault(find(len(h_edges) + j), ([], []))[1].append(v_edges[j])
+    return list(groups.values())
+
+
+def _rule_groups(h_edges, page_width):
+    """等宽的长横线 (三线表的 toprule / midrule / bottomrule)"""
+    long_rules = sorted(
+        (e for e in h_edges if e[3] - e[1] >= page_width * RULE_MIN_WIDTH_RATIO),
+        key=lambda e: (round(e[1]), round(e[3]), e[2]),
+    )
+    groups = []
+    for e in long_rules:
+        for g in groups:
+            if abs(g[0][1] - e[1]) <= CLIP_MARGIN and abs(g[0][3] - e[3]) <= CLIP_MARGIN:
+                g.append(e)
+                break
+        else:
+            groups.append([e])
+    return [g for g in groups if len(g) >= 2]
+
+
+def _text_lines(words):
+    """按 top 把词聚成行，返回 [(top, bottom, [words sorted by x0])]"""
+    lines = []
+    for w in sorted(words, key=lambda w: (w[1], w[0])):
+        if lines and abs(lines[-1][0] - w[1]) <= 2:
+            lines[-1][2].append(w)
+            lines[-1][1] = max(lines[-1][1], w[3])
+        else:
+            lines.append([w[1], w[3], [w]])
+    for line in lines:
+        line[2].sort(key=lambda w: w[0])
+    return lines
+
+
+def _near(bbox, other, distance):
+    dx = max(other[0] - bbox[2], bbox[0] - other[2], 0)
+    dy = max(other[1] - bbox[3], bbox[1] - other[3], 0)
+    return dx <= distance and dy <= distance
+
+
+def screen_page(edges, words, page_width, page_height):
+    """
+    返回页面上的表格候选区域列表 (按 kind 区分)，空列表表示该页不可能有表格。
+    words 可以为 None，此时不标记标题词 (caption 均为 False)。
+    """
+    h_edges = [e for e in edges if e[0] == "h" and e[3] - e[1] >= EDGE_MIN_LENGTH]
+    v_edges = [e for e in edges if e[0] == "v" and e[4] - e[2] >= EDGE_MIN_LENGTH]
+
+    candidates = []
+    grid_h = set()
+    for hs, vs in _grid_components(h_edges, v_edges):
+        if len(hs) >= 2 and len(vs) >= 2:
+            bbox = _union_bbox([(e[1], e[2], e[3], e[4]) for e in hs + vs])
+            lines = (_distinct_positions(e[2] for e in hs), _distinct_positions(e[1] for e in vs))
+            candidates.append(TableCandidate(bbox, "grid", lines=lines))
+            grid_h.update(hs)
+
+    free_h = [e for e in h_edges if e not in grid_h]
+    for group in _rule_groups(free_h, page_width):
+        bbox = _union_bbox([(e[1], e[2], e[3], e[4]) for e in group])
+        candidates.append(TableCandidate(bbox, "rules"))
+
+    if words:
+        lines = _text_lines(words)
+        captions = [
+            (w[0], w[1], w[2], w[3])
+            for _, _, line_words in lines
+            for w in line_words[:1]
+            if CAPTION_PATTERN.match(w[4])
+        ]
+        for c in candidates:
+            c.caption = any(_near(c.bbox, cap, CAPTION_DISTANCE) for cap in captions)
+
+    return candidates
+
+
+def raster_candidates(image_bboxes, words, min_words=RASTER_MIN_WORDS):
+    """
+    图片区域内有足够多的文字 (扫描页的 OCR 文字层、图片表格上叠加的文字) 时作为 "raster" 候选。
+    image_bboxes: [(x0, top, x1, bottom)]，words 同 screen_page。
+    """
+    candidates = []
+    for bbox in image_bboxes:
+        inside = sum(
+            1 for w in words
+            if bbox[0] <= (w[0] + w[2]) / 2 <= bbox[2] and bbox[1] <= (w[1] + w[3]) / 2 <= bbox[3]
+        )
+        if inside >= min_words:
+            candidates.append(TableCandidate(tuple(bbox), "raster"))
+    return candidates
+
+
+def search_clip(candidates, page_width, page_height, kinds=("grid",)):
+    """
+    根据候选区域决定 find_tables 的搜索范围：
+    - (False, None)  : 没有候选，跳过该页
+    - (True, bbox)   : 只在 bbox (左上角原点) 内搜索
+    - (True, None)   : 候选覆盖了大半页，直接整页搜索
+    """
+    boxes = [c.bbox for c in candidates if c.kind in kinds]
+    if not boxes:
+        return False, None
+    clip = _expand(_union_bbox(boxes), CLIP_MARGIN, page_width, page_height)
+    if (clip[2] - clip[0]) * (clip[3] - clip[1]) >= 0.8 * page_width * page_height:
+        return True, None
+    return True, clip
+
+
+def rules_regions(candidates, page_width, page_height):
+    """
+    标题词附近的三线表 ("rules" 且 caption) 区域 (向外扩展 CLIP_MARGIN)，调用方用 TEXT_STRATEGY 再搜索一次。
+    没有标题词的等宽横线多是页眉页脚线 / 分隔线，与 grid 候选重叠的已经由 lines 策略搜索过。
+    """
+    grids = [c.bbox for c in candidates if c.kind == "grid"]
+    return [
+        _expand(c.bbox, CLIP_MARGIN, page_width, page_height)
+        for c in candidates
+        if c.kind == "rules" and c.caption and c.bbox[3] - c.bbox[1] >= RULES_MIN_SPAN
+        and not any(_near(c.bbox, g, 0) for g in grids)
+    ]
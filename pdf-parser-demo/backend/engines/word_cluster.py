@@ -0,0 +1,131 @@
+"""
+字符 -> 词 的向量化聚类
+
+与 pdfplumber 的 page.extract_words() (默认参数) 输出完全一致，但把排序、行聚类、
+间距判断和 bbox 合并都放在 NumPy 数组上做，不再对每个字符走一遍 Python 比较。
+中文页面每个汉字都是一个 char，逐字符的 Python 循环开销最明显。
+
+与 pdfplumber.utils.text.WordExtractor 的对应关系 (默认 line_dir="ttb", char_dir="ltr")：
+1. 按原始顺序把 upright 相同的连续字符分成若干段 (itertools.groupby)
+2. 段内按 top (旋转文字按 x0) 做链式聚类成行：排序后的唯一值相邻差 > tolerance 处断开
+3. 行内按 x0 (旋转文字按 top, bottom) 稳定排序
+4. 空白字符结束当前词；下一个字符 x0 < 前一个 x0、或与前一个的间距 > x_tolerance、
+   或 top 相差 > y_tolerance 时开始新词
+"""
+
+from operator import itemgetter
+
+import numpy as np
+from pdfplumber.utils.text import LIGATURES
+
+DEFAULT_X_TOLERANCE = 3
+DEFAULT_Y_TOLERANCE = 3
+
+BACKENDS = ("numpy", "pdfplumber")
+
+_COORDS = itemgetter("x0", "x1", "top", "bottom", "doctop")
+
+
+def extract_words(chars, x_tolerance=DEFAULT_X_TOLERANCE, y_tolerance=DEFAULT_Y_TOLERANCE):
+    """
+    chars: page.chars。返回与 page.extract_words(x_tolerance=..., y_tolerance=...) 相同的词列表
+    (text / x0 / x1 / top / doctop / bottom / upright / height / width / direction)。
+    """
+    n = len(chars)
+    if n == 0:
+        return []
+
+    texts = [c["text"] for c in chars]
+    x0, x1, top, bottom, doctop = np.array(list(map(_COORDS, chars)), dtype=float).T
+    upright = np.array([c["upright"] for c in chars], dtype=bool)
+    index = np.arange(n)
+
+    # 1. upright 相同的连续段
+    run = np.concatenate(([0], np.cumsum(upright[1:] != upright[:-1])))
+
+    # 2. 段内聚类成行：横排按 top、竖排 (旋转) 按 x0。
+    # 等价于 pdfplumber 的 cluster_objects：段内把值排序，相邻差 > tolerance 处断开
+    line_key = np.where(upright, top, x0)
+    line_tol = np.where(upright, y_tolerance, x_tolerance)
+    by_key = np.lexsort((line_key, run))
+    sorted_key = line_key[by_key]
+    breaks = (run[by_key][1:] != run[by_key][:-1]) | (sorted_key[1:] > sorted_key[:-1] + line_tol[by_key][1:])
+    line = np.empty(n, dtype=np.int64)
+    line[by_key] = np.concatenate(([0], np.cumsum(breaks)))
+
+    # 3. 行内排序：横排 (x0, 原始顺序)，竖排 (top, bottom, 原始顺序)
+    along = np.where(upright, x0, top)
+    along2 = np.where(upright, 0.0, bottom)
+    order = np.lexsort((index, along2, along, line, run))
+
+    s_x0, s_x1 = x0[order], x1[order]
+    s_top, s_bottom = top[order], bottom[order]
+    s_upright = upright[order]
+    s_texts = [texts[i] for i in order]
+    is_space = np.array([t.isspace() for t in s_texts], dtype=bool)
+    # split_at_punctuation 默认为 ""，只有空字符串满足 `text in ""`，它自成一个词
+    is_empty = np.array([t == "" for t in s_texts], dtype=bool)
+
+    # 4. 断词
+    new_word = np.ones(n, dtype=bool)
+    if n > 1:
+        same_line = (run[order][1:] == run[order][:-1]) & (line[order][1:] == line[order][:-1])
+        # 横排：intraline 看 x，interline 看 top；竖排反过来
+        ax = np.where(s_upright[1:], s_x0[:-1], s_top[:-1])
+        bx = np.where(s_upright[1:], s_x1[:-1], s_bottom[:-1])
+        cx = np.where(s_upright[1:], s_x0[1:], s_top[1:])
+        ay = np.where(s_upright[1:], s_top[:-1], s_x0[:-1])
+        cy = np.where(s_upright[1:], s_top[1:], s_x0[1:])
+        x_tol = np.where(s_upright[1:], x_tolerance, y_tolerance)
+        y_tol = np.where(s_upright[1:], y_tolerance, x_tolerance)
+        begins = (cx < ax) | (cx > bx + x_tol) | (np.abs(cy - ay) > y_tol)
+        new_word[1:] = ~same_line | begins | is_space[:-1] | is_empty[:-1] | is_empty[1:]
+
+    keep = ~is_space
+    word_id = np.cumsum(new_word & keep)[keep] - 1
+    kept = np.flatnonzero(keep)
+    if len(kept) == 0:
+        return []
+    starts = np.flatnonzero(np.concatenate(([True], word_id[1:] != word_id[:-1])))
+    ends = np.append(starts[1:], len(kept))
+
+    k_x0, k_x1 = s_x0[kept], s_x1[kept]
+    k_top, k_bottom = s_top[kept], s_bottom[kept]
+    w_x0 = np.minimum.reduceat(k_x0, starts)
+    w_x1 = np.maximum.reduceat(k_x1, starts)
+    w_top = np.minimum.reduceat(k_top, starts)
+    w_bottom = np.maximum.reduceat(k_bottom, starts)
+    first = order[kept[starts]]
+    w_doctop = w_top + (doctop[first] - top[first])
+
+    k_texts = [s_texts[i] for i in kept]
+    if not LIGATURES.keys().isdisjoint(k_texts):
+        k_texts = [LIGATURES.get(t, t) for t in k_texts]
+    uprights = [chars[i]["upright"] for i in first.tolist()]
+    words = []
+    for start, end, wx0, wx1, wtop, wdoctop, wbottom, up in zip(
+        starts.tolist(), ends.tolist(), w_x0.tolist(), w_x1.tolist(),
+        w_top.tolist(), w_doctop.tolist(), w_bottom.tolist(), uprights,
+    ):
+        words.append({
+            "text": "".join(k_texts[start:end]),
+            "x0": wx0,
+            "x1": wx1,
+            "top": wtop,
+            "doctop": wdoctop,
+            "bottom": wbottom,
+            "upright": up,
+            "height": wbottom - wtop,
+            "width": wx1 - wx0,
+            "direction": "ltr" if up else "ttb",
+        })
+    return words
+
+
+def page_words(page, backend="numpy"):
+    """按 backend 提取页面的词：numpy (本模块) 或 pdfplumber (page.extract_words)"""
+    if backend not in BACKENDS:
+        raise ValueError(f"word_backend must be one of {BACKENDS}")
+    if backend == "pdfplumber":
+        return page.extract_words()
+    return extract_words(page.chars)
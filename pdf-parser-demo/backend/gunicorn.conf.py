@@ -0,0 +1,43 @@
+"""
+生产部署：gunicorn -c gunicorn.conf.py app:app
+
+preload_app：master 进程先导入 app，并在 fork worker 之前加载模型权重 (app.warm_up(infer=False))，
+权重只加载一次，所有 worker 通过写时复制共享；各 worker 独占的内存见 /metrics 的 memory.uss_mb。
+master 不做前向推理 (torch 的 OpenMP / MKL 线程池在 fork 之后不可用)，每个 worker 在 post_fork 里
+各自做一次推理预热 (app.warm_up_worker)。
+"""
+
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5001")
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+# 每个 worker 内还有并发请求 (LaTeXOCR 跨请求批处理需要同一进程内的并发)
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+# 模型识别一个大文档可能需要几分钟
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "600"))
+preload_app = True
+
+
+def when_ready(server):
+    # preload_app 时 app 已在 master 中导入，此时 worker 还没有 fork
+    try:
+        import torch
+        # 加载 (int8 量化) 时也不在 master 里启动算子线程池
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    import app
+    app.warm_up(infer=False)
+
+
+def post_fork(server, worker):
+    # 每个 worker 的 torch 算子线程数：CPU 核数按 worker 平分，避免多个 worker 互相抢核
+    try:
+        import torch
+    except ImportError:
+        torch = None
+    if torch is not None:
+        torch.set_num_threads(int(os.environ.get("TORCH_NUM_THREADS", 0)) or max(1, (os.cpu_count() or 1) // workers))
+    # 线程数设好之后再做第一次推理，线程池在 worker 自己的进程里创建
+    import app
+    app.warm_up_worker()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+测试 batch_server.FormulaBatcher 的凑批规则 (用桩识别器代替模型)：凑满 max_batch 立即执行、
+所有进行中的解析都在等待结果时不再等满 max_wait、否则最多等 max_wait、解码参数不同的图片不混批。
+
+    python -m pytest -q test_batch_server.py
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engines.batch_server import FormulaBatcher
+
+
+class _Recognizer:
+    """记录每一批的 (图片, 解码参数)，把图片 (字符串) 原样作为识别结果"""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def recognize(self, images, batch_size, profile, max_length):
+        self.batches.append((list(images), profile, max_length))
+        if self.fail:
+            raise RuntimeError("model not loaded")
+        return [f"{image}:{profile}" for image in images]
+
+
+def test_full_batch_runs_without_waiting():
+    recognizer = _Recognizer()
+    batcher = FormulaBatcher(recognizer, max_batch=2, max_wait=10.0)
+    start = time.perf_counter()
+    futures = batcher.submit(["a", "b", "c", None], "greedy", 512)
+    assert [f.result(timeout=5) for f in futures[:2]] == ["a:greedy", "b:greedy"]
+    assert time.perf_counter() - start < 5
+    assert futures[3].result(timeout=0) is None
+    assert recognizer.batches[0] == (["a", "b"], "greedy", 512)
+
+
+def test_flushes_early_when_every_session_is_waiting():
+    recognizer = _Recognizer()
+    batcher = FormulaBatcher(recognizer, max_batch=16, max_wait=10.0)
+    results = {}
+    # 两个解析都进入 session 后才开始提交，第二个提交时两者都在等待
+    sessions = threading.Barrier(2)
+
+    def run(name, images):
+        with batcher.session():
+            sessions.wait()
+            results[name] = batcher.recognize(images, "full_beam", 512)
+
+    threads = [threading.Thread(target=run, args=("x", ["x1", "x2"])), threading.Thread(target=run, args=("y", ["y1"]))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert time.perf_counter() - start < 5
+    assert results == {"x": ["x1:full_beam", "x2:full_beam"], "y": ["y1:full_beam"]}
+    # 两个请求的图片合成了同一批 (或第一个请求等待时已先执行，但绝不等满 max_wait)
+    assert sum(len(images) for images, _, _ in recognizer.batches) == 3
+
+
+def test_waits_at_most_max_wait_for_a_partial_batch():
+    recognizer = _Recognizer()
+    batcher = FormulaBatcher(recognizer, max_batch=16, max_wait=0.2)
+    # 另一个解析还在渲染 (进入了 session 但没有等待结果)，所以要等满 max_wait
+    with batcher.session():
+        with batcher.session():
+            start = time.perf_counter()
+            assert batcher.recognize(["a"], "greedy", 64) == ["a:greedy"]
+            elapsed = time.perf_counter() - start
+    assert 0.15 <= elapsed < 2
+    assert batcher.stats()["batch_sizes"] == {"1": 1}
+
+
+def test_different_decode_settings_are_not_batched_together():
+    recognizer = _Recognizer()
+    batcher = FormulaBatcher(recognizer, max_batch=16, max_wait=0.05)
+    futures = batcher.submit(["a"], "greedy", 64) + batcher.submit(["b"], "full_beam", 512)
+    futures += batcher.submit(["c"], "greedy", 64)
+    assert [f.result(timeout=5) for f in futures] == ["a:greedy", "b:full_beam", "c:greedy"]
+    assert sorted(recognizer.batches) == [(["a", "c"], "greedy", 64), (["b"], "full_beam", 512)]
+
+
+def test_batch_errors_reach_every_caller():
+    batcher = FormulaBatcher(_Recognizer(fail=True), max_batch=2, max_wait=0.0)
+    futures = batcher.submit(["a", "b"], "greedy", 64)
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main(["-q", __file__]))
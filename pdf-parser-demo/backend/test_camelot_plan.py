@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+测试 camelot.classify_page / plan_pages 的按页选择：网格表 -> lattice，带标题的三线表 -> stream (row_tol 按字高)，
+没有表格标题的横线和纯文字页跳过。测试 PDF 在 tmp_path 中生成。
+
+    python -m pytest -q test_camelot_plan.py
+"""
+
+import os
+import sys
+
+import fitz
+import pytest
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+camelot_engine = pytest.importorskip("engines.camelot")
+
+
+def _grid(page, x0, y0, cols, rows, cell=(60, 20)):
+    for i in range(rows + 1):
+        page.draw_line((x0, y0 + i * cell[1]), (x0 + cols * cell[0], y0 + i * cell[1]))
+    for j in range(cols + 1):
+        page.draw_line((x0 + j * cell[0], y0), (x0 + j * cell[0], y0 + rows * cell[1]))
+
+
+def _booktabs(page, x0, y0, caption):
+    if caption:
+        page.insert_text((x0, y0 - 8), "Table 1. Regression results", fontsize=9)
+    for y in (y0, y0 + 16, y0 + 90):
+        page.draw_line((x0, y), (x0 + 300, y))
+    for row in range(4):
+        page.insert_text((x0 + 4, y0 + 30 + row * 16), "Variable    0.12    0.34    0.56", fontsize=9)
+
+
+def _make_pdf(path):
+    doc = fitz.open()
+    _grid(doc.new_page(width=595, height=842), 100, 200, cols=4, rows=5)
+    _booktabs(doc.new_page(width=595, height=842), 100, 300, caption=True)
+    _booktabs(doc.new_page(width=595, height=842), 100, 300, caption=False)
+    doc.new_page(width=595, height=842).insert_text((72, 100), "Plain body text without any table.")
+    doc.save(path)
+
+
+def test_classify_page_picks_one_flavor_per_page(tmp_path):
+    path = str(tmp_path / "tables.pdf")
+    _make_pdf(path)
+    with fitz.open(path) as doc:
+        flavors = [camelot_engine.classify_page(page) for page in doc]
+    assert [flavor for flavor, _, _ in flavors] == ["lattice", "stream", None, None]
+    _, candidates, row_tol = flavors[1]
+    assert all(c.kind == "rules" and c.caption for c in candidates)
+    assert camelot_engine.STREAM_MIN_ROW_TOL <= row_tol <= camelot_engine.STREAM_MAX_ROW_TOL
+
+
+def test_plan_pages_skips_pages_without_tables(tmp_path):
+    path = str(tmp_path / "tables.pdf")
+    _make_pdf(path)
+    stats = camelot_engine.TableScreenStats()
+    plans = camelot_engine.plan_pages(path, stats=stats)
+    assert sorted(plans) == [1, 2]
+    assert plans[1]["flavor"] == "lattice" and plans[1]["row_tol"] is None
+    assert plans[2]["flavor"] == "stream" and plans[2]["row_tol"] is not None
+    # 区域是 Camelot 的 "x1,y1,x2,y2" 字符串 (PDF 坐标，y 向上)
+    for plan in plans.values():
+        assert plan["regions"]
+        for region in plan["regions"]:
+            x1, y1, x2, y2 = map(float, region.split(","))
+            assert x1 < x2 and y1 > y2
+    assert stats.to_dict()["pages"] == 4
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main(["-q", __file__]))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+测试 docling_cache.DocumentCache 的上限：超过条目数 / 总大小时按最近使用时间淘汰，
+读缓存会刷新使用时间，上传文件都已删除的条目先淘汰。不需要安装 docling (用桩对象代替 DoclingDocument)。
+
+    python -m pytest -q test_docling_cache.py
+"""
+
+import os
+import sys
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engines import docling_cache
+from engines.docling_cache import DocumentCache
+
+
+class _Doc:
+    def __init__(self, text):
+        self.text = text
+
+    def model_dump_json(self):
+        return '{"text": "%s"}' % self.text
+
+    @classmethod
+    def model_validate(cls, data):
+        return cls(data["text"])
+
+
+def _doc_id(n):
+    return f"{n:040x}-tables"
+
+
+def _save(cache, tmp_path, n, size=10):
+    upload = tmp_path / f"upload{n}.pdf"
+    upload.write_bytes(b"%PDF")
+    cache.save(_doc_id(n), [(_Doc("x" * size), 0)], source=str(upload))
+    # mtime 精度有限，按写入顺序显式设置
+    os.utime(os.path.join(cache.cache_dir, _doc_id(n) + ".json"), (n, n))
+    return upload
+
+
+def _cached(cache):
+    return sorted(name for name in os.listdir(cache.cache_dir) if name.endswith(".json"))
+
+
+def test_evicts_least_recently_used_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(docling_cache, "DoclingDocument", _Doc)
+    cache = DocumentCache(str(tmp_path / "cache"), max_entries=2)
+    for n in (1, 2):
+        _save(cache, tmp_path, n)
+    # 读缓存刷新第 1 条的使用时间，第 2 条变成最旧的
+    assert cache.load(_doc_id(1))[0][0].text == "x" * 10
+    _save(cache, tmp_path, 3)
+    assert _cached(cache) == [_doc_id(1) + ".json", _doc_id(3) + ".json"]
+    assert not os.path.exists(os.path.join(cache.cache_dir, _doc_id(2) + ".sources"))
+
+
+def test_evicts_by_total_size(tmp_path):
+    cache = DocumentCache(str(tmp_path / "cache"), max_entries=100, max_mb=2500 / (1024 * 1024))
+    for n in (1, 2, 3):
+        _save(cache, tmp_path, n, size=1000)
+    _save(cache, tmp_path, 4, size=1000)
+    assert _cached(cache) == [_doc_id(3) + ".json", _doc_id(4) + ".json"]
+
+
+def test_entries_of_deleted_uploads_go_first(tmp_path):
+    cache = DocumentCache(str(tmp_path / "cache"))
+    for n in (1, 2):
+        _save(cache, tmp_path, n)
+    os.remove(tmp_path / "upload2.pdf")
+    assert cache.evict() == [_doc_id(2)]
+    assert _cached(cache) == [_doc_id(1) + ".json"]
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main(["-q", __file__]))
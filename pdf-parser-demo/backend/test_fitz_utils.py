@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+测试 fitz_utils.get_blocks：图片块只取元数据，不解码也不复制像素，xref 与 PyMuPDF 解码求出的一致。
+测试 PDF 在内存中生成：两张像素尺寸相同的图片 (按尺寸匹配 xref 时分不清) + 一张超出页面的图片。
+
+    python -m pytest -q test_fitz_utils.py
+"""
+
+import os
+import sys
+
+import fitz
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engines.fitz_utils import PageAnalysis, get_blocks, get_image_infos
+
+
+def _make_pdf():
+    doc = fitz.open()
+    page = doc.new_page(width=300, height=400)
+    page.insert_text((40, 40), "Figure 1 and Figure 2")
+    for i, rect in enumerate([(40, 60, 140, 160), (160, 60, 260, 160), (250, 380, 350, 480)]):
+        pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 32, 32), False)
+        pix.set_rect(pix.irect, (60 * i, 120, 200))
+        page.insert_image(rect, pixmap=pix)
+    page.insert_text((40, 190), "Caption below the figures")
+    return doc
+
+
+def _expected(page):
+    """get_text("dict") 的块 (去掉像素) + get_image_info(xrefs=True) 解码求出的 xref"""
+    xrefs = {tuple(info["bbox"]): info["xref"] for info in page.get_image_info(xrefs=True)}
+    blocks = []
+    for block in page.get_text("dict")["blocks"]:
+        if block["type"] == 1:
+            block = {key: block[key] for key in ("type", "number", "bbox", "width", "height", "colorspace")}
+            block["xref"] = xrefs[tuple(block["bbox"])]
+        blocks.append(block)
+    return blocks
+
+
+def test_blocks_match_get_text_dict():
+    page = _make_pdf()[0]
+    expected = _expected(page)
+    blocks = get_blocks(page)
+    assert blocks == expected
+    images = [block for block in blocks if block["type"] == 1]
+    # 超出页面的第三张图片不输出；两张同尺寸图片各自拿到自己的 xref
+    assert len(images) == 2
+    assert len({block["xref"] for block in images}) == 2
+    assert all("image" not in block for block in images)
+
+
+def test_blocks_do_not_decode_images(monkeypatch):
+    page = _make_pdf()[0]
+    expected = _expected(page)
+
+    def decode(*args, **kwargs):
+        raise AssertionError("image decoded")
+
+    monkeypatch.setattr(fitz.mupdf, "fz_get_pixmap_from_image", decode)
+    monkeypatch.setattr(fitz.mupdf, "fz_decomp_image_from_stream", decode)
+    monkeypatch.setattr(fitz.Page, "get_image_info", decode)
+    with PageAnalysis(page) as analysis:
+        assert analysis.blocks() == expected
+        assert get_image_infos(page, analysis.textpage) == [b for b in expected if b["type"] == 1]
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main(["-q", __file__]))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+测试 formula_cache.FormulaCache 的 sqlite 上限：行数超过 max_rows 时删掉最久没读写过的行，
+读命中会刷新最后使用时间；旧版本建的没有 accessed 列的表会被补上该列。
+
+    python -m pytest -q test_formula_cache.py
+"""
+
+import itertools
+import os
+import sqlite3
+import sys
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engines import formula_cache
+from engines.formula_cache import FormulaCache
+
+
+class _Clock:
+    """每次调用前进一秒，避免同一时刻写入的行顺序不确定"""
+
+    def __init__(self):
+        self._ticks = itertools.count(1)
+
+    def time(self):
+        return float(next(self._ticks))
+
+
+def _rows(path):
+    with sqlite3.connect(path) as conn:
+        return sorted(key for (key,) in conn.execute("SELECT key FROM formulas"))
+
+
+def test_evicts_least_recently_accessed_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(formula_cache, "time", _Clock())
+    path = str(tmp_path / "formula_cache.sqlite")
+    cache = FormulaCache(path, max_rows=3)
+    for key in ("a", "b", "c"):
+        cache.put_many({key: key.upper()})
+    # 新的进程 (内存 LRU 为空) 从 sqlite 读到 a，a 的使用时间被刷新
+    reader = FormulaCache(path, max_rows=3)
+    assert reader.get_many(["a"]) == {"a": "A"}
+    reader.put_many({"d": "D"})
+    assert _rows(path) == ["a", "c", "d"]
+    # 进程内命中同样刷新使用时间
+    assert reader.get_many(["c"]) == {"c": "C"}
+    reader.put_many({"e": "E", "f": "F"})
+    assert _rows(path) == ["c", "e", "f"]
+
+
+def test_adds_accessed_column_to_old_table(tmp_path):
+    path = str(tmp_path / "formula_cache.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE formulas (key TEXT PRIMARY KEY, latex TEXT NOT NULL)")
+        conn.executemany("INSERT INTO formulas VALUES (?, ?)", [("old1", "x"), ("old2", "y")])
+    cache = FormulaCache(path, max_rows=2)
+    cache.put_many({"new": "z"})
+    assert len(_rows(path)) == 2
+    assert "new" in _rows(path)
+    assert cache.get_many(["new"]) == {"new": "z"}
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main(["-q", __file__]))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+测试 formula_ocr.FormulaRecognizer 的延迟加载：多个请求线程同时第一次用到模型时只加载一次。
+不需要安装 transformers (用桩对象代替 from_pretrained)。
+
+    python -m pytest -q test_formula_ocr.py
+"""
+
+import os
+import sys
+import threading
+import time
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engines import formula_ocr
+from engines.formula_ocr import FormulaRecognizer
+
+
+class _Loader:
+    """from_pretrained 的桩：记录调用次数，故意放慢以便线程交错"""
+
+    calls = 0
+
+    @classmethod
+    def from_pretrained(cls, name):
+        cls.calls += 1
+        time.sleep(0.05)
+        return cls()
+
+    def eval(self):
+        return self
+
+
+def test_concurrent_first_use_loads_once(monkeypatch):
+    monkeypatch.setattr(formula_ocr, "TRANSFORMERS_AVAILABLE", True)
+    monkeypatch.setattr(formula_ocr, "AutoProcessor", _Loader, raising=False)
+    monkeypatch.setattr(formula_ocr, "VisionEncoderDecoderModel", _Loader, raising=False)
+    _Loader.calls = 0
+    recognizer = FormulaRecognizer(backend="torch")
+    start = threading.Barrier(8)
+    seen = []
+
+    def use():
+        start.wait()
+        seen.append((recognizer.model, recognizer.processor))
+
+    threads = [threading.Thread(target=use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # processor + model 各加载一次
+    assert _Loader.calls == 2
+    assert len({id(model) for model, _ in seen}) == 1
+    assert all(processor is not None for _, processor in seen)
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main(["-q", __file__]))
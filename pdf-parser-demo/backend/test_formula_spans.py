@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+测试 formula_spans 的公式检测：span 都取自语料库里的真实页面 (get_text("dict"))，
+FALSE_POSITIVES 是统计正文里被误判成公式的片段，XIA_EQUATION / ZHONG_CHI_SQUARE 是真正的公式。
+
+    python -m pytest -q test_formula_spans.py
+"""
+
+import os
+import sys
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engines.formula_spans import CharFormulaIndex, block_kind, detect_regions, has_formula_structure
+
+
+def _span(text, font, size, flags, bbox):
+    return {"text": text, "font": font, "size": size, "flags": flags, "bbox": bbox}
+
+
+def _block(*spans):
+    return {"type": 0, "lines": [{"spans": [_span(*s) for s in spans]}]}
+
+
+# zhong2021 p2：孤立的关系符 "≥"
+ZHONG_GEQ = _block(
+    ("m/s (3 points), ", "CharisSIL", 7.97, 4, [306.6, 271.0, 361.7, 284.0]),
+    ("≥", "TeX_CM_Maths_Symbols", 7.97, 4, [361.6, 274.1, 367.7, 282.1]),
+    ("0.78 m/s (4 points), and unable to perform the test (0 ", "CharisSIL", 7.97, 4, [367.7, 271.0, 560.0, 284.0]),
+)
+# zhong2021 p4："67.49 ± 6.69 years"
+ZHONG_PM = _block(
+    ("male, and the mean age was 67.49 ", "CharisSIL", 7.97, 4, [306.6, 398.7, 440.4, 411.7]),
+    ("±", "TeX_CM_Maths_Symbols", 7.97, 4, [441.9, 401.8, 448.0, 409.8]),
+    (" 6.69 years. In the univariate ", "CharisSIL", 7.97, 4, [448.0, 398.7, 560.0, 411.7]),
+)
+# zhong2021 p4：表格单元格 "<0.001" (整行都是 "公式"，原来判为行间公式)
+ZHONG_P_VALUE = _block(
+    ("<", "TeX_CM_Maths_Italic", 6.38, 6, [261.0, 483.0, 265.9, 489.4]),
+    ("0.001 ", "CharisSIL", 6.38, 4, [265.9, 480.5, 283.9, 490.9]),
+)
+# xia2007 p6：Symbol 字体里的 μ 被提取成 "m" ("100-μm")
+XIA_MICRO = _block(
+    ("microextraction (SPME) devices and 100-", "AdvTimes", 9.96, 4, [61.3, 485.6, 238.1, 495.5]),
+    ("m", "AdvPi1", 9.96, 4, [238.1, 485.6, 243.6, 495.5]),
+    ("m PDMS membrane-coated fibre assemblies", "AdvTimes", 9.96, 4, [243.6, 485.6, 431.9, 495.5]),
+)
+# xia2007 p7：表格里单独一行的减号，字形没有 Unicode 映射
+XIA_MINUS = _block(
+    ("\x01", "AdvMT_MI", 7.97, 4, [217.4, 103.9, 222.1, 111.9]),
+)
+# kelly2009 p3："5 × 5 m"，乘号是 MathematicalPi 里的 \x13
+KELLY_TIMES = _block(
+    ("the confines of the 5 ", "TimesNewRomanPS", 8.5, 4, [294.0, 518.5, 365.5, 527.0]),
+    ("\x13", "MathematicalPi-One", 8.5, 4, [365.7, 518.6, 372.8, 527.3]),
+    (" 5 m physical lab space, there was never any ", "TimesNewRomanPS", 8.5, 4, [372.7, 518.5, 524.1, 527.0]),
+)
+# kelly2009 p5："F(1,17) = 8.41, p = .01, ηp² = .33"，等号是 \x15
+KELLY_STATS = _block(
+    ("kite, ", "TimesNewRomanPS", 10.0, 4, [294.0, 126.3, 314.0, 136.3]),
+    ("F", "TimesNewRomanPS-Italic", 10.0, 6, [313.9, 126.3, 320.0, 136.3]),
+    ("(1,17) ", "TimesNewRomanPS", 10.0, 4, [320.0, 126.3, 346.6, 136.3]),
+    ("\x15", "MathematicalPi-One", 10.0, 4, [346.5, 126.5, 354.8, 136.7]),
+    (" 8.41, ", "TimesNewRomanPS", 10.0, 4, [354.8, 126.3, 379.7, 136.3]),
+    ("p", "TimesNewRomanPS-Italic", 10.0, 6, [379.6, 126.3, 384.6, 136.3]),
+    (" ", "TimesNewRomanPS", 10.0, 4, [384.6, 126.3, 387.1, 136.3]),
+    ("\x15", "MathematicalPi-One", 10.0, 4, [387.0, 126.5, 395.3, 136.7]),
+    (" .01, ", "TimesNewRomanPS", 10.0, 4, [395.3, 126.3, 415.2, 136.3]),
+    ("h", "MathGreek-Italic", 10.0, 6, [415.0, 126.5, 420.0, 136.7]),
+    ("p", "TimesNewRomanPS", 7.0, 4, [420.5, 130.6, 424.0, 137.6]),
+    ("2", "TimesNewRomanPS", 7.0, 5, [420.5, 126.1, 424.0, 133.1]),
+    (" ", "TimesNewRomanPS", 10.0, 4, [424.0, 126.3, 426.5, 136.3]),
+    ("\x15", "MathematicalPi-One", 10.0, 4, [426.4, 126.5, 434.7, 136.7]),
+    (" .33].", "TimesNewRomanPS", 10.0, 4, [434.7, 126.3, 455.4, 136.3]),
+)
+# shintani2004 p3："1 × 10⁶ OSCC cells"
+SHINTANI_TIMES = _block(
+    ("1", "AdvTTc9c3bd71", 9.96, 4, [42.5, 497.6, 47.7, 507.5]),
+    ("\x03", "AdvMT_SY", 9.96, 4, [47.7, 497.5, 55.5, 507.5]),
+    ("10", "AdvTTc9c3bd71", 9.96, 4, [55.5, 497.6, 65.9, 507.5]),
+    ("6", "AdvTTc9c3bd71", 7.04, 5, [65.9, 496.4, 69.8, 503.5]),
+    (" ", "AdvTTc9c3bd71", 9.96, 5, [69.8, 494.1, 74.4, 504.1]),
+    ("OSCC cells into the dorsal ﬂank. For each", "AdvTTc9c3bd71", 9.96, 4, [74.4, 497.6, 269.6, 507.5]),
+)
+# adgate2014 p5："2700 μg/m³"
+ADGATE_MICRO = _block(
+    ("ranged from 24 to 2700", "AdvOT2e364b11", 10.0, 4, [324.5, 101.7, 416.5, 111.7]),
+    (" μ", "AdvOTdd3b7348.I+03", 10.0, 4, [416.5, 100.9, 424.8, 110.9]),
+    ("g/m", "AdvOT2e364b11", 10.0, 4, [424.8, 101.7, 441.1, 111.7]),
+    ("3", "AdvOT2e364b11", 6.7, 5, [441.2, 100.1, 444.3, 106.8]),
+    (" ", "AdvOT2e364b11", 10.0, 5, [444.3, 97.8, 447.4, 107.8]),
+    ("in 24 samples collected 130 to", "AdvOT2e364b11", 10.0, 4, [447.4, 101.7, 564.5, 111.7]),
+)
+
+FALSE_POSITIVES = {
+    "zhong2021 ≥": ZHONG_GEQ,
+    "zhong2021 ±": ZHONG_PM,
+    "zhong2021 <0.001": ZHONG_P_VALUE,
+    "xia2007 μ": XIA_MICRO,
+    "xia2007 \\x01": XIA_MINUS,
+    "kelly2009 \\x13": KELLY_TIMES,
+    "kelly2009 \\x15": KELLY_STATS,
+    "shintani2004 \\x03": SHINTANI_TIMES,
+    "adgate2014 μ": ADGATE_MICRO,
+}
+
+# xia2007 p8 式 (4) 的第一行 "K_{p/m} = C_{pe}"，等号是 AdvMT_SY 里的 "¼"
+XIA_EQUATION = _block(
+    ("K", "AdvTimes-i", 9.96, 4, [182.7, 631.6, 189.8, 641.6]),
+    ("p", "AdvTimes", 6.97, 4, [189.8, 635.5, 193.7, 642.4]),
+    ("=", "AdvMT_MI", 6.97, 4, [193.7, 635.4, 196.9, 642.4]),
+    ("m", "AdvTimes", 6.97, 4, [197.0, 635.5, 202.7, 642.4]),
+    (" ¼", "AdvMT_SY", 9.96, 4, [202.7, 631.5, 213.6, 643.0]),
+    (" ", "AdvTimes-i", 9.96, 4, [213.6, 631.6, 217.4, 641.6]),
+    ("C", "AdvTimes-i", 9.96, 5, [217.4, 624.8, 224.5, 634.8]),
+    ("pe", "AdvTimes", 6.97, 5, [224.5, 628.7, 231.4, 635.6]),
+)
+# zhong2021 p4 表注里的 "t / χ² / Z"
+ZHONG_CHI_SQUARE = _block(
+    ("t ", "CharisSIL-Italic", 6.38, 6, [228.0, 76.2, 231.8, 86.6]),
+    ("/ ", "CharisSIL", 6.38, 4, [231.2, 76.2, 236.2, 86.6]),
+    ("χ", "STIX-Regular", 6.6, 4, [235.7, 78.7, 238.9, 85.6]),
+    ("2 ", "CharisSIL", 4.62, 5, [238.9, 75.7, 243.0, 83.0]),
+    ("/", "CharisSIL", 6.38, 4, [242.9, 76.2, 246.0, 86.6]),
+    ("Z ", "CharisSIL-Italic", 6.38, 6, [246.0, 76.2, 251.5, 86.6]),
+)
+
+# kelly2009 p5 的 pdfplumber 字符 ") = 5.52"：pdfminer 把没有映射的等号输出为 "(cid:21)"
+KELLY_CHARS = [
+    {"text": text, "fontname": font, "size": 10.0, "x0": x0, "top": top, "x1": x1, "bottom": top + 10.0}
+    for text, font, x0, top, x1 in (
+        (")", "EIIMJI+TimesNewRomanPS", 407.5, 115.1, 410.9),
+        (" ", "EIIMJI+TimesNewRomanPS", 410.9, 115.1, 413.4),
+        ("(cid:21)", "EIIOKA+MathematicalPi-One", 413.0, 115.7, 421.3),
+        (" ", "EIIMJI+TimesNewRomanPS", 421.3, 115.1, 423.8),
+        ("5", "EIIMJI+TimesNewRomanPS", 423.4, 115.1, 428.4),
+        (".", "EIIMJI+TimesNewRomanPS", 428.4, 115.1, 430.9),
+        ("5", "EIIMJI+TimesNewRomanPS", 430.9, 115.1, 435.9),
+        ("2", "EIIMJI+TimesNewRomanPS", 435.9, 115.1, 440.9),
+    )
+]
+
+
+def test_false_positives_are_not_formulas():
+    for name, block in FALSE_POSITIVES.items():
+        assert detect_regions([block]) == [], name
+        assert block_kind(block) is None, name
+
+
+def test_pdfplumber_cid_glyphs():
+    index = CharFormulaIndex(KELLY_CHARS)
+    assert index.enabled
+    assert index.kind([400, 110, 450, 130]) is None
+
+
+def test_equation_with_unmapped_glyphs():
+    regions = detect_regions([XIA_EQUATION])
+    assert [region["kind"] for region in regions] == ["display"]
+    assert regions[0]["text"] == "=m ¼ Cpe"
+    assert regions[0]["scripts"]
+    assert block_kind(XIA_EQUATION) == "display"
+
+
+def test_inline_formula_in_text():
+    regions = detect_regions([ZHONG_CHI_SQUARE])
+    assert [(region["kind"], region["text"]) for region in regions] == [("inline", "χ2 /")]
+    assert block_kind(ZHONG_CHI_SQUARE) == "inline"
+
+
+def test_formula_structure():
+    for text in ("≥", "±", "μ", "m", "<0.001", "= 5958)", "\x15 .01,", "hp2 \x15 .33", "ππ*"):
+        assert not has_formula_structure(text), text
+    for text in ("n < N", "f(x) = ax2 + b", "χ2 /", "Kp=m", "xyz"):
+        assert has_formula_structure(text), text
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main(["-q", __file__]))
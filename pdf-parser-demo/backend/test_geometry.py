@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+测试 geometry 的坐标转换：页面带 /Rotate 0 / 90 / 180 / 270、MediaBox 不从原点开始、CropBox 小于 MediaBox 时，
+pdf_to_view_bbox (PDF 用户空间) 和 pdfminer_to_view_bbox (pdfminer 版面坐标，Camelot 用的就是它) 都要落在渲染出的像素位置上。
+pypdf 引擎自己算的几何信息 (pypdf.page_geometry) 要与 PyMuPDF 算的一致。
+测试 PDF 在 tmp_path 中生成，内容流直接写用户空间坐标。
+
+    python -m pytest -q test_geometry.py
+"""
+
+import os
+import sys
+
+import fitz
+import numpy as np
+import pytest
+from pypdf import PdfReader
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LTRect
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engines.geometry import get_geometry, pdf_to_view_bbox, pdfminer_to_view_bbox
+from engines.pypdf import page_geometry as pypdf_page_geometry
+
+MEDIABOX = (10, 20, 310, 420)
+CROPBOX = (30, 40, 290, 400)
+# 用户空间里的蓝色矩形 (x0, y0, x1, y1)
+USER_RECT = (60, 80, 160, 120)
+
+
+def _make_pdf(path, rotation):
+    doc = fitz.open()
+    page = doc.new_page()
+    doc.xref_set_key(page.xref, "MediaBox", "[%g %g %g %g]" % MEDIABOX)
+    doc.xref_set_key(page.xref, "CropBox", "[%g %g %g %g]" % CROPBOX)
+    x0, y0, x1, y1 = USER_RECT
+    xref = doc.get_new_xref()
+    doc.update_object(xref, "<<>>")
+    doc.update_stream(xref, b"0 0 1 rg %g %g %g %g re f" % (x0, y0, x1 - x0, y1 - y0))
+    doc.xref_set_key(page.xref, "Contents", f"{xref} 0 R")
+    doc.xref_set_key(page.xref, "Rotate", str(rotation))
+    doc.save(path)
+
+
+def _rendered_bbox(path):
+    """按显示坐标 (1 像素 = 1pt) 渲染，返回蓝色像素的外接矩形"""
+    with fitz.open(path) as doc:
+        pix = doc[0].get_pixmap(alpha=False)
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+    ys, xs = np.nonzero((pixels[:, :, 2] > 200) & (pixels[:, :, 0] < 60))
+    return [xs.min(), ys.min(), xs.max() + 1, ys.max() + 1]
+
+
+@pytest.mark.parametrize("rotation", [0, 90, 180, 270])
+def test_bbox_conversions_match_rendering(tmp_path, rotation):
+    path = str(tmp_path / f"rot{rotation}.pdf")
+    _make_pdf(path, rotation)
+    page_geometry = get_geometry(path)["pages"][0]
+    expected = _rendered_bbox(path)
+    assert (page_geometry["width"], page_geometry["height"]) == ((360, 260) if rotation in (90, 270) else (260, 360))
+
+    assert pdf_to_view_bbox(page_geometry, USER_RECT) == pytest.approx(expected, abs=1)
+
+    # pdfminer 的 bbox 相对 MediaBox 原点 (pdfplumber 的 x0 / y0 又加回了 MediaBox 偏移，不能直接用)
+    layout = next(extract_pages(path))
+    bbox = next(obj.bbox for obj in layout if isinstance(obj, LTRect))
+    assert pdfminer_to_view_bbox(page_geometry, bbox) == pytest.approx(expected, abs=1)
+
+
+
+@pytest.mark.parametrize("rotation", [0, 90, 180, 270])
+def test_pypdf_geometry_matches_pymupdf(tmp_path, rotation):
+    path = str(tmp_path / f"rot{rotation}.pdf")
+    _make_pdf(path, rotation)
+    expected = get_geometry(path)["pages"][0]
+    geometry = pypdf_page_geometry(PdfReader(path).pages[0], 1)
+    for key in ("width", "height", "rotation", "mediabox", "cropbox", "pdf_to_view"):
+        assert geometry[key] == pytest.approx(expected[key]), key
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main(["-q", __file__]))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+测试 layout 的词 -> 行 -> 块 聚合：中文行内不插空格、双栏中文按字高断栏、
+中文段落按折行 / 首行缩进分段，英文页面仍按行距分块。词的坐标仿照语料库中的真实页面。
+
+    python -m pytest -q test_layout.py
+"""
+
+import os
+import sys
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engines.layout import group_blocks, group_lines, group_words
+
+
+def _word(text, x0, top, x1, height=10.0):
+    return {"text": text, "x0": x0, "top": top, "x1": x1, "bottom": top + height}
+
+
+def _line(text, x0, top, x1, height=12.0):
+    return {"text": text, "x0": x0, "top": top, "x1": x1, "bottom": top + height}
+
+
+def test_cjk_words_join_without_space():
+    words = [
+        _word("物理与工程", 351.2, 37.0, 402.7),
+        _word("Ｖｏｌ．２９", 413.1, 37.0, 448.0),
+        _word("Ｎｏ．１", 455.7, 37.0, 482.3),
+        _word("研究结果是：学生在", 64.0, 60.0, 150.0),
+        _word("开始上课的", 153.5, 60.0, 200.0),
+        _word("Pearson", 203.0, 60.0, 240.0),
+        _word("系数", 243.0, 60.0, 263.0),
+    ]
+    texts = [line["text"] for line in group_lines(words)]
+    assert texts == ["物理与工程Ｖｏｌ．２９ Ｎｏ．１", "研究结果是：学生在开始上课的Pearson系数"]
+
+
+def test_latin_words_keep_spaces():
+    words = [_word("membrane", 85.2, 323.2, 130.0), _word("absorption", 133.0, 323.2, 180.0)]
+    assert [line["text"] for line in group_lines(words)] == ["membrane absorption"]
+
+
+def test_cjk_columns_split_on_gutter():
+    # 传统大学物理 p3：两栏之间只有约 2.3 个字高，中文的 "词距" 中位数比它还大
+    words = [
+        _word("法的课程最长时间应该限制在３０分钟［５］。彭纳", 64.0, 86.9, 285.8),
+        _word("好，还是哗哗流走了。”［８］", 309.1, 86.9, 419.8),
+        _word("物理与工程", 351.2, 37.0, 402.7),
+        _word("Ｖｏｌ．２９", 413.1, 37.0, 448.0),
+        _word("Ｎｏ．１", 455.7, 37.0, 482.3),
+        _word("２０１９", 488.3, 37.0, 513.7),
+    ]
+    texts = [line["text"] for line in group_lines(words)]
+    assert "法的课程最长时间应该限制在３０分钟［５］。彭纳" in texts
+    assert "好，还是哗哗流走了。”［８］" in texts
+
+
+def test_cjk_paragraphs_split_on_wrap_and_indent():
+    # 两端对齐的正文：排满的行右端对齐；段落末行短；新段落首行缩进两个字
+    lines = [
+        _line("学生带着已有的概念走进课堂。这些概念往", 64.0, 100.0, 285.8),
+        _line("往是在日常生活经验中形成的，与科学概念", 64.0, 115.7, 285.8),
+        _line("存在很大差异。", 64.0, 131.4, 150.0),
+        _line("教师期望通过自己的精心讲授，学生能快速", 85.0, 147.1, 285.8),
+        _line("地记住这些信息。事实上，学生记忆的效果", 64.0, 162.8, 285.8),
+        _line("和记忆保留的时间都与期望相去甚远。", 64.0, 178.5, 260.0),
+        _line("２．３记忆保持时间有限", 61.4, 194.2, 173.2),
+    ]
+    blocks = [[line["text"][:4] for line in block] for block in group_blocks(lines)]
+    assert blocks == [["学生带着", "往是在日", "存在很大"], ["教师期望", "地记住这", "和记忆保"], ["２．３记"]]
+
+
+def test_cjk_list_items_stay_separate():
+    # 存论文 p2：行距与段间距相同，原来整节合成一块
+    lines = [
+        _line("◦ 实际使⽤的chunk多为：", 49.7, 318.3, 190.0, 16.6),
+        _line("▪ ⻚级", 68.5, 343.8, 100.0, 16.6),
+        _line("▪ 段落级", 68.5, 369.3, 112.0, 16.6),
+        _line("▪ 固定token⻓度切分", 68.5, 394.8, 190.0, 16.6),
+        _line("结果是：", 47.5, 420.3, 95.0),
+    ]
+    assert len(group_blocks(lines)) == len(lines)
+
+
+def test_latin_blocks_by_line_gap():
+    words = [
+        _word("The", 61.3, 100.0, 80.0), _word("first", 83.0, 100.0, 105.0),
+        _word("paragraph", 61.3, 112.0, 110.0), _word("continues.", 113.0, 112.0, 160.0),
+        _word("Second", 61.3, 160.0, 95.0), _word("block.", 98.0, 160.0, 125.0),
+    ]
+    items = group_words(words, "block")
+    assert [item["text"] for item in items] == ["The first\nparagraph continues.", "Second block."]
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main(["-q", __file__]))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+测试 parallel.run_jobs：超时的 job 得到 JobTimeout，卡住的进程池被终止，其余 job 在新进程池中照常完成；
+job 抛出的异常按位置返回，不影响其它 job。job 用内置函数，worker 进程不需要导入测试模块。
+
+    python -m pytest -q test_parallel.py
+"""
+
+import os
+import sys
+import time
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engines.parallel import JobTimeout, run_jobs, split_pages
+
+
+def test_timeout_restarts_pool_and_finishes_other_jobs():
+    jobs = [(0,), (60,), (0,), (0,)]
+    start = time.perf_counter()
+    results = run_jobs(time.sleep, jobs, workers=2, timeouts=[30, 1, 30, 30])
+    assert time.perf_counter() - start < 30
+    assert isinstance(results[1], JobTimeout)
+    assert results[:1] + results[2:] == [None, None, None]
+
+
+def test_errors_are_returned_in_place():
+    results = run_jobs(int, [("3",), ("x",), ("5",)], workers=1)
+    assert results[0] == 3 and results[2] == 5
+    assert isinstance(results[1], ValueError)
+
+
+def test_split_pages_keeps_order_and_min_chunk():
+    chunks = split_pages(range(1, 11), workers=4)
+    assert [page for chunk in chunks for page in chunk] == list(range(1, 11))
+    assert all(len(chunk) >= 4 for chunk in chunks[:-1])
+    assert split_pages([], workers=4) == []
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main(["-q", __file__]))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+测试 table_screen 的候选区域：三线表 (只有等宽横线) 在标题词附近时由 rules_regions 交给 text 策略搜索，
+没有标题词的横线 (页眉线等) 和 grid 网格不重复搜索。坐标仿照 xia2007 p10 的回归系数表。
+
+    python -m pytest -q test_table_screen.py
+"""
+
+import os
+import sys
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engines.table_screen import CLIP_MARGIN, rules_regions, screen_page, search_clip
+
+PAGE = (486.0, 720.0)
+
+# toprule / midrule / bottomrule
+BOOKTABS = [("h", 121.0, 548.0, 372.0, 548.0), ("h", 121.0, 562.0, 372.0, 562.0), ("h", 121.0, 630.0, 372.0, 630.0)]
+CAPTION = [(121.0, 530.0, 150.0, 540.0, "Table"), (153.0, 530.0, 160.0, 540.0, "3.")]
+ROW = [(121.0, 550.0, 160.0, 560.0, "Variables"), (200.0, 550.0, 215.0, 560.0, "DF")]
+
+
+def test_captioned_rules_are_searched_with_text_strategy():
+    candidates = screen_page(BOOKTABS, CAPTION + ROW, *PAGE)
+    assert [(c.kind, c.caption) for c in candidates] == [("rules", True)]
+    # lines 策略没有可搜索的网格
+    assert search_clip(candidates, *PAGE) == (False, None)
+    regions = rules_regions(candidates, *PAGE)
+    assert regions == [(121.0 - CLIP_MARGIN, 548.0 - CLIP_MARGIN, 372.0 + CLIP_MARGIN, 630.0 + CLIP_MARGIN)]
+
+
+def test_rules_without_caption_are_skipped():
+    candidates = screen_page(BOOKTABS, ROW, *PAGE)
+    assert [(c.kind, c.caption) for c in candidates] == [("rules", False)]
+    assert rules_regions(candidates, *PAGE) == []
+    # 没有文字时不标记标题词
+    assert rules_regions(screen_page(BOOKTABS, None, *PAGE), *PAGE) == []
+
+
+def test_rules_next_to_grid_are_not_searched_twice():
+    grid = [
+        ("h", 121.0, 100.0, 372.0, 100.0), ("h", 121.0, 200.0, 372.0, 200.0),
+        ("v", 121.0, 100.0, 121.0, 200.0), ("v", 372.0, 100.0, 372.0, 200.0),
+    ]
+    # 网格内部不碰竖线的两条横线会单独成为 "rules" 候选
+    inner = [("h", 126.0, 130.0, 367.0, 130.0), ("h", 126.0, 170.0, 367.0, 170.0)]
+    caption = [(121.0, 85.0, 150.0, 95.0, "Table")]
+    candidates = screen_page(grid + inner, caption, *PAGE)
+    assert sorted((c.kind, c.caption) for c in candidates) == [("grid", True), ("rules", True)]
+    assert search_clip(candidates, *PAGE)[0]
+    assert rules_regions(candidates, *PAGE) == []
+
+
+if __name__ == "__main__":
+    import pytest
+
+    sys.exit(pytest.main(["-q", __file__]))
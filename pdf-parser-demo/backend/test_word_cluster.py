@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+测试 word_cluster.extract_words 与 pdfplumber 的 page.extract_words() 输出完全一致：
+构造的边界情况 (空白、回退的 x0、竖排、连字、跨 upright 的段) 和语料库里中英文论文的真实页面。
+
+    python -m pytest -q test_word_cluster.py
+"""
+
+import glob
+import io
+import os
+import sys
+
+import fitz
+import pdfplumber
+import pytest
+from pdfplumber.utils.text import extract_words as plumber_extract_words
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engines.word_cluster import extract_words, page_words
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+
+def _char(text, x0, top, width=5.0, height=10.0, upright=True):
+    return {
+        "text": text, "x0": x0, "x1": x0 + width, "top": top, "bottom": top + height,
+        "doctop": top + 800.0, "upright": upright,
+    }
+
+
+def test_edge_cases_match_pdfplumber():
+    chars = [
+        # 空白结束一个词；间距 > x_tolerance 断词；x0 回退断词
+        _char("a", 10, 100), _char("b", 15, 100), _char(" ", 20, 100), _char("c", 25, 100),
+        _char("d", 40, 100), _char("e", 30, 100.5),
+        # 连字展开
+        _char("ﬁ", 60, 100), _char("n", 65, 100),
+        # y 在 tolerance 内仍是同一行，超出则换行
+        _char("f", 10, 102), _char("g", 10, 130), _char("h", 15, 131),
+        # 竖排 (upright=False) 的一段，按 top 方向成词
+        _char("v", 200, 10, upright=False), _char("w", 200, 16, upright=False), _char("x", 200, 40, upright=False),
+        # 回到横排：新的一段
+        _char("y", 10, 200), _char("", 15, 200), _char("z", 20, 200),
+    ]
+    assert extract_words(chars) == plumber_extract_words(chars)
+    assert extract_words(chars, x_tolerance=1, y_tolerance=1) == plumber_extract_words(chars, x_tolerance=1, y_tolerance=1)
+    assert extract_words([]) == []
+    assert extract_words([_char(" ", 10, 10)]) == []
+
+
+def _rotated_pdf():
+    doc = fitz.open()
+    page = doc.new_page(width=300, height=400)
+    page.insert_text((40, 40), "Horizontal words, fine print")
+    page.insert_text((100, 300), "Rotated label", rotate=90)
+    page.insert_text((40, 360), "after the rotated text")
+    return io.BytesIO(doc.tobytes())
+
+
+def test_rotated_text_matches_pdfplumber():
+    with pdfplumber.open(_rotated_pdf()) as pdf:
+        page = pdf.pages[0]
+        assert any(not c["upright"] for c in page.chars)
+        assert page_words(page, "numpy") == page_words(page, "pdfplumber")
+
+
+@pytest.mark.parametrize("name", ["xia2007.pdf", "zhong2021.pdf", "存论文.pdf", "传统大学物理*.pdf"])
+def test_corpus_pages_match_pdfplumber(name):
+    paths = glob.glob(os.path.join(CORPUS, "data", name)) + glob.glob(os.path.join(CORPUS, "01", name))
+    if not paths:
+        pytest.skip(f"{name} not in corpus")
+    with pdfplumber.open(paths[0]) as pdf:
+        for page in pdf.pages[:3]:
+            assert page_words(page, "numpy") == page_words(page, "pdfplumber"), page.page_number
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main(["-q", __file__]))
@@ -66,6 +66,10 @@ function App() {
     setNumPages(numPages)
   }
 
+  // 后端的几何信息 (每个上传文件只计算一次)：页数、显示尺寸、旋转
+  const geometry = result?.geometry
+  const totalPages = numPages || geometry?.page_count
+
   // 2. 新增：点击标记框，跳转到 JSON 对应位置
   const scrollToElement = (id) => {
     // 如果当前不在 JSON tab，先切换过去
@@ -264,8 +268,8 @@ function App() {
           <div className="pdf-section">
              <div className="pdf-controls">
                 <button onClick={() => setPageNumber(prev => Math.max(prev - 1, 1))} disabled={pageNumber <= 1}>Previous</button>
-                <span>Page {pageNumber} of {numPages}</span>
-                <button onClick={() => setPageNumber(prev => Math.min(prev + 1, numPages))} disabled={pageNumber >= numPages}>Next</button>
+                <span>Page {pageNumber} of {totalPages}</span>
+                <button onClick={() => setPageNumber(prev => Math.min(prev + 1, totalPages))} disabled={pageNumber >= totalPages}>Next</button>
                 
                 {/* 6. 新增：显隐控制按钮 */}
                 <div style={{ width: '20px' }}></div> {/* Spacer */}
@@ -339,7 +343,7 @@ function App() {
                   {result?.result?.pages?.map(p => p.elements.map(e => e.content).join('\n')).join('\n\n')}
               </ReactMarkdown>
             ) : (
-              <pre>{JSON.stringify(result?.result?.metadata || {}, null, 2)}</pre>
+              <pre>{JSON.stringify({ ...(result?.result?.metadata || {}), geometry }, null, 2)}</pre>
             )}
           </div>
         </div>